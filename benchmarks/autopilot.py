@@ -0,0 +1,78 @@
+#!/usr/bin/python
+
+"""
+Benchmark flying a ship with the autopilot against moving it one sector
+at a time, by the number of moves.
+
+Each flight starts in a new universe, so the sectors on the way are
+generated by it. Moving one sector at a time runs move() and state()
+for every sector, like a client sending a move command for each. The
+autopilot runs autopilot() once and state() once at the end.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'game'))
+
+from game import Game
+from world import World
+
+def new_game(data_dir, log):
+    world = World(data_dir = data_dir, log = log, storage = 'sqlite', seed = 0)
+    game = Game(world = world, log = log)
+    game.register('pilot', 'pilot')
+    game.join_game('Pilot')
+    return game
+
+def step(game, moves):
+    """Move east then north, half the moves each, one sector at a time."""
+    for i in xrange(moves):
+        game.move('e' if i < moves // 2 else 'n')
+        game.state()
+
+def autopilot(game, moves):
+    game.autopilot(moves // 2, moves - moves // 2)
+    game.state()
+
+def run(moves, repeat, log):
+    times = {}
+    for name, fly in [('step', step), ('autopilot', autopilot)]:
+        best = None
+        for i in xrange(repeat):
+            data_dir = tempfile.mkdtemp()
+            try:
+                game = new_game(data_dir, log)
+                start = time.time()
+                fly(game, moves)
+                elapsed = time.time() - start
+                best = elapsed if best is None else min(best, elapsed)
+                ship = game.location(of = game.logged_in_user)
+                assert (ship.location.x, ship.location.y) == (moves // 2, moves - moves // 2)
+            finally:
+                shutil.rmtree(data_dir)
+        times[name] = best
+    return times
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the autopilot against moving one sector at a time.')
+    parser.add_argument('--moves', default='10,50,100', help='Comma separated numbers of moves, default is 10,50,100')
+    parser.add_argument('-n','--repeat', type=int, default=3, help='Number of timings to take the best of, default is 3')
+    args = parser.parse_args()
+
+    log = logging.getLogger(os.path.basename(__file__))
+    log.setLevel(logging.ERROR)
+    print "%6s %10s %14s %10s" % ('moves', 'step ms', 'autopilot ms', 'speedup')
+    for moves in [int(size) for size in args.moves.split(',')]:
+        times = run(moves, args.repeat, log)
+        print "%6d %10.2f %14.2f %9.1fx" % (
+            moves,
+            times['step'] * 1e3,
+            times['autopilot'] * 1e3,
+            times['step'] / times['autopilot'],
+        )
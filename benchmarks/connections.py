@@ -0,0 +1,77 @@
+#!/usr/bin/python
+
+"""
+Benchmark connection churn against world size.
+
+Each connection creates a ServerGameAdapter, logs in, asks for the state
+and saves on disconnect, like handle() in server.py does. Connections
+share one World, so their cost should not grow with the world. For
+comparison, the old behaviour of loading a new world per connection is
+timed too.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'game'))
+
+from game import Game
+from objects.coordinates import Coordinates
+from server import ServerGameAdapter
+from world import World
+
+def connect(world, log):
+    game = ServerGameAdapter(world, log = log)
+    game.login({'name': 'benchmark', 'password': 'benchmark'})
+    game.response()
+    game.save()
+
+def run(sizes, connections, reloads):
+    log = logging.getLogger(os.path.basename(__file__))
+    log.setLevel(logging.ERROR)
+    data_dir = tempfile.mkdtemp()
+    results = []
+    try:
+        for size in sizes:
+            world = World(data_dir = data_dir, log = log, bigbang = True)
+            game = Game(world = world)
+            game.register('benchmark', 'benchmark')
+            game.join_game('Benchmark')
+            side = int(size ** 0.5) or 1
+            for x in range(side):
+                for y in range(side):
+                    game.sector(Coordinates(x, y, 0))
+            # Write everything to the snapshot, so the old behaviour is
+            # timed loading the snapshot rather than replaying the journal
+            game.snapshot()
+            Game._dirty = set()
+
+            start = time.time()
+            for i in range(connections):
+                connect(world, log)
+            shared_time = (time.time() - start) / connections
+
+            start = time.time()
+            for i in range(reloads):
+                connect(World(data_dir = data_dir, log = log), log)
+            reload_time = (time.time() - start) / reloads
+            results.append((size, shared_time, reload_time))
+    finally:
+        shutil.rmtree(data_dir)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark connection setup against world size.')
+    parser.add_argument('-s','--sizes', default='100,400,1600', help='Comma separated list of sector counts')
+    parser.add_argument('-n','--connections', type=int, default=100, help='Number of connections per size')
+    parser.add_argument('-r','--reloads', type=int, default=2, help='Number of connections per size that load their own world')
+    args = parser.parse_args()
+
+    print "%10s %20s %20s" % ('sectors', 'shared world (ms)', 'world per conn (ms)')
+    for size, shared_time, reload_time in run([int(s) for s in args.sizes.split(',')], args.connections, args.reloads):
+        print "%10d %20.2f %20.2f" % (size, shared_time * 1e3, reload_time * 1e3)
@@ -0,0 +1,69 @@
+#!/usr/bin/python
+
+"""
+Measure the memory and hashing cost of Coordinates and Commodity.
+
+A universe of N sectors is built as a dictionary keyed by Coordinates,
+with one port's worth of cargo (three Commodity objects) per sector.
+Memory is the growth of the resident set size while building it. Hashing
+is timed as the sector() probes that move() does: build the adjacent
+Coordinates and look it up.
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'game'))
+
+from objects.commodity import Ore, Organics, Equipment
+from objects.coordinates import Coordinates
+
+def rss():
+    """Return the resident set size of this process in bytes."""
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def run(sectors, probes):
+    side = int(sectors ** 0.5) or 1
+    gc.collect()
+    start = rss()
+    universe = {}
+    for x in xrange(side):
+        for y in xrange(side):
+            universe[Coordinates(x, y, 0)] = None
+    coordinates_memory = rss() - start
+
+    gc.collect()
+    start = rss()
+    cargo = [[Ore(count = 1), Organics(count = 1), Equipment(count = 1)] for i in xrange(side * side)]
+    cargo_memory = rss() - start
+
+    keys = random.sample(universe.keys(), min(probes, len(universe)))
+    start = time.time()
+    for coordinates in keys:
+        coordinates.adjacent('n') in universe
+    probe_time = (time.time() - start) / len(keys)
+
+    start = time.time()
+    for coordinates in keys:
+        hash(coordinates)
+    hash_time = (time.time() - start) / len(keys)
+
+    return side * side, coordinates_memory, cargo_memory, probe_time, hash_time
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure Coordinates and Commodity memory and hashing.')
+    parser.add_argument('-n','--sectors', type=int, default=1000000, help='Number of sectors')
+    parser.add_argument('-p','--probes', type=int, default=100000, help='Number of sector probes to time')
+    args = parser.parse_args()
+
+    sectors, coordinates_memory, cargo_memory, probe_time, hash_time = run(args.sectors, args.probes)
+    print "Sectors:                      %d" % sectors
+    print "Coordinates memory / sector:  %d bytes" % (coordinates_memory / sectors)
+    print "Port cargo memory / sector:   %d bytes" % (cargo_memory / sectors)
+    print "adjacent() + lookup:          %.2f us" % (probe_time * 1e6)
+    print "hash():                       %.3f us" % (hash_time * 1e6)
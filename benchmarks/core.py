@@ -0,0 +1,241 @@
+#!/usr/bin/python
+
+"""
+Benchmark the core Game operations in process against universe size.
+
+For each size a new universe is generated until it holds that many
+objects (sectors and everything in them), and kept in memory. Each
+operation is then timed several times (see measure()) and the best and
+median time per call are reported. Memory is reported as the resident
+size of the universe, and as the growth in resident size while an
+operation was timed, which should stay near zero.
+
+  contents      get_contents() of a random sector
+  state         state() for a player in a sector
+  docked        state() for a player docked at a port
+  find_by_id    find_by_id() of a random object
+  trade         buy or sell one unit at the port
+  save          save() after the player's ship changed
+  load          load_shared_object() for every shared object, from YAML
+                files with the whole universe in them
+  sector        generate a sector that was never visited
+
+The sizes go up to 1e5 objects by default, pass --sizes to go further:
+1e6 objects takes a few GB of memory and the load operation a long time.
+"""
+
+import argparse
+import gc
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'game'))
+
+from game import Game
+from objects.coordinates import Coordinates
+from world import World
+
+# sector is last since it makes the universe larger
+operations = ['contents', 'state', 'docked', 'find_by_id', 'trade', 'save', 'load', 'sector']
+
+def resident_size():
+    """Return the resident size of this process in bytes."""
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def objects(game):
+    """Return the number of objects in the universe."""
+    count = 0
+    for name in game.shared_objects:
+        for value in getattr(Game, '_' + name).itervalues():
+            count += len(value) if isinstance(value, list) else 1
+    return count
+
+def build_universe(game, size):
+    """
+    Generate sectors in a square spiral around (0,0,0) until there are
+    size objects, and return their coordinates.
+    """
+    coordinates = []
+    x = y = 0
+    dx, dy = 0, -1
+    while objects(game) < size:
+        # Count again only every block of sectors, counting is slow
+        for i in xrange(Game._generator.block_size ** 2):
+            location = Coordinates(x, y, 0)
+            game.sector(location)
+            coordinates.append(location)
+            if x == y or (x < 0 and x == -y) or (x > 0 and x == 1 - y):
+                dx, dy = -dy, dx
+            x, y = x + dx, y + dy
+    return coordinates
+
+def measure(operation, repeat, minimum_time = 0.2, limit = 100000, maximum_time = 30):
+    """
+    Time operation and return the best and median seconds per call.
+
+    The number of calls in each timing is doubled until they take at
+    least minimum_time (or limit calls), and the timing is repeated,
+    unless repeating would take more than maximum_time. The garbage
+    collector is off while timing, like timeit does.
+    """
+    number = 1
+    while True:
+        elapsed = timed(operation, number)
+        if elapsed >= minimum_time or number >= limit:
+            break
+        number *= 2
+    if elapsed * repeat > maximum_time:
+        repeat = 1
+    times = sorted([elapsed] + [timed(operation, number) for i in xrange(repeat - 1)])
+    return times[0] / number, times[len(times) // 2] / number
+
+def timed(operation, number):
+    gc.disable()
+    try:
+        start = time.time()
+        for i in xrange(number):
+            operation()
+        return time.time() - start
+    finally:
+        gc.enable()
+
+def setup_player(game):
+    """Fly the player to the nearest port and return it."""
+    ship = game.location(of = game.logged_in_user)
+    coordinates, ports = min(
+        Game._ports.iteritems(),
+        key = lambda (coordinates, ports): abs(coordinates.x) + abs(coordinates.y),
+    )
+    game.move(coordinates = coordinates)
+    return ship, ports[0]
+
+def run_size(task):
+    """
+    Time the operations in a new universe of a size, and return the
+    results.
+    """
+    size, selected, storage, repeat = task
+    random.seed(0)
+    log = logging.getLogger(os.path.basename(__file__))
+    log.setLevel(logging.ERROR)
+    data_dir = tempfile.mkdtemp()
+    try:
+        memory_before = resident_size()
+        world = World(data_dir = data_dir, log = log, storage = storage, seed = 1)
+        game = Game(world = world)
+        game.register('benchmark', 'benchmark')
+        game.join_game('Benchmark')
+        # Keep the whole universe in memory
+        Game.generated_block_limit = sys.maxint
+        coordinates = build_universe(game, size)
+        ship, port = setup_player(game)
+        ids = Game._index.keys()
+        universe = {
+            'size': size,
+            'objects': objects(game),
+            'sectors': len(Game._sectors),
+            'memory': resident_size() - memory_before,
+            'operations': {},
+        }
+
+        new_sectors = (Coordinates(x, 10 ** 6, 0) for x in xrange(sys.maxint))
+        items = [commodity.id for commodity in port.cargo]
+        calls = {
+            'sector': lambda: game.sector(next(new_sectors)),
+            'contents': lambda: game.get_contents(random.choice(coordinates)),
+            'state': game.state,
+            'docked': game.state,
+            'find_by_id': lambda: game.find_by_id(random.choice(ids)),
+            'trade': trade(game, items),
+            'save': lambda: (game.mark_dirty(ship), game.save()),
+            'load': load(game),
+        }
+        for operation in operations:
+            if operation not in selected:
+                continue
+            if operation == 'docked':
+                game.enter(port.id)
+            if operation == 'trade':
+                game.enter(port.id)
+                game.logged_in_user.credits = 10 ** 9
+            if operation == 'load':
+                if storage != 'yaml':
+                    continue
+                # Write the whole universe out, even what can be
+                # generated again, and time loading it back
+                game.save()
+                Game._pristine = set()
+                game.snapshot()
+            memory = resident_size()
+            best, median = measure(calls[operation], repeat, minimum_time = 0 if operation == 'load' else 0.2)
+            universe['operations'][operation] = (best, median, resident_size() - memory)
+            if operation in ['docked', 'trade']:
+                game.leave()
+        return universe
+    finally:
+        shutil.rmtree(data_dir)
+
+def run(sizes, selected, storage, repeat):
+    """
+    Time the operations for each size, each in its own process so the
+    memory of one universe is not counted in the next.
+    """
+    pool = multiprocessing.Pool(1, maxtasksperchild = 1)
+    try:
+        return pool.map(run_size, [(size, selected, storage, repeat) for size in sizes], chunksize = 1)
+    finally:
+        pool.close()
+        pool.join()
+
+def trade(game, items):
+    """Return an operation that buys or sells one unit at random."""
+    def operation():
+        item = random.choice(items)
+        if random.random() < 0.5:
+            game.trade(item = item, quantity = 1, buyer = 'current_user')
+        else:
+            game.trade(item = item, quantity = 1, seller = 'current_user')
+    return operation
+
+def load(game):
+    """Return an operation that loads every shared object again."""
+    def operation():
+        for name in game.shared_objects:
+            setattr(Game, '_' + name, {})
+        for name in game.shared_objects:
+            game.load_shared_object(name)
+    return operation
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark Game operations against universe size.')
+    parser.add_argument('-s','--sizes', default='100,1000,10000,100000', help='Comma separated list of object counts, default is 100,1000,10000,100000')
+    parser.add_argument('-o','--operations', default=','.join(operations), help='Comma separated operations to time, from %s' % ', '.join(operations))
+    parser.add_argument('--storage', default='yaml', choices=['yaml','sqlite'], help='Storage for save (load is only timed for yaml), default is yaml')
+    parser.add_argument('-r','--repeat', type=int, default=5, help='Number of timings of each operation, default is 5')
+    args = parser.parse_args()
+
+    logging.getLogger().addHandler(logging.NullHandler())
+    selected = args.operations.split(',')
+    for operation in selected:
+        if operation not in operations:
+            parser.error("Unknown operation '%s'" % operation)
+
+    results = run([int(float(s)) for s in args.sizes.split(',')], selected, args.storage, args.repeat)
+    for universe in results:
+        print "%s objects in %s sectors, %.1f MB" % (
+            universe['objects'],
+            universe['sectors'],
+            universe['memory'] / 1e6,
+        )
+        print "  %-12s %14s %14s %14s" % ('operation', 'best (us)', 'median (us)', 'memory (KB)')
+        for operation in operations:
+            if operation in universe['operations']:
+                best, median, memory = universe['operations'][operation]
+                print "  %-12s %14.1f %14.1f %14d" % (operation, best * 1e6, median * 1e6, memory / 1e3)
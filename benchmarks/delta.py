@@ -0,0 +1,82 @@
+#!/usr/bin/python
+
+"""
+Compare full and delta responses for a player in a busy sector.
+
+A busy sector is filled with ports and ships, then one other ship moves
+through it between responses. The full response is what the server sends
+without delta mode, the delta is what it sends with it.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'game'))
+
+from game import Game
+from objects.coordinates import Coordinates
+from objects.port import Port
+from objects.ship import Ship
+from protocol import diff, patch
+
+def response(game):
+    state, commands = game.state()
+    return {'state': state, 'commands': commands}
+
+def run(ports, ships, repeat):
+    log = logging.getLogger(os.path.basename(__file__))
+    log.setLevel(logging.ERROR)
+    data_dir = tempfile.mkdtemp()
+    try:
+        game = Game(data_dir = data_dir, log = log)
+        game.register('benchmark', 'benchmark')
+        game.join_game('Benchmark')
+        origin = Coordinates(0,0,0)
+        for i in range(ports):
+            port = Port()
+            port.location = origin
+            game.place(port, origin)
+        for i in range(ships):
+            ship = Ship()
+            ship.location = origin
+            game.place(ship, origin)
+
+        # Another ship arrives between two responses
+        old = response(game)
+        visitor = Ship(name = 'Visitor')
+        visitor.location = origin
+        game.place(visitor, origin)
+        new = response(game)
+        delta = {'delta': diff(old, new) or {}}
+        assert patch(json.loads(json.dumps(old)), delta['delta']) == json.loads(json.dumps(new))
+
+        results = {}
+        for name, data in [('full', new), ('delta', delta)]:
+            encoded = json.dumps(data)
+            encode_time = min(timeit.repeat(lambda: json.dumps(data), repeat = 3, number = repeat)) / repeat
+            decode_time = min(timeit.repeat(lambda: json.loads(encoded), repeat = 3, number = repeat)) / repeat
+            results[name] = (len(encoded), encode_time, decode_time)
+        diff_time = min(timeit.repeat(lambda: diff(old, new), repeat = 3, number = repeat)) / repeat
+        return results, diff_time
+    finally:
+        shutil.rmtree(data_dir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare full and delta state responses.')
+    parser.add_argument('-p','--ports', type=int, default=50, help='Number of ports in the sector')
+    parser.add_argument('-s','--ships', type=int, default=200, help='Number of ships in the sector')
+    parser.add_argument('-n','--repeat', type=int, default=100, help='Number of encodes to time')
+    args = parser.parse_args()
+
+    results, diff_time = run(args.ports, args.ships, args.repeat)
+    print "%8s %10s %12s %12s" % ('response', 'bytes', 'encode (us)', 'decode (us)')
+    for name in ['full', 'delta']:
+        size, encode_time, decode_time = results[name]
+        print "%8s %10d %12.1f %12.1f" % (name, size, encode_time * 1e6, decode_time * 1e6)
+    print "Server side diff() time: %.1f us" % (diff_time * 1e6)
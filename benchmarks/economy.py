@@ -0,0 +1,78 @@
+#!/usr/bin/python
+
+"""
+Benchmark restocking and pricing every port against the number of ports.
+
+The ports are put in an Economy (see economy.py) and half of their
+stock is bought, then restock() and prices() are timed over all of
+them, next to the same work done one item at a time in Python (the
+per-item restock formula, and GameObject.get_price() for every item).
+"""
+
+import argparse
+import os
+import sys
+import time
+import timeit
+import math
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'game'))
+
+from economy import Economy
+from objects.port import Port
+
+def build(ports):
+    economy = Economy()
+    port_list = [Port(id = str(i)) for i in xrange(ports)]
+    economy.add(port_list)
+    for port in port_list:
+        for item in port.cargo:
+            item.count = item.count // 2
+    return economy, port_list
+
+def restock_items(port_list, now, restocked_at):
+    """Restock one item at a time, like Economy.restock()."""
+    changed = 0
+    for port in port_list:
+        for item in port.cargo:
+            target = port._equilibrium[item.id]
+            gap = target - item.count
+            remaining = int(round(gap * math.exp(-Port.restock_rate * (now - restocked_at))))
+            if remaining != gap:
+                changed += 1
+    return changed
+
+def price_items(port_list):
+    for port in port_list:
+        for item in port.cargo:
+            port.get_price(item.id)
+
+def run(ports, repeat):
+    economy, port_list = build(ports)
+    now = time.time()
+    # Far enough apart that every item changes, but only timing the
+    # first restock since the counts then stay put
+    times = {
+        'restock': min(timeit.repeat(lambda: economy.restock(now + 60), repeat = repeat, number = 1)),
+        'restock_items': min(timeit.repeat(lambda: restock_items(port_list, now + 60, now), repeat = repeat, number = 1)),
+        'prices': min(timeit.repeat(economy.prices, repeat = repeat, number = 1)),
+        'prices_items': min(timeit.repeat(lambda: price_items(port_list), repeat = repeat, number = 1)),
+    }
+    return times
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark restocking and pricing every port.')
+    parser.add_argument('--ports', default='1000,10000,100000', help='Comma separated numbers of ports, default is 1000,10000,100000')
+    parser.add_argument('-n','--repeat', type=int, default=5, help='Number of timings to take the best of, default is 5')
+    args = parser.parse_args()
+
+    print "%8s %12s %12s %12s %12s" % ('ports', 'restock ms', 'per item ms', 'prices ms', 'per item ms')
+    for ports in [int(float(size)) for size in args.ports.split(',')]:
+        times = run(ports, args.repeat)
+        print "%8d %12.2f %12.2f %12.2f %12.2f" % (
+            ports,
+            times['restock'] * 1e3,
+            times['restock_items'] * 1e3,
+            times['prices'] * 1e3,
+            times['prices_items'] * 1e3,
+        )
@@ -0,0 +1,251 @@
+#!/usr/bin/python
+
+"""
+Generate load on a server with many bots and measure how it keeps up.
+
+Each connection is a bot (game/bot.py) that logs in, registering and
+joining the game first if needed, and then runs one of the workloads
+until the time is up:
+
+  walk   move in random directions
+  trade  walk until there is a port, dock, then buy and sell at random
+  idle   ask for the state every --poll-interval seconds
+
+Workloads are given to the connections in turn. Only the commands sent
+by the workloads are timed, not logging in. The commands per second and
+the p50/p95/p99 latency are printed, overall and per command, and can be
+saved as JSON with --output to compare between versions.
+
+With --start-server a server is started on a new world in a temporary
+directory, otherwise the server at --host and --port is used.
+"""
+
+import gevent.monkey
+gevent.monkey.patch_all()
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+game_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'game')
+sys.path.insert(0, game_dir)
+
+import gevent
+from bot import Bot
+
+workloads = ['walk', 'trade', 'idle']
+
+def percentile(ordered, fraction):
+    """Return the value at fraction of a sorted list, by nearest rank."""
+    if not ordered:
+        return None
+    index = max(0, int(round(fraction * len(ordered) + 0.5)) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+def summary(latencies, elapsed):
+    ordered = sorted(latencies)
+    return {
+        'commands': len(ordered),
+        'commands_per_second': len(ordered) / elapsed if elapsed else None,
+        'mean_ms': sum(ordered) / len(ordered) * 1e3 if ordered else None,
+        'p50_ms': percentile(ordered, 0.50) * 1e3 if ordered else None,
+        'p95_ms': percentile(ordered, 0.95) * 1e3 if ordered else None,
+        'p99_ms': percentile(ordered, 0.99) * 1e3 if ordered else None,
+        'max_ms': ordered[-1] * 1e3 if ordered else None,
+    }
+
+def next_command(bot, workload):
+    """Return the next command and parameters for a bot."""
+    commands = bot.commands
+    if workload == 'idle':
+        return 'state', {}
+    if workload == 'walk' or 'dock' not in commands and 'buy' not in commands:
+        if 'undock' in commands:
+            return 'undock', {}
+        return 'move', {'direction': random.choice(commands['move']['direction'])}
+    if 'dock' in commands:
+        return 'dock', {'id': random.choice(commands['dock']['id'])}
+    command = random.choice(['buy', 'sell'])
+    if not commands[command]['item']:
+        command = 'buy' if command == 'sell' else 'sell'
+    return command, {
+        'item': random.choice(commands[command]['item']),
+        'quantity': random.randint(1, 5),
+    }
+
+def run_bot(settings, number, start, deadline, latencies, errors):
+    workload = settings['workloads'][number % len(settings['workloads'])]
+    bot = Bot(
+        settings['host'],
+        settings['port'],
+        delta = settings['delta'],
+        encoding = settings['encoding'],
+        compress = settings['compress'],
+        events = settings['events'],
+    )
+    try:
+        bot.connect()
+        name = "%s%s" % (settings['name'], number)
+        bot.start(name, name)
+        gevent.sleep(max(0, start - time.time()))
+        while time.time() < deadline:
+            command, parameters = next_command(bot, workload)
+            sent = time.time()
+            bot.send(command, parameters)
+            latencies.setdefault(command, []).append(time.time() - sent)
+            if workload == 'idle':
+                gevent.sleep(settings['poll_interval'])
+            elif settings['think_time']:
+                gevent.sleep(settings['think_time'])
+    except (IOError, ValueError, KeyError), e:
+        errors.append("%s: %s" % (number, str(e)))
+    finally:
+        bot.close()
+
+def run_process(settings, numbers, start, deadline, results):
+    """Run bots in greenlets and put their latencies in results."""
+    latencies = {}
+    errors = []
+    greenlets = [gevent.spawn(run_bot, settings, number, start, deadline, latencies, errors) for number in numbers]
+    gevent.joinall(greenlets)
+    results.put((latencies, errors))
+
+def wait_for_port(host, port, timeout = 30):
+    start = time.time()
+    while time.time() - start < timeout:
+        try:
+            socket.create_connection((host, port)).close()
+            return
+        except socket.error:
+            time.sleep(0.1)
+    raise RuntimeError("Nothing is listening on %s:%s" % (host, port))
+
+def version():
+    """Return the git commit of the game, if there is one."""
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd = game_dir).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(settings):
+    server = None
+    data_dir = None
+    if settings['start_server']:
+        data_dir = tempfile.mkdtemp()
+        server = subprocess.Popen(
+            [
+                sys.executable, 'server.py', 'run', '--port', str(settings['port']),
+                '--data-dir', data_dir, '--storage', settings['storage'], '--seed', '1',
+                '--log-file', os.path.join(data_dir, 'server.log'),
+            ],
+            cwd = game_dir, stdout = open(os.devnull, 'w'), stderr = subprocess.STDOUT,
+        )
+    try:
+        wait_for_port(settings['host'], settings['port'])
+        # Bots log in before the clock starts
+        start = time.time() + settings['login_time']
+        deadline = start + settings['seconds']
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target = run_process, args = (
+                settings,
+                range(process, settings['connections'], settings['processes']),
+                start,
+                deadline,
+                results,
+            ))
+            for process in xrange(settings['processes'])
+        ]
+        for process in processes:
+            process.start()
+        latencies = {}
+        errors = []
+        for process in processes:
+            process_latencies, process_errors = results.get()
+            for command, times in process_latencies.iteritems():
+                latencies.setdefault(command, []).extend(times)
+            errors += process_errors
+        for process in processes:
+            process.join()
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+            shutil.rmtree(data_dir)
+
+    elapsed = settings['seconds']
+    return {
+        'version': version(),
+        'label': settings['label'],
+        'time': datetime.datetime.now().isoformat(),
+        'settings': settings,
+        'elapsed': elapsed,
+        'errors': errors,
+        'total': summary([t for times in latencies.itervalues() for t in times], elapsed),
+        'commands': dict(
+            (command, summary(times, elapsed))
+            for command, times in latencies.iteritems()
+        ),
+    }
+
+def report(result):
+    print "%s connections (%s) for %s seconds" % (
+        result['settings']['connections'],
+        ','.join(result['settings']['workloads']),
+        result['elapsed'],
+    )
+    print "%-10s %10s %10s %10s %10s %10s %10s" % ('command', 'count', 'per sec', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms')
+    rows = sorted(result['commands'].items()) + [('total', result['total'])]
+    for command, stats in rows:
+        if stats['commands']:
+            print "%-10s %10d %10.1f %10.2f %10.2f %10.2f %10.2f" % (
+                command, stats['commands'], stats['commands_per_second'],
+                stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['max_ms'],
+            )
+    if result['errors']:
+        print "%s connections failed, like %s" % (len(result['errors']), result['errors'][0])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate load on a server with bots and measure latency and throughput.')
+    parser.add_argument('-H','--host', default='localhost', help='Server to connect to, default is localhost')
+    parser.add_argument('-P','--port', type=int, default=10344, help='Port of the server, default is 10344')
+    parser.add_argument('-n','--connections', type=int, default=50, help='Number of bots, default is 50')
+    parser.add_argument('-s','--seconds', type=float, default=30, help='Seconds to run the workloads, default is 30')
+    parser.add_argument('-w','--workloads', default='walk,trade,idle', help='Comma separated workloads given to the bots in turn, from %s' % ', '.join(workloads))
+    parser.add_argument('--delta', action='store_true', help='Ask the server to only send changes to the state')
+    parser.add_argument('--encoding', default='json', choices=['json','msgpack'], help='Encoding of the messages, default is json')
+    parser.add_argument('--compress', type=int, default=None, help='With msgpack, compress messages of this many bytes or more')
+    parser.add_argument('--events', action='store_true', help='Ask the server to push the events of each bot\'s sector')
+    parser.add_argument('--think-time', type=float, default=0, help='Seconds each walk or trade bot waits between commands, default is 0')
+    parser.add_argument('--poll-interval', type=float, default=1, help='Seconds each idle bot waits between state requests, default is 1')
+    parser.add_argument('--login-time', type=float, default=5, help='Seconds bots are given to log in before the workloads are timed, default is 5')
+    parser.add_argument('--processes', type=int, default=1, help='Number of processes to run the bots in, default is 1')
+    parser.add_argument('--name', default='bot', help='Bots are named this followed by a number, default is bot')
+    parser.add_argument('--label', default=None, help='Label saved with the results')
+    parser.add_argument('--start-server', action='store_true', help='Start a server with a new world on --port instead of using a running one')
+    parser.add_argument('--storage', default='sqlite', choices=['yaml','sqlite'], help='Storage for a server started with --start-server, default is sqlite')
+    parser.add_argument('-o','--output', default=None, help='Save the results to this JSON file')
+    args = parser.parse_args()
+
+    settings = vars(args).copy()
+    settings['workloads'] = args.workloads.split(',')
+    for workload in settings['workloads']:
+        if workload not in workloads:
+            parser.error("Unknown workload '%s'" % workload)
+    del settings['output']
+
+    random.seed(0)
+    result = run(settings)
+    report(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent = 2, sort_keys = True)
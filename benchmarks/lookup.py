@@ -0,0 +1,70 @@
+#!/usr/bin/python
+
+"""
+Benchmark Game.find_by_id() and Game.location() as the universe grows.
+
+Both lookups go through the id index, so the time per lookup should stay
+flat no matter how many sectors have been generated.
+"""
+
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'game'))
+
+from game import Game
+from objects.coordinates import Coordinates
+from world import World
+
+def build_universe(game, sectors):
+    """Generate a square block of sectors and return the ids found in it."""
+    side = int(sectors ** 0.5) or 1
+    for x in range(side):
+        for y in range(side):
+            game.sector(Coordinates(x, y, 0))
+    return Game._index.keys()
+
+def run(sizes, lookups):
+    log = logging.getLogger(os.path.basename(__file__))
+    log.setLevel(logging.ERROR)
+    data_dir = tempfile.mkdtemp()
+    results = []
+    try:
+        for size in sizes:
+            # Start every size with an empty universe
+            game = Game(world = World(data_dir = data_dir, log = log, bigbang = True))
+            game.register('benchmark', 'benchmark')
+            game.join_game('Benchmark')
+            ids = build_universe(game, size)
+            sample = [random.choice(ids) for i in range(lookups)]
+
+            find_time = min(timeit.repeat(
+                lambda: [game.find_by_id(id) for id in sample],
+                repeat = 3,
+                number = 1,
+            )) / lookups
+            location_time = min(timeit.repeat(
+                lambda: game.location(of = game.logged_in_user),
+                repeat = 3,
+                number = lookups,
+            )) / lookups
+            results.append((size, len(ids), find_time, location_time))
+    finally:
+        shutil.rmtree(data_dir)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark id lookups against universe size.')
+    parser.add_argument('-s','--sizes', default='100,1000,10000', help='Comma separated list of sector counts')
+    parser.add_argument('-n','--lookups', type=int, default=10000, help='Number of lookups per size')
+    args = parser.parse_args()
+
+    print "%10s %10s %16s %16s" % ('sectors', 'objects', 'find_by_id (us)', 'location (us)')
+    for size, objects, find_time, location_time in run([int(s) for s in args.sizes.split(',')], args.lookups):
+        print "%10d %10d %16.2f %16.2f" % (size, objects, find_time * 1e6, location_time * 1e6)
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+
+"""
+Benchmark the market queries against the number of ports.
+
+One port is put in each sector of a square around (0,0,0), in an
+Economy (see economy.py) so their prices are in its market index. The
+best price for an item near a random sector is then found with the
+index, and by scanning the ports like a query without it would: all of
+them, or the sectors within the radius (with SpatialIndex.within()).
+Updating the index after a trade and finding the best trade route are
+timed too.
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'game'))
+
+from economy import Economy
+from objects.coordinates import Coordinates
+from objects.port import Port
+from spatial import SpatialIndex
+
+def build(ports):
+    side = int(math.ceil(math.sqrt(ports)))
+    economy = Economy()
+    spatial = SpatialIndex()
+    port_list = []
+    for i in xrange(ports):
+        coordinates = Coordinates(i % side - side // 2, i // side - side // 2, 0)
+        port = Port(id = str(i), location = coordinates)
+        spatial.set(coordinates, 'ports', [port])
+        port_list.append(port)
+    economy.add(port_list)
+    return economy, spatial, port_list, side
+
+def best_scan(ports, item_id, coordinates, radius):
+    """Find the port buying an item for the most, looking at every port."""
+    best = None
+    for port in ports:
+        if (
+            abs(port.location.x - coordinates.x) +
+            abs(port.location.y - coordinates.y) +
+            abs(port.location.z - coordinates.z)
+        ) > radius:
+            continue
+        price = port.get_price(item_id)
+        if price and (best is None or price['buying'] > best[0]):
+            best = (price['buying'], port)
+    return best
+
+def best_within(spatial, item_id, coordinates, radius):
+    """Find the port buying an item for the most in the sectors within radius."""
+    best = None
+    for location, port in spatial.within(coordinates, radius, 'ports'):
+        price = port.get_price(item_id)
+        if price and (best is None or price['buying'] > best[0]):
+            best = (price['buying'], port)
+    return best
+
+def run(ports, radius, repeat, number):
+    economy, spatial, port_list, side = build(ports)
+    market = economy.market
+    random.seed(0)
+    points = [Coordinates(random.randint(-side // 2, side // 2), random.randint(-side // 2, side // 2), 0) for i in xrange(number)]
+    traded = [random.choice(port_list).cargo[0] for i in xrange(number)]
+
+    def query():
+        for coordinates in points:
+            market.best('ore', 'buying', coordinates, radius)
+
+    def scan():
+        for coordinates in points[:max(1, number // 100)]:
+            best_scan(port_list, 'ore', coordinates, radius)
+
+    def within():
+        for coordinates in points:
+            best_within(spatial, 'ore', coordinates, radius)
+
+    def trade():
+        for item in traded:
+            item.count = item.count ^ 1
+
+    def route():
+        for coordinates in points:
+            market.route(economy.commodities, coordinates, radius)
+
+    def best(function, calls = number):
+        return min(timeit.repeat(function, repeat = repeat, number = 1)) / calls
+
+    return {
+        'query': best(query),
+        'scan': best(scan, max(1, number // 100)),
+        'within': best(within),
+        'trade': best(trade),
+        'route': best(route),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the market queries against the number of ports.')
+    parser.add_argument('--ports', default='1000,10000,100000', help='Comma separated numbers of ports, default is 1000,10000,100000')
+    parser.add_argument('-r','--radius', type=int, default=10, help='Radius of the queries in moves, default is 10')
+    parser.add_argument('-n','--repeat', type=int, default=5, help='Number of timings to take the best of, default is 5')
+    parser.add_argument('--number', type=int, default=1000, help='Queries (and trades) per timing, default is 1000')
+    args = parser.parse_args()
+
+    print "%8s %10s %10s %10s %12s %10s" % ('ports', 'query us', 'scan us', 'within us', 'update us', 'route us')
+    for ports in [int(float(size)) for size in args.ports.split(',')]:
+        times = run(ports, args.radius, args.repeat, args.number)
+        print "%8d %10.1f %10.1f %10.1f %12.1f %10.1f" % (
+            ports,
+            times['query'] * 1e6,
+            times['scan'] * 1e6,
+            times['within'] * 1e6,
+            times['trade'] * 1e6,
+            times['route'] * 1e6,
+        )
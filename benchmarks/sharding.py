@@ -0,0 +1,198 @@
+#!/usr/bin/python
+
+"""
+Load test a sharded world with an increasing number of shards.
+
+For each number of shards, the shards (server.py --shards) and a router
+are started on local ports with a new world. Each client process
+registers, flies to its own region, and then moves back and forth inside
+it as fast as the server answers. The total commands per second are
+reported for each number of shards, so the speedup can be compared to
+the number of cores.
+
+Before the clients start, a bot in delta mode flies across several
+regions in one batch, to check that batches handed off between shards
+run every command once and that the client can follow the state. Then
+the events pushed to a bot in msgpack mode are checked to come through
+the router as events.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+game_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'game')
+sys.path.insert(0, game_dir)
+
+from bot import Bot
+from objects.coordinates import Coordinates
+from shard import ShardMap
+
+def wait_for_port(port, timeout = 30):
+    start = time.time()
+    while time.time() - start < timeout:
+        try:
+            socket.create_connection(('localhost', port)).close()
+            return
+        except socket.error:
+            time.sleep(0.1)
+    raise RuntimeError("Nothing is listening on port %s" % port)
+
+def start_world(shards, region_size, data_dir, router_port, shard_port, processes):
+    """
+    Start the shards and the router, adding their processes to a list as
+    they start so they can be stopped if the rest fail.
+
+    Clients connect to router_port. With one shard, that is the port of
+    a single server without a router in front of it.
+    """
+    for shard in xrange(shards):
+        command = [
+            sys.executable, 'server.py', 'run',
+            '--shards', str(shards), '--shard', str(shard),
+            '--region-size', str(region_size),
+            '--port', str(router_port), '--shard-port', str(shard_port),
+            '--storage', 'sqlite', '--data-dir', data_dir, '--seed', '1',
+            '--log-file', os.path.join(data_dir, 'shard-%s.log' % shard),
+        ]
+        if shards == 1:
+            # A single server, without the router in front of it
+            command = command[:3] + command[7:]
+        processes.append(subprocess.Popen(command, cwd = game_dir, stdout = open(os.devnull, 'w'), stderr = subprocess.STDOUT))
+        # The first server creates the data directory and the store
+        wait_for_port(router_port if shards == 1 else shard_port + shard)
+    if shards > 1:
+        processes.append(subprocess.Popen(
+            [sys.executable, 'router.py', '-p', str(router_port), '--shard-port', str(shard_port)],
+            cwd = game_dir, stdout = open(os.devnull, 'w'), stderr = subprocess.STDOUT,
+        ))
+        wait_for_port(router_port)
+
+def destination(number, shards, region_size):
+    """
+    Return the x coordinate of a region east of (0,0,0) owned by shard
+    number % shards, for client number.
+    """
+    shard_map = ShardMap(shards, region_size)
+    wanted = number % shards
+    seen = 0
+    for region in xrange(1, 1000):
+        x = region * region_size
+        if shard_map.owner(Coordinates(x, 0, 0)) == wanted and shard_map.owner(Coordinates(x, 1, 0)) == wanted:
+            if seen == number // shards:
+                return x
+            seen += 1
+
+def check_batch(port, region_size):
+    """
+    Fly a bot in delta mode east across three regions in one batch, and
+    check it arrived with a result for every command.
+    """
+    bot = Bot(port = port, delta = True)
+    bot.connect()
+    try:
+        bot.start('checker', 'checker')
+        # A batch is limited to 100 commands
+        moves = min(3 * region_size, 99)
+        results = bot.batch([('move', {'direction': 'e'})] * moves + [('state', {})])
+        assert len(results) == moves + 1, "Batch returned %s results for %s commands" % (len(results), moves + 1)
+        assert bot.state['sector']['coordinates']['x'] == moves, "Batch ended at %s" % bot.state['sector']['coordinates']
+    finally:
+        bot.close()
+
+def check_events(port):
+    """
+    Check that a bot in msgpack mode watching the spawn sector is sent
+    events when another bot flies out of it and back.
+    """
+    watcher = Bot(port = port, encoding = 'msgpack', events = True)
+    flier = Bot(port = port, encoding = 'msgpack', events = True)
+    try:
+        for bot, name in [(watcher, 'watcher'), (flier, 'flier')]:
+            bot.connect()
+            # An event taken for a response leaves the bot waiting for
+            # one that never comes
+            bot.connection.settimeout(10)
+            bot.start(name, name)
+        flier.send('move', {'direction': 'e'})
+        flier.send('move', {'direction': 'w'})
+        # Events are pushed after the responses, give them time to arrive
+        time.sleep(0.5)
+        watcher.send('state')
+        received = [(event['type'], event['heading']) for event in watcher.received]
+        assert ('left', 'ships') in received and ('entered', 'ships') in received, "Watcher received %s" % received
+    finally:
+        watcher.close()
+        flier.close()
+
+def client(number, port, x, seconds, results):
+    connection = socket.create_connection(('localhost', port))
+    fileobj = connection.makefile()
+
+    def send(command, parameters):
+        fileobj.write(json.dumps({command: parameters}) + "\n")
+        fileobj.flush()
+        return fileobj.readline()
+
+    name = 'client%s' % number
+    send('register', {'name': name, 'password': name})
+    send('join_game', {'ship_name': name})
+    for i in xrange(x):
+        send('move', {'direction': 'e'})
+
+    commands = 0
+    start = time.time()
+    while time.time() - start < seconds:
+        send('move', {'direction': 'n' if commands % 2 == 0 else 's'})
+        commands += 1
+    results.put(commands / (time.time() - start))
+    connection.close()
+
+def run(shard_counts, clients, seconds, region_size, router_port, shard_port):
+    print "CPUs: %s, clients: %s, %s seconds each" % (multiprocessing.cpu_count(), clients, seconds)
+    baseline = None
+    for shards in shard_counts:
+        data_dir = tempfile.mkdtemp()
+        processes = []
+        try:
+            start_world(shards, region_size, data_dir, router_port, shard_port, processes)
+            check_batch(router_port, region_size)
+            check_events(router_port)
+            results = multiprocessing.Queue()
+            workers = [
+                multiprocessing.Process(target = client, args = (
+                    number, router_port, destination(number, shards, region_size), seconds, results,
+                ))
+                for number in xrange(clients)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            throughput = sum(results.get() for worker in workers)
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+            shutil.rmtree(data_dir)
+        baseline = baseline or throughput
+        print "%s shard(s): %.0f commands/s (%.2fx)" % (shards, throughput, throughput / baseline)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test a sharded world.')
+    parser.add_argument('--shards', default='1,2,4', help='Comma separated numbers of shards to test, default is 1,2,4')
+    parser.add_argument('--clients', type=int, default=8, help='Number of client processes, default is 8')
+    parser.add_argument('--seconds', type=float, default=10, help='Seconds to measure each number of shards, default is 10')
+    parser.add_argument('--region-size', type=int, default=32, help='Size of the regions split between shards, default is 32')
+    parser.add_argument('--router-port', type=int, default=10400, help='Port for the router, or the server when there is one shard, default is 10400')
+    parser.add_argument('--shard-port', type=int, default=10345, help='Port of shard 0, default is 10345')
+    args = parser.parse_args()
+
+    run([int(shards) for shards in args.shards.split(',')], args.clients, args.seconds, args.region_size, args.router_port, args.shard_port)
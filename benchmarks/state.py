@@ -0,0 +1,63 @@
+#!/usr/bin/python
+
+"""
+Benchmark Game.state() at INFO level for a player in a sector and docked
+at a port.
+
+Logging goes to a NullHandler, so the time measured is what the game
+spends preparing log messages that are never written.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'game'))
+
+from game import Game
+from objects.coordinates import Coordinates
+from objects.port import Port
+from objects.ship import Ship
+
+def run(ports, ships, repeat, level = logging.INFO):
+    logging.getLogger().addHandler(logging.NullHandler())
+    logging.getLogger().setLevel(level)
+    log = logging.getLogger(os.path.basename(__file__))
+    data_dir = tempfile.mkdtemp()
+    try:
+        game = Game(data_dir = data_dir, log = log)
+        game.register('benchmark', 'benchmark')
+        game.join_game('Benchmark')
+        origin = Coordinates(0,0,0)
+        for i in range(ports):
+            port = Port()
+            port.location = origin
+            game.place(port, origin)
+        for i in range(ships):
+            ship = Ship()
+            ship.location = origin
+            game.place(ship, origin)
+
+        results = {}
+        results['sector'] = min(timeit.repeat(game.state, repeat = 3, number = repeat)) / repeat
+        game.enter(Game._ports[origin][0].id)
+        results['docked'] = min(timeit.repeat(game.state, repeat = 3, number = repeat)) / repeat
+        return results
+    finally:
+        shutil.rmtree(data_dir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark Game.state() at INFO level.')
+    parser.add_argument('-p','--ports', type=int, default=10, help='Number of ports in the sector')
+    parser.add_argument('-s','--ships', type=int, default=50, help='Number of ships in the sector')
+    parser.add_argument('-n','--repeat', type=int, default=200, help='Number of state() calls to time')
+    args = parser.parse_args()
+
+    results = run(args.ports, args.ships, args.repeat)
+    print "%8s %12s" % ('player', 'state (us)')
+    for name in ['sector', 'docked']:
+        print "%8s %12.1f" % (name, results[name] * 1e6)
@@ -0,0 +1,120 @@
+#!/usr/bin/python
+
+"""
+Benchmark the world ticks against the number of active sectors.
+
+A ship is put in each of the first sectors with ports, so they are all
+active, and their ports are emptied so every tick restocks them. While
+the ticks run, a probe greenlet sleeps for a millisecond at a time and
+records how late it wakes up, which is how long a tick holds up the
+connections of a server.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import gevent
+from gevent.lock import RLock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'game'))
+
+from game import Game
+from metrics import Metrics
+from objects.coordinates import Coordinates
+from objects.ship import Ship
+from ticker import Ticker
+from world import World
+
+def build_universe(game, sectors):
+    """
+    Generate sectors along the x axis until sectors of them have ports,
+    put a ship in each of those and return their coordinates.
+    """
+    active = []
+    x = 0
+    while len(active) < sectors:
+        coordinates = Coordinates(x, 0, 0)
+        game.sector(coordinates)
+        if Game._ports.get(coordinates):
+            ship = Ship()
+            ship.location = coordinates
+            game.place(ship, coordinates)
+            active.append(coordinates)
+        x += 1
+    return active
+
+def probe(latencies, interval = 0.001):
+    while True:
+        start = time.time()
+        gevent.sleep(interval)
+        latencies.append(time.time() - start - interval)
+
+def run(sectors, seconds, rate, slice_seconds):
+    log = logging.getLogger(os.path.basename(__file__))
+    log.setLevel(logging.ERROR)
+    data_dir = tempfile.mkdtemp()
+    try:
+        world = World(data_dir = data_dir, log = log, storage = 'sqlite', seed = 0, lock = RLock())
+        game = Game(world = world, log = log)
+        active = build_universe(game, sectors)
+        game.save()
+        for coordinates in active:
+            for port in Game._ports[coordinates]:
+                for item in port.cargo:
+                    item.count = 0
+        metrics = Metrics()
+        ticker = Ticker(world, rate = rate, slice_seconds = slice_seconds, metrics = metrics, log = log)
+        latencies = []
+        probe_greenlet = gevent.spawn(probe, latencies)
+        ticker.start()
+        gevent.sleep(seconds)
+        ticker.stop()
+        probe_greenlet.kill()
+        latencies.sort()
+        tick = metrics.histogram('tick_seconds')
+        return {
+            'ports': sum(len(Game._ports[coordinates]) for coordinates in active),
+            'ticks': metrics.counters.get(('ticks', ()), 0),
+            'overruns': metrics.counters.get(('tick_overruns', ()), 0),
+            'slices': metrics.histogram('tick_slice_seconds').count,
+            'slice_max': metrics.histogram('tick_slice_seconds').max,
+            'restocked': metrics.counters.get(('restocked_ports', ()), 0),
+            'tick_p50': tick.percentile(0.5),
+            'tick_max': tick.max,
+            'probe_p99': latencies[int(len(latencies) * 0.99)] if latencies else None,
+            'probe_max': latencies[-1] if latencies else None,
+        }
+    finally:
+        shutil.rmtree(data_dir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the world ticks against the number of active sectors.')
+    parser.add_argument('--sectors', default='100,1000,10000', help='Comma separated numbers of active sectors, default is 100,1000,10000')
+    parser.add_argument('-s','--seconds', type=float, default=5, help='Seconds to tick for at each size, default is 5')
+    parser.add_argument('-r','--rate', type=float, default=1, help='Ticks per second, default is 1')
+    parser.add_argument('--slice', type=float, default=0.005, help='Seconds per slice of a tick, default is 0.005')
+    args = parser.parse_args()
+
+    print "%8s %8s %6s %9s %8s %10s %12s %12s %13s %12s %12s" % (
+        'sectors', 'ports', 'ticks', 'overruns', 'slices', 'restocked',
+        'tick p50 ms', 'tick max ms', 'slice max ms', 'probe p99 ms', 'probe max ms',
+    )
+    for sectors in [int(float(size)) for size in args.sectors.split(',')]:
+        result = run(sectors, args.seconds, args.rate, args.slice)
+        print "%8d %8d %6d %9d %8d %10d %12.2f %12.2f %13.2f %12.2f %12.2f" % (
+            sectors,
+            result['ports'],
+            result['ticks'],
+            result['overruns'],
+            result['slices'],
+            result['restocked'],
+            (result['tick_p50'] or 0) * 1e3,
+            result['tick_max'] * 1e3,
+            result['slice_max'] * 1e3,
+            (result['probe_p99'] or 0) * 1e3,
+            (result['probe_max'] or 0) * 1e3,
+        )
@@ -0,0 +1,240 @@
+#!/usr/bin/python
+
+"""
+Stress test trading with hundreds of clients at the same port.
+
+handle() from server.py runs on a local port, and every client connects
+to it from its own greenlet. Clients join the game, fly to the same port,
+dock, and buy and sell at random. At the end this checks that:
+
+  - the total of each commodity (port and ships) has not changed
+  - the total credits (port and users) have not changed
+  - no count or credits went negative
+  - every trade a client saw move cargo also moved credits the other way
+  - buying items from the port and selling them back, or selling and
+    buying them back, never made a client credits
+
+The trade logger is set to debug with a handler that yields to other
+greenlets, like a slow log handler would, so trades are interleaved in
+the middle. Run with --without-lock to see what happens if commands
+don't hold the world lock.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'game'))
+
+import gevent
+from gevent.lock import RLock
+from gevent.server import StreamServer
+from gevent.socket import create_connection
+
+import server
+from game import Game
+from objects.coordinates import Coordinates
+from world import World
+
+items = ['ore', 'organics', 'equipment']
+
+class YieldingHandler(logging.Handler):
+    """A log handler that lets other greenlets run on every record."""
+    def emit(self, record):
+        gevent.sleep(0)
+
+class NoLock(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+def find_port(world):
+    """Return the port closest to (0,0,0)."""
+    game = Game(world = world)
+    origin = Coordinates(0, 0, 0)
+    for radius in xrange(1, 100):
+        for x in xrange(-radius, radius + 1):
+            for y in xrange(-radius, radius + 1):
+                game.load_sector(Coordinates(x, y, 0))
+        found = list(Game._spatial.within(origin, radius, 'ports'))
+        if found:
+            return min(found, key = lambda (coordinates, port): Game._spatial.distance(origin, coordinates))[1]
+
+def route(destination):
+    """Return the moves from (0,0,0) to destination."""
+    moves = []
+    moves += ['e' if destination.x > 0 else 'w'] * abs(destination.x)
+    moves += ['n' if destination.y > 0 else 's'] * abs(destination.y)
+    return moves
+
+def totals(port, users):
+    ships = [Game._index[user.location_id] for user in users]
+    counts = dict((item, 0) for item in items)
+    for holder in [port] + ships:
+        for commodity in holder.cargo:
+            counts[commodity.id] += commodity.count
+    credits = port.credits + sum(user.credits for user in users)
+    negative = [
+        holder.name for holder in [port] + ships
+        if any(commodity.count < 0 for commodity in holder.cargo)
+    ]
+    negative += [user.name for user in users + [port] if user.credits < 0]
+    return counts, credits, negative
+
+def client(address, number, port, trades, errors):
+    """
+    Trade at port as client number. With no trades, join the game and
+    dock at the port instead.
+    """
+    connection = create_connection(address)
+    fileobj = connection.makefile()
+
+    def send(command, parameters):
+        fileobj.write(json.dumps({command: parameters}) + "\n")
+        fileobj.flush()
+        return json.loads(fileobj.readline())['state']
+
+    name = 'client%s' % number
+    if not trades:
+        send('register', {'name': name, 'password': name})
+        send('join_game', {'ship_name': name})
+        for move in route(port.location):
+            send('move', {'direction': move})
+        send('dock', {'id': port.id})
+    state = send('login', {'name': name, 'password': name})
+
+    for i in xrange(trades):
+        item = random.choice(items)
+        command = random.choice(['buy', 'sell'])
+        before = state
+        state = send(command, {'item': item, 'quantity': random.randint(1, 5)})
+        cargo_change = (
+            sum(c['count'] for c in state['user_location']['cargo'] if c['id'] == item) -
+            sum(c['count'] for c in before['user_location']['cargo'] if c['id'] == item)
+        )
+        credits_change = state['user']['credits'] - before['user']['credits']
+        if (cargo_change > 0) != (credits_change < 0) or (cargo_change < 0) != (credits_change > 0):
+            errors.append("%s %s %s: cargo changed by %s, credits changed by %s" % (
+                name, command, item, cargo_change, credits_change,
+            ))
+    connection.close()
+
+def round_trips(address, errors):
+    """
+    Buy each item from the port and sell it back, then sell it and buy it
+    back, in a few quantities, as client0 (docked at the port). Add an
+    error for each round trip that made a profit, and return how many
+    round trips were made.
+    """
+    connection = create_connection(address)
+    fileobj = connection.makefile()
+
+    def send(command, parameters):
+        fileobj.write(json.dumps({command: parameters}) + "\n")
+        fileobj.flush()
+        return json.loads(fileobj.readline())['state']
+
+    def count(state, item):
+        return sum(c['count'] for c in state['user_location']['cargo'] if c['id'] == item)
+
+    made = 0
+    state = send('login', {'name': 'client0', 'password': 'client0'})
+    for item in items:
+        for quantity in [1, 5, 20]:
+            for first, second in [('buy', 'sell'), ('sell', 'buy')]:
+                before = state
+                send(first, {'item': item, 'quantity': quantity})
+                state = send(second, {'item': item, 'quantity': quantity})
+                if count(state, item) != count(before, item) or state['user']['credits'] == before['user']['credits']:
+                    # One of the trades could not be made
+                    continue
+                made += 1
+                if state['user']['credits'] > before['user']['credits']:
+                    errors.append("%s then %s %s %s: credits went from %s to %s" % (
+                        first, second, quantity, item, before['user']['credits'], state['user']['credits'],
+                    ))
+    connection.close()
+    return made
+
+def run(clients, trades, lock):
+    log = logging.getLogger(os.path.basename(__file__))
+    log.setLevel(logging.ERROR)
+    trade_log = logging.getLogger('game.trade')
+    trade_log.setLevel(logging.DEBUG)
+    trade_log.addHandler(YieldingHandler())
+    trade_log.propagate = False
+
+    data_dir = tempfile.mkdtemp()
+    try:
+        world = World(data_dir = data_dir, log = log, seed = 1, lock = RLock() if lock else NoLock())
+        server.world = world
+        server.log = log
+        port = find_port(world)
+
+        stream_server = StreamServer(('127.0.0.1', 0), server.handle)
+        stream_server.start()
+        address = ('127.0.0.1', stream_server.server_port)
+
+        # Everyone docks before the totals are taken
+        errors = []
+        start = time.time()
+        greenlets = [gevent.spawn(client, address, number, port, 0, errors) for number in xrange(clients)]
+        gevent.joinall(greenlets, raise_error = True)
+        # Before the port runs out of items
+        profits = []
+        made = round_trips(address, profits)
+        users = Game._users.values()
+        counts_before, credits_before, negative = totals(port, users)
+
+        greenlets = [gevent.spawn(client, address, number, port, trades, errors) for number in xrange(clients)]
+        gevent.joinall(greenlets, raise_error = True)
+        elapsed = time.time() - start
+        stream_server.stop()
+
+        users = Game._users.values()
+        counts_after, credits_after, negative = totals(port, users)
+        print "Clients: %s, %s trades each (%s lock)" % (clients, trades, "with" if lock else "without")
+        print "Time: %.1f s" % elapsed
+        for item in items:
+            print "%s: %s before, %s after" % (item, counts_before[item], counts_after[item])
+        print "Credits: %.2f before, %.2f after" % (credits_before, credits_after)
+        print "Round trips: %s, %s made a profit" % (made, len(profits))
+        problems = []
+        if counts_before != counts_after:
+            problems.append("commodity counts changed")
+        if abs(credits_before - credits_after) > 0.001:
+            problems.append("credits changed")
+        if negative:
+            problems.append("negative counts or credits: %s" % ", ".join(negative[:5]))
+        if errors:
+            problems.append("%s trades moved cargo without credits, like %s" % (len(errors), errors[0]))
+        if not made:
+            problems.append("no round trips could be made")
+        if profits:
+            problems.append("%s round trips made a profit, like %s" % (len(profits), profits[0]))
+        for problem in problems:
+            print "FAILED: %s" % problem
+        if not problems:
+            print "OK"
+        return not problems
+    finally:
+        shutil.rmtree(data_dir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Stress test trading at one port with many clients.')
+    parser.add_argument('--clients', type=int, default=200, help='Number of clients, default is 200')
+    parser.add_argument('--trades', type=int, default=20, help='Trades per client, default is 20')
+    parser.add_argument('--without-lock', action='store_true', help='Run commands without the world lock')
+    args = parser.parse_args()
+
+    random.seed(0)
+    if not run(args.clients, args.trades, not args.without_lock):
+        sys.exit(1)
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+
+"""
+Benchmark the encodings of the protocol on the response for a busy
+sector.
+
+The player is in a sector with many ports and ships, and the full
+response and the delta after one ship leaves are encoded with JSON
+lines, msgpack frames and msgpack frames compressed with zlib. The size
+of each message and the time to encode and decode it are reported.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'game'))
+
+from game import Game
+from objects.coordinates import Coordinates
+from objects.port import Port
+from objects.ship import Ship
+from protocol import diff, JsonLines, MsgpackFrames
+
+def responses(ports, ships):
+    """
+    Return the full response for a player in a busy sector, and the delta
+    after one of the ships leaves.
+    """
+    log = logging.getLogger(os.path.basename(__file__))
+    log.setLevel(logging.ERROR)
+    data_dir = tempfile.mkdtemp()
+    try:
+        game = Game(data_dir = data_dir, log = log)
+        game.register('benchmark', 'benchmark')
+        game.join_game('Benchmark')
+        origin = Coordinates(0,0,0)
+        for i in range(ports):
+            port = Port()
+            port.location = origin
+            game.place(port, origin)
+        for i in range(ships):
+            ship = Ship()
+            ship.location = origin
+            game.place(ship, origin)
+        state, commands = game.state()
+        full = {'state': state, 'commands': commands}
+        game.depart(ship)
+        state, commands = game.state()
+        delta = {'delta': diff(full, {'state': state, 'commands': commands})}
+        return full, delta
+    finally:
+        shutil.rmtree(data_dir)
+
+def run(ports, ships, repeat, compress):
+    messages = responses(ports, ships)
+    wires = [
+        ('json', JsonLines()),
+        ('msgpack', MsgpackFrames()),
+        ('msgpack+zlib', MsgpackFrames(compress = compress)),
+    ]
+    results = []
+    for message_name, message in zip(['full', 'delta'], messages):
+        for wire_name, wire in wires:
+            encoded = wire.encode(message)
+            assert wire.decode(encoded) == message
+            encode_time = min(timeit.repeat(lambda: wire.encode(message), repeat = 3, number = repeat)) / repeat
+            decode_time = min(timeit.repeat(lambda: wire.decode(encoded), repeat = 3, number = repeat)) / repeat
+            results.append((message_name, wire_name, len(encoded), encode_time, decode_time))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the protocol encodings on a busy sector.')
+    parser.add_argument('-p','--ports', type=int, default=10, help='Number of ports in the sector')
+    parser.add_argument('-s','--ships', type=int, default=200, help='Number of ships in the sector')
+    parser.add_argument('-n','--repeat', type=int, default=200, help='Number of encodes and decodes to time')
+    parser.add_argument('-c','--compress', type=int, default=1024, help='Compress msgpack+zlib messages of this many bytes or more')
+    args = parser.parse_args()
+
+    print "%8s %14s %10s %14s %14s" % ('message', 'encoding', 'bytes', 'encode (us)', 'decode (us)')
+    for message, wire, size, encode_time, decode_time in run(args.ports, args.ships, args.repeat, args.compress):
+        print "%8s %14s %10d %14.1f %14.1f" % (message, wire, size, encode_time * 1e6, decode_time * 1e6)
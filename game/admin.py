@@ -0,0 +1,50 @@
+"""
+Admin interface of a server, over HTTP on a local port.
+
+  GET /metrics        metrics as text, in the Prometheus format
+  GET /metrics.json   metrics as JSON
+
+Other pages are added with route().
+"""
+
+import json
+import urlparse
+from gevent.pywsgi import WSGIServer
+
+class Admin(object):
+    def __init__(self, metrics, log = None):
+        self.metrics = metrics
+        self.log = log
+        self.routes = {}
+        self.route('/metrics', lambda parameters: ('text/plain', self.metrics.to_text()))
+        self.route('/metrics.json', lambda parameters: ('application/json', json.dumps(self.metrics.to_dict())))
+
+    def route(self, path, function):
+        """
+        Answer requests for path with function, which is called with the
+        query parameters as a dictionary and returns the content type and
+        body of the response.
+        """
+        self.routes[path] = function
+
+    def __call__(self, environ, start_response):
+        function = self.routes.get(environ['PATH_INFO'])
+        if function is None:
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return ["Not found, try one of: %s\n" % ", ".join(sorted(self.routes))]
+        parameters = dict(urlparse.parse_qsl(environ.get('QUERY_STRING', '')))
+        try:
+            content_type, body = function(parameters)
+        except ValueError, e:
+            start_response('400 Bad Request', [('Content-Type', 'text/plain')])
+            return ["%s\n" % str(e)]
+        start_response('200 OK', [('Content-Type', content_type)])
+        return [body]
+
+    def start(self, port, host = '127.0.0.1'):
+        """Serve the admin pages in the background."""
+        server = WSGIServer((host, port), self, log = None)
+        server.start()
+        if self.log:
+            self.log.info("Admin interface listening on %s:%s" % (str(host), str(server.server_port)))
+        return server
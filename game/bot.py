@@ -0,0 +1,100 @@
+"""
+A client for scripts and load tests, without the terminal interface.
+
+The bot speaks the same protocol as client.py and keeps the latest state
+and commands from the server, applying deltas to them in delta mode, and
+the events of its sector if it asked for them.
+"""
+
+import socket
+from protocol import apply_event, encoding, patch, JsonLines
+
+class Bot(object):
+    def __init__(self, host = 'localhost', port = 10344, delta = False, encoding = 'json', compress = None, events = False):
+        self.host = host
+        self.port = port
+        self.delta = delta
+        self.encoding = encoding
+        self.compress = compress
+        self.events = events
+        self.wire = JsonLines()
+        self.connection = None
+        self.fileobj = None
+        self.state = {}
+        self.commands = {}
+        # Results of the commands in the last batch
+        self.results = None
+        # Events received since connecting
+        self.received = []
+
+    def connect(self):
+        self.connection = socket.create_connection((self.host, self.port))
+        self.fileobj = self.connection.makefile()
+        self.wire = JsonLines()
+        if self.delta or self.encoding != 'json' or self.events:
+            # The response to this is the full state, in JSON, with the
+            # protocol the server chose (see send())
+            parameters = {'delta': self.delta, 'encoding': self.encoding, 'compress': self.compress, 'events': self.events}
+            self.send('protocol', parameters)
+
+    def close(self):
+        if self.connection:
+            self.fileobj.close()
+            self.connection.close()
+            self.connection = None
+
+    def send(self, command, parameters = None):
+        """
+        Send a command to the server and return the state it responds
+        with.
+        """
+        self.fileobj.write(self.wire.encode({command: parameters or {}}))
+        self.fileobj.flush()
+        while True:
+            message = self.wire.read(self.fileobj)
+            if not message:
+                raise IOError("Server disconnected")
+            response = self.wire.decode(message)
+            if 'event' not in response:
+                break
+            # After a resync event the next response is the full state
+            apply_event(self.state, response['event'])
+            self.received.append(response['event'])
+        self.results = response.get('results')
+        if 'protocol' in response:
+            # The server sends everything after this in the encoding it
+            # chose, which is not the one asked for if it can't use it
+            self.wire = encoding(response['protocol'], self.wire)
+        if 'delta' in response:
+            # Apply the changes since the last response
+            response = patch(
+                {'state': self.state, 'commands': self.commands},
+                response['delta'],
+            )
+        self.state = response['state']
+        self.commands = response['commands']
+        return self.state
+
+    def batch(self, commands):
+        """
+        Send a list of (command, parameters) in one request and return
+        the result of each command (see dispatch() in server.py).
+        """
+        self.send('batch', [{command: parameters or {}} for command, parameters in commands])
+        return self.results
+
+    def logged_in(self):
+        return 'login' not in self.commands
+
+    def start(self, name, password):
+        """
+        Log in as name, registering first if needed, and join the game
+        if the user has not already.
+        """
+        self.send('register', {'name': name, 'password': password})
+        if not self.logged_in():
+            self.send('login', {'name': name, 'password': password})
+        if not self.logged_in():
+            raise ValueError("Could not log in as %s" % str(name))
+        if 'join_game' in self.commands:
+            self.send('join_game', {'ship_name': name})
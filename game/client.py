@@ -3,11 +3,13 @@
 import argparse
 import logging
 import os
-import json
 import socket
 import pprint
 import re
+import threading
+import Queue
 import colorama as color
+from protocol import apply_event, encoding, patch, JsonLines
 
 class _Getch:
     """Gets a single character from standard input.  Does not echo to the
@@ -18,19 +20,21 @@ class _Getch:
         except ImportError:
             self.impl = _GetchUnix()
 
-    def __call__(self): return self.impl()
+    def __call__(self, timeout = None): return self.impl(timeout)
 
 
 class _GetchUnix:
     def __init__(self):
         import tty, sys
 
-    def __call__(self):
-        import sys, tty, termios
+    def __call__(self, timeout = None):
+        import sys, tty, termios, select
         fd = sys.stdin.fileno()
         old_settings = termios.tcgetattr(fd)
         try:
             tty.setraw(sys.stdin.fileno())
+            if timeout is not None and not select.select([sys.stdin], [], [], timeout)[0]:
+                return None
             ch = sys.stdin.read(1)
         finally:
             termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
@@ -41,8 +45,14 @@ class _GetchWindows:
     def __init__(self):
         import msvcrt
 
-    def __call__(self):
-        import msvcrt
+    def __call__(self, timeout = None):
+        import msvcrt, time
+        if timeout is not None:
+            deadline = time.time() + timeout
+            while not msvcrt.kbhit():
+                if time.time() >= deadline:
+                    return None
+                time.sleep(0.01)
         return msvcrt.getch()
 
 
@@ -187,10 +197,13 @@ class Screen(object):
         return count
 
 class Menu(object):
-    def __init__(self, state = {}, commands = {}, log = None):
+    def __init__(self, state = {}, commands = {}, events = None, log = None):
         self.log = log
         self._state = state
         self._commands_from_server = commands
+        # Queue of the events pushed by the server, if they were asked for
+        self._events = events
+        self._resync = False
         self._state_cache = None
         self.screen = Screen(log = self.log)
         self._color_none = color.Fore.WHITE
@@ -206,29 +219,56 @@ class Menu(object):
         self._color_item_name = color.Fore.BLUE
         self._color_item_quantity = color.Fore.CYAN
 
-    def parse_json(self, json_string):
-        self.log.info("Loading state as json...")
-        response = json.loads(json_string)
+    def parse_response(self, response):
         self.log.info("State received from server: %s" % str(response))
+        for result in response.get('results', []):
+            if 'error' in result:
+                self.log.warning("Command in batch failed: %s" % str(result['error']))
+        if 'delta' in response:
+            # Apply the changes since the last response
+            response = patch(
+                {'state': self._state, 'commands': self._commands_from_server},
+                response['delta'],
+            )
         self._state = response['state']
         self._commands_from_server = response['commands']
+        # Any response after a resync event is the full state
+        self._resync = False
+
+    def parse_event(self, event):
+        """
+        Apply an event to the state and return whether it changed.
+        """
+        self.log.info("Event received from server: %s" % str(event))
+        if event['type'] == 'resync':
+            # Events were dropped, ask for the full state
+            self._resync = True
+            return True
+        return apply_event(self._state, event)
 
     def display(self, state = None, commands = None):
         # Initialize the command to request state
         request_state_command = {'state': {} }
 
         if self._state:
-            if not args.debug:
-                # clear screen
-                os.system('clear')
+            user_input = None
+            while user_input is None:
+                if not args.debug:
+                    # clear screen
+                    os.system('clear')
+
+                self.update_state_cache()
 
-            self.update_state_cache()
+                self.build_command_dict()
 
-            self.build_command_dict()
+                self.render_state()
 
-            self.render_state()
+                user_input = self.get_input()
+                if self._resync:
+                    self._resync = False
+                    return {'resync': {}}
 
-            user_command = self.parse_input(self.get_input())
+            user_command = self.parse_input(user_input)
             self.log.debug("user_command is %s" % str(user_command))
             return user_command
 
@@ -236,14 +276,41 @@ class Menu(object):
         return request_state_command
 
     def get_input(self):
+        """
+        Return the key pressed by the user, or None if events changed the
+        state while waiting, so it needs to be displayed again.
+        """
         # print "(? for menu) > ",
-        user_input = getch()
-        return user_input
+        if self._events is None:
+            return getch()
+        while True:
+            user_input = getch(timeout = 0.2)
+            if user_input is not None:
+                return user_input
+            changed = False
+            while not self._events.empty():
+                message = self._events.get()
+                if message is None:
+                    # The server disconnected, the next command finds out
+                    self._events.put(message)
+                    break
+                changed = self.parse_event(message['event']) or changed
+            if changed:
+                return None
 
     def parse_input(self, user_input):
         # Handle user input
         command_menu = self._command_dict
         request_state_command = {'state': {} }
+        if user_input in '23456789' and user_input not in command_menu.keys():
+            # A number before a move repeats it, in one batch request
+            count = int(user_input)
+            user_input = self.get_input()
+            command = command_menu.get(user_input)
+            if isinstance(command, dict) and 'move' in command:
+                self.log.info("Moving %s sectors in one batch..." % str(count))
+                return {'batch': [command] * count}
+            return request_state_command
         if user_input in command_menu.keys():
             # Is the user trying to quit?
             if user_input == 'q':
@@ -616,8 +683,42 @@ class Menu(object):
             info_panel[9] = self._color_heading + "Hull: " + self._color_normal + "%s" % self._state['user_location']['hull']
         if 'shields' in self._state['user_location']:
             info_panel[10] = self._color_heading + "Shields: " + self._color_normal + "%s" % self._state['user_location']['shields']
+
+        # Result of the last market or route command
+        market = self._state.get('market')
+        if market:
+            lines = []
+            if 'route' in market:
+                lines.append(color.Fore.MAGENTA + "Best Route (%s moves)" % market['radius'])
+                route = market['route']
+                if route:
+                    for action in ['buy', 'sell']:
+                        lines.append(self._color_heading + "%s %s: " % (action.title(), route['item']) + self.render_market_port(route[action]))
+                    lines.append(self._color_heading + "Profit: " + self._color_credits + "$%.2f" % route['profit'])
+                else:
+                    lines.append(self._color_normal + "No profitable trades")
+            else:
+                lines.append(color.Fore.MAGENTA + "%s %s (%s moves)" % (market['action'].title(), market['item'], market['radius']))
+                for port in market['ports']:
+                    lines.append(self.render_market_port(port))
+                if not market['ports']:
+                    lines.append(self._color_normal + "No ports found")
+            for index, line in enumerate(lines[:max(0, height - 13)]):
+                info_panel[12 + index] = line
         return info_panel
 
+    def render_market_port(self, port):
+        """Return a string for a port found by a market query."""
+        return "%s%s (%s,%s) %s$%.2f%s" % (
+            self._color_normal,
+            port['name'],
+            port['coordinates']['x'],
+            port['coordinates']['y'],
+            self._color_credits,
+            port['price'],
+            self._color_none,
+        )
+
     def render_object(self, obj):
         """
         Return a string representing this object.
@@ -683,6 +784,10 @@ if __name__ == "__main__":
     parser.add_argument('--version', action='version', version='0')
     parser.add_argument('-H','--host', default='localhost', help='Server name to connect to, default is localhost')
     parser.add_argument('-P','--port', default=10344, help='Port number for server, default is 10344')
+    parser.add_argument('--delta', action='store_true', help='Ask the server to only send changes to the state')
+    parser.add_argument('--encoding', default='json', choices=['json','msgpack'], help='Encoding of the messages, default is json')
+    parser.add_argument('--compress', type=int, default=None, help='With msgpack, compress messages of this many bytes or more')
+    parser.add_argument('--events', action='store_true', help='Ask the server to push changes in the sector as they happen')
     global args
     args = parser.parse_args()
 
@@ -719,7 +824,42 @@ if __name__ == "__main__":
 
     fileobj = socket.makefile()
 
-    menu = Menu(log = log)
+    wire = JsonLines()
+    if args.delta or args.encoding != 'json' or args.events:
+        # Enable delta mode, another encoding or events, the response to
+        # this is the full state in JSON
+        parameters = {'delta': args.delta, 'encoding': args.encoding, 'compress': args.compress, 'events': args.events}
+        log.info("Requesting protocol %s..." % str(parameters))
+        fileobj.write(wire.encode({'protocol': parameters}))
+        fileobj.flush()
+        initial_response = wire.decode(wire.read(fileobj))
+        # Switch to the encoding the server chose, it keeps JSON if it
+        # can't use the one asked for
+        wire = encoding(initial_response.get('protocol', {}), wire)
+        if wire.name != args.encoding:
+            log.warning("The server kept the %s encoding" % str(wire.name))
+    else:
+        initial_response = None
+
+    messages = None
+    if args.events:
+        # Events can come in while waiting for the user, so everything
+        # from the server is read in the background
+        messages = Queue.Queue()
+        def read_messages():
+            while True:
+                message = wire.read(fileobj)
+                if not message:
+                    messages.put(None)
+                    break
+                messages.put(wire.decode(message))
+        reader = threading.Thread(target = read_messages)
+        reader.daemon = True
+        reader.start()
+
+    menu = Menu(events = messages, log = log)
+    if initial_response:
+        menu.parse_response(initial_response)
 
     while True:
         command = menu.display()
@@ -727,17 +867,23 @@ if __name__ == "__main__":
         if command:
             # Send command
             log.info("Sending command to server: %s" % str(command))
-            fileobj.write(json.dumps(command))
-            fileobj.write("\n")
+            fileobj.write(wire.encode(command))
             fileobj.flush()
 
             # Receive state
             log.info("Receiving from server...")
-            line = fileobj.readline()
-            if not line:
+            if messages:
+                response = messages.get()
+                while response and 'event' in response:
+                    menu.parse_event(response['event'])
+                    response = messages.get()
+            else:
+                message = wire.read(fileobj)
+                response = wire.decode(message) if message else None
+            if not response:
                 log.info("Server disconnected")
                 break
-            menu.parse_json(line)
+            menu.parse_response(response)
         else:
             # User has quit
             log.info("Exiting game...")
@@ -0,0 +1,183 @@
+"""
+The cargo of every port in memory, in columns.
+
+Each port has a row and each commodity ports trade has a column in
+arrays of counts, equilibrium counts and values, so the whole economy is
+restocked and priced with a few array operations instead of one port
+and item at a time. The Commodity objects in a port's cargo read and
+write their count in its row (see Commodity.count), so trades and
+everything else see the same numbers.
+
+Game adds the ports it loads and removes the ones it drops (see
+Game.set_shared()). Rows of removed ports are used again by the next
+ports added, and the arrays double in size when they are full. Free rows
+stock nothing, so the array operations can run over all of them.
+
+The economy also keeps the prices of its ports sorted in a MarketIndex
+(see market.py), for finding the best prices near a player.
+"""
+
+import time
+import numpy
+from market import MarketIndex
+from objects import _versions
+from objects.port import Port
+
+class Economy(object):
+    # Commodity ids by column
+    commodities = ['ore', 'organics', 'equipment']
+
+    def __init__(self, capacity = 1024, rate = Port.restock_rate, pricing_curve = Port.pricing_curve, market = None):
+        self.columns = dict((id, column) for column, id in enumerate(self.commodities))
+        self.rate = rate
+        self.pricing_curve = pricing_curve
+        self.market = market if market is not None else MarketIndex()
+        # Rows by port id, and ports by row (None for rows not in use)
+        self.rows = {}
+        self.ports = []
+        self.free = []
+        self.capacity = 0
+        self.resize(capacity)
+
+    def resize(self, capacity):
+        """Make room for capacity ports."""
+        def grow(array, shape, dtype):
+            grown = numpy.zeros(shape, dtype = dtype)
+            if array is not None:
+                grown[:len(array)] = array
+            return grown
+        columns = len(self.commodities)
+        old = self.capacity
+        self.counts = grow(getattr(self, 'counts', None), (capacity, columns), numpy.int64)
+        self.equilibrium = grow(getattr(self, 'equilibrium', None), (capacity, columns), numpy.int64)
+        self.values = grow(getattr(self, 'values', None), (capacity, columns), numpy.float64)
+        self.stocked = grow(getattr(self, 'stocked', None), (capacity, columns), numpy.bool_)
+        # The count of each item when it was last restocked, and when
+        self.restocked_counts = grow(getattr(self, 'restocked_counts', None), (capacity, columns), numpy.int64)
+        self.restocked_at = grow(getattr(self, 'restocked_at', None), (capacity, columns), numpy.float64)
+        self.holds = grow(getattr(self, 'holds', None), capacity, numpy.float64)
+        # Changes when restock() changes a row, for the Commodity versions
+        self.versions = grow(getattr(self, 'versions', None), capacity, numpy.int64)
+        self.capacity = capacity
+        self.free.extend(reversed(xrange(old, capacity)))
+        self.ports.extend([None] * (capacity - old))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, objects):
+        """
+        Give each port in a list of objects a row, and move the counts of
+        its items there. Other objects are skipped.
+        """
+        now = time.time()
+        for port in objects:
+            if not isinstance(port, Port) or port.id in self.rows:
+                continue
+            if not self.free:
+                self.resize(self.capacity * 2)
+            row = self.free.pop()
+            if port._equilibrium is None:
+                port._equilibrium = dict((item.id, item.count) for item in port.cargo)
+            self.rows[port.id] = row
+            self.ports[row] = port
+            self.holds[row] = port.holds
+            self.stocked[row] = False
+            self.versions[row] = next(_versions)
+            for item in port.cargo:
+                column = self.columns.get(item.id)
+                if column is None or item._cell is not None or self.stocked[row, column]:
+                    # Items the economy doesn't trade keep their own count
+                    continue
+                count = item.count
+                self.counts[row, column] = count
+                self.restocked_counts[row, column] = count
+                self.restocked_at[row, column] = now
+                self.equilibrium[row, column] = port._equilibrium.get(item.id, count)
+                self.values[row, column] = item.value
+                self.stocked[row, column] = True
+                item._cell = (self, row, column)
+            self.market.update(port)
+
+    def remove(self, objects):
+        """
+        Free the rows of the ports in a list of objects, their items keep
+        their counts again.
+        """
+        for port in objects:
+            row = self.rows.get(getattr(port, 'id', None))
+            if row is None or self.ports[row] is not port:
+                continue
+            del self.rows[port.id]
+            self.market.remove(port)
+            for item in port.cargo:
+                if item._cell is not None and item._cell[0] is self:
+                    count = item.count
+                    item._cell = None
+                    item._count = count
+            self.ports[row] = None
+            self.stocked[row] = False
+            self.free.append(row)
+
+    def row(self, port):
+        """Return the row of a port, or None if it has none."""
+        return self.rows.get(port.id)
+
+    def set_count(self, row, column, count):
+        """
+        Set the count of an item (see Commodity.count) and update its
+        prices in the market index.
+        """
+        self.counts[row, column] = count
+        port = self.ports[row]
+        if port is not None:
+            self.market.update(port, [self.commodities[column]])
+
+    def reprice(self, rows):
+        """
+        Update the prices in the market index of the ports in rows, after
+        restock() changed them.
+        """
+        for row in rows:
+            port = self.ports[row]
+            if port is not None:
+                self.market.update(port)
+
+    def restock(self, now):
+        """
+        Produce the items that were bought from each port and consume the
+        ones that were sold to it, so the counts (and prices) move back
+        towards the equilibrium. For each item, rate of the difference is
+        made up per second since the count last changed, and an item that
+        was traded since the last restock starts again from now.
+
+        Return an array of whether each row changed. The market index is
+        not updated, pass the rows that changed to reprice() for that.
+        """
+        counts = self.counts
+        traded = counts != self.restocked_counts
+        self.restocked_counts[traded] = counts[traded]
+        self.restocked_at[traded] = now
+        gap = self.equilibrium - counts
+        remaining = numpy.rint(gap * numpy.exp(-self.rate * (now - self.restocked_at))).astype(numpy.int64)
+        changed = (remaining != gap) & self.stocked
+        restocked = (self.equilibrium - remaining)[changed]
+        counts[changed] = restocked
+        self.restocked_counts[changed] = restocked
+        self.restocked_at[changed] = now
+        changed_rows = changed.any(axis = 1)
+        if changed_rows.any():
+            self.versions[changed_rows] = next(_versions)
+        return changed_rows
+
+    def prices(self):
+        """
+        Return the selling and buying price of every item, like
+        GameObject.get_price(), as arrays by row and column. Items a port
+        doesn't stock are priced NaN.
+        """
+        with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+            price = self.pricing_curve.price(self.values, self.counts, self.holds[:, None])
+        selling = numpy.where(self.stocked, price['selling'], numpy.nan)
+        buying = numpy.where(self.stocked, price['buying'], numpy.nan)
+        return selling, buying
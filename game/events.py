@@ -0,0 +1,113 @@
+"""
+Events pushed by the server to the clients in a sector.
+
+Clients that ask for events with {'protocol': {'events': True}} are
+subscribed to the channel of the sector they are in, and get messages
+like {'event': event} between the responses to their commands, where
+event is one of:
+
+  {'type': 'entered', 'sector': coordinates, 'heading': 'ships', 'id': id, 'object': ship}
+  {'type': 'left', 'sector': coordinates, 'heading': 'ships', 'id': id}
+  {'type': 'changed', 'sector': coordinates, 'heading': 'ports', 'id': id, 'object': port}
+  {'type': 'resync'}
+
+The first three change the list of objects under heading in the state of
+the sector (see apply_event() in protocol.py). Resync is sent when the
+client did not read its events fast enough and some were dropped, it
+should send the resync command to get the full state again.
+"""
+
+import gevent
+from gevent.queue import Queue, Full
+
+class EventChannels(object):
+    """
+    Subscribers by the coordinates of the sector they follow.
+    """
+    def __init__(self, metrics = None):
+        self.channels = {}
+        self.metrics = metrics
+
+    def subscribe(self, coordinates, subscriber):
+        self.channels.setdefault(coordinates, set()).add(subscriber)
+
+    def unsubscribe(self, coordinates, subscriber):
+        subscribers = self.channels.get(coordinates)
+        if subscribers:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.channels[coordinates]
+
+    def publish(self, coordinates, event, source = None):
+        """
+        Send an event to everyone following the sector at coordinates,
+        except the source of the event.
+        """
+        subscribers = self.channels.get(coordinates)
+        if not subscribers:
+            return
+        event['sector'] = coordinates.to_dict()
+        for subscriber in list(subscribers):
+            if subscriber is not source:
+                subscriber.push(event)
+        if self.metrics:
+            self.metrics.increment('events_published', type = event['type'])
+
+    def subscribers(self):
+        return sum(len(subscribers) for subscribers in self.channels.itervalues())
+
+class Subscriber(object):
+    """
+    The events waiting to be written to one client.
+
+    Events are queued and written by a greenlet of their own, with write
+    (which must not interleave them with responses). If the client reads
+    slower than events come in, the queue fills up: then the events in it
+    are dropped and the client is sent a resync event instead, so a slow
+    socket never holds up the server or uses more and more memory.
+    """
+    def __init__(self, channels, write, limit = 256, log = None):
+        self.channels = channels
+        self.write = write
+        self.log = log
+        self.queue = Queue(maxsize = limit)
+        self.coordinates = None
+        self.greenlet = gevent.spawn(self.run)
+
+    def follow(self, coordinates):
+        """Follow the sector at coordinates, instead of the last one."""
+        if coordinates == self.coordinates:
+            return
+        if self.coordinates is not None:
+            self.channels.unsubscribe(self.coordinates, self)
+        self.coordinates = coordinates
+        if coordinates is not None:
+            self.channels.subscribe(coordinates, self)
+
+    def push(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except Full:
+            dropped = 0
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                dropped += 1
+            self.queue.put_nowait({'type': 'resync'})
+            if self.channels.metrics:
+                self.channels.metrics.increment('events_dropped', dropped)
+            if self.log:
+                self.log.warning("Client is not keeping up with events, dropped %s" % str(dropped))
+
+    def run(self):
+        while True:
+            event = self.queue.get()
+            try:
+                self.write(event)
+            except (IOError, OSError), e:
+                if self.log:
+                    self.log.info("Could not send event, stopping: %s" % str(e))
+                break
+
+    def close(self):
+        self.follow(None)
+        self.greenlet.kill()
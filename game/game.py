@@ -5,9 +5,15 @@ import json
 import yaml
 import uuid
 import datetime
-import shutil
 import pprint
-from random import randint, random
+from collections import OrderedDict
+from economy import Economy
+from generator import SectorGenerator
+from journal import Journal
+from pathfinding import find_path, waypoints
+from store import SqliteStore
+from spatial import SpatialIndex
+from world import World
 from objects import GameObject
 from objects.manmade import ManMade
 from objects.natural import Natural
@@ -31,36 +37,126 @@ class Game(object):
         'Port': 0.5,
     }
 
-    def __init__(self, data_dir = 'data', log = None, bigbang = False):
-        self.log = log
-        self.file = file
-	self.data_dir = data_dir
-
-	# If the data_dir is relative, then we need to find the absolute path for daemonizing
-	if not os.path.isabs(self.data_dir):
-	    self.data_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)),data_dir)
-
-        if bigbang:
-            # Delete data directory if bigbang is True
-            self.log.warning("Performing big bang...")
-            if os.path.isdir(self.data_dir):
-                self.log.info("Deleting data directory '%s'..." % str(self.data_dir))
-                shutil.rmtree(self.data_dir)
-            # Set bigbang to False to make sure we don't delete data on next login
-            self.log.info("Big Bang complete, it will not be run again until the game is restarted")
-            self.bigbang = False
-
-        self.log.debug("Verifying data directory exists (%s)..." % str(self.data_dir))
-        if not os.path.isdir(self.data_dir):
-	    self.log.debug("Data directory does not exist, creating it...")
-            os.makedirs(self.data_dir)
+    # Where new ships are spawned
+    spawn_coordinates = Coordinates(0,0,0)
 
-        self.log.debug("Shared objects for all Game instances: %s" % str(self.shared_objects))
-        for obj in self.shared_objects:
-	    self.log.debug("Shared object %s exists, loading..." % str(obj))
-            self.load_shared_object(obj)
+    # Index of object id to object for everything that can be found by id.
+    # Objects are stored by reference, so moving an object between sectors
+    # or docking it somewhere does not require updating the index.
+    _index = {}
+
+    # Everything in every sector, by coordinates and type
+    _spatial = SpatialIndex()
+
+    # Cargo of the ports in memory, in arrays (see economy.py)
+    _economy = Economy()
+
+    # Keys of shared objects that changed since the last save(), as
+    # (shared object name, key) tuples
+    _dirty = set()
+
+    # Journal of changes, opened (and replayed) by the first Game instance
+    _journal = None
+
+    # Compact the journal into a snapshot after this many records
+    journal_compact_threshold = 1000
+
+    # Process id of the snapshot being written in the background, if any
+    _compaction_pid = None
+
+    # sqlite store, used instead of the YAML files and journal when the
+    # storage is 'sqlite'
+    _store = None
+    store_filename = 'universe.db'
+
+    # Coordinates of the sectors that have been loaded from the store
+    _loaded = set()
+
+    # Generates sectors from the world seed, see generate()
+    _generator = None
+
+    # Blocks of sectors that have been generated, least recently used
+    # first. Past generated_block_limit blocks, the unchanged parts of the
+    # oldest block are dropped from memory (they can be generated again).
+    _generated = OrderedDict()
+    generated_block_limit = 256
+
+    # (name, key) of the generated shared objects that have not changed,
+    # these are not saved
+    _pristine = set()
+
+    # Furthest (in moves) a market query looks for ports. The blocks of
+    # sectors within it are loaded for the query.
+    market_radius_limit = 10
+
+    # Most ports a market query returns
+    market_count_limit = 10
+
+    # Furthest (in moves) the autopilot flies in one command. The blocks of
+    # sectors on its path are all loaded, so it must stay well below
+    # generated_block_limit blocks.
+    autopilot_limit = 100
+
+    def __init__(self, world = None, data_dir = 'data', log = None, bigbang = False, storage = 'yaml'):
+        """
+        Start a session in world.
+
+        If world is not provided a new World is created with the rest of
+        the arguments, which loads the shared objects again.
+        """
+        if world is None:
+            world = World(data_dir = data_dir, log = log, bigbang = bigbang, storage = storage)
+        self.world = world
+        self.log = log or world.log
+        # Hot paths log to their own subsystem, so one can be traced with
+        # debug logging without paying for the others
+        self.world_log = logging.getLogger('game.world')
+        self.trade_log = logging.getLogger('game.trade')
+        self.storage = world.storage
+        self.data_dir = world.data_dir
+
+        if not world.loaded:
+            self.load()
+            world.loaded = True
 
         self.logged_in_user = None
+        # The result of the last market query, sent with the state until
+        # the next one (see market())
+        self.market_result = None
+        # Summary of the path of the last autopilot command, sent with the
+        # state until the ship moves again (see autopilot())
+        self.autopilot_result = None
+
+    def load(self):
+        """
+        Load the shared objects from the data directory, replacing anything
+        that is already loaded.
+        """
+        if Game._journal:
+            Game._journal.close()
+            Game._journal = None
+        if Game._store:
+            Game._store.close()
+            Game._store = None
+        for obj in self.shared_objects:
+            setattr(Game, '_' + obj, {})
+        Game._index = {}
+        Game._spatial = SpatialIndex()
+        Game._economy = Economy()
+        Game._dirty = set()
+        Game._loaded = set()
+        Game._generator = SectorGenerator(self.new_object_probability, seed = self.world.seed)
+        Game._generated = OrderedDict()
+        Game._pristine = set()
+
+        self.log.debug("Shared objects for all Game instances: %s" % str(self.shared_objects))
+        if self.storage == 'sqlite':
+            self.load_store()
+        else:
+            for obj in self.shared_objects:
+                self.log.debug("Shared object %s exists, loading..." % str(obj))
+                self.load_shared_object(obj)
+            self.load_journal()
 
     @property
     def shared_objects(self):
@@ -72,17 +168,317 @@ class Game(object):
         return objects
 
     def save(self):
+        """
+        Write every change since the last save to disk.
+
+        Only the keys that changed are written, either to the sqlite store
+        or to the journal. For YAML storage the full snapshot of the shared
+        objects is written by compact() once the journal is large.
+        """
+        if Game._dirty:
+            self.world_log.debug("Saving %s changed keys", len(Game._dirty))
+            records, ids = self.records(Game._dirty)
+            if Game._store:
+                Game._store.put(records, ids)
+            else:
+                Game._journal.append(records)
+            Game._dirty = set()
+
+        if Game._journal and Game._journal.records >= self.journal_compact_threshold:
+            self.compact()
+
+    def records(self, keys):
+        """
+        Return the (name, key, value) records for a list of (name, key)
+        tuples, and the (id, name, key) of the objects in them that can be
+        found by id.
+        """
+        records = []
+        ids = []
+        for name, key in keys:
+            value = getattr(Game, '_' + name).get(key)
+            records.append((name, key, value))
+            for obj in (value if isinstance(value, list) else [value]):
+                if isinstance(obj, ManMade):
+                    ids.append((obj.id, name, key))
+        return records, ids
+
+    def mark_dirty(self, obj, key = None):
+        """
+        Record that obj changed so it is written by the next save().
+
+        key is the key of obj in its shared object. If key is not provided,
+        it is the user name for users or the coordinates of the sector the
+        object is in for everything else.
+        """
+        if key is None:
+            if isinstance(obj, User):
+                key = obj.name
+            else:
+                location = obj
+                while location and not isinstance(location.location, Coordinates):
+                    location = self.location(of = location)
+                key = location.location if location else None
+        if key is None:
+            self.world_log.error("Could not determine where %s is stored, it will not be saved", obj)
+            return
+        Game._dirty.add((obj.plural(), key))
+        Game._pristine.discard((obj.plural(), key))
+
+    def snapshot(self):
+        """
+        Write every shared object to its YAML file.
+
+        Generated sectors and their contents are left out unless they
+        changed.
+        """
         self.log.info("Saving shared objects to disk")
         for obj in self.shared_objects:
-            if getattr(Game, '_' + obj, None):
+            shared_dict = dict(
+                (key, value) for key, value in getattr(Game, '_' + obj).iteritems()
+                if (obj, key) not in Game._pristine
+            )
+            if shared_dict:
                 self.log.debug("Saving shared object '%s'..." % str(obj))
-                self.log.debug("Shared object '%s' is %s" % (str(obj),str(getattr(Game, '_' + obj))))
-                with open(os.path.join(self.data_dir,obj + '.yaml'), 'w') as outfile:
-                    outfile.write(yaml.dump(getattr(Game, '_' + obj),
+                filename = os.path.join(self.data_dir,obj + '.yaml')
+                # Write to a temporary file first so a crash never leaves
+                # a partially written snapshot behind
+                temporary_filename = "%s.%s.tmp" % (filename, str(os.getpid()))
+                with open(temporary_filename, 'w') as outfile:
+                    outfile.write(yaml.dump(shared_dict,
                                             default_flow_style = False))
+                os.rename(temporary_filename, filename)
             else:
                 self.log.debug("'%s' shared object is empty, skipping..." % str(obj))
 
+    def compact(self):
+        """
+        Fold the journal into a new snapshot.
+
+        The journal is rotated, then a child process writes the snapshot
+        from its copy of the shared objects and deletes the rotated
+        journal. The server keeps running (and journaling) meanwhile.
+        """
+        if Game._compaction_pid:
+            pid, status = os.waitpid(Game._compaction_pid, os.WNOHANG)
+            if not pid:
+                self.log.debug("Journal compaction is still running")
+                return
+            Game._compaction_pid = None
+            if status:
+                self.log.error("Journal compaction failed with status %s" % str(status))
+        if Game._journal.compacting:
+            # A rotated journal that was never compacted is replayed on
+            # startup, and must not be overwritten by another rotation
+            self.log.warning("Journal %s was never compacted, compacting in the foreground..." % (
+                str(Game._journal.compacting_filename),
+            ))
+            self.snapshot()
+            os.remove(Game._journal.compacting_filename)
+
+        self.log.info("Compacting journal...")
+        Game._journal.rotate()
+        if not hasattr(os, 'fork'):
+            self.snapshot()
+            os.remove(Game._journal.compacting_filename)
+            return
+
+        pid = os.fork()
+        if pid:
+            Game._compaction_pid = pid
+            return
+
+        # Child process
+        status = 0
+        try:
+            self.snapshot()
+            os.remove(Game._journal.compacting_filename)
+        except Exception as e:
+            self.log.error("Journal compaction failed: %s" % str(e))
+            status = 1
+        os._exit(status)
+
+    def load_journal(self):
+        """
+        Replay the journal on top of the loaded snapshot, then open it for
+        new records.
+        """
+        journal = Journal(os.path.join(self.data_dir, 'journal.yaml'), log = self.log)
+        self.log.info("Replaying journal %s..." % str(journal.filename))
+        replayed = 0
+        for name, key, value in journal.replay():
+            self.set_shared(name, key, value)
+            replayed += 1
+        self.log.info("Replayed %s journal records" % str(replayed))
+        journal.records = replayed
+        Game._journal = journal
+
+    def load_store(self):
+        """
+        Open the sqlite store.
+
+        Only users are loaded up front, sectors and everything in them are
+        loaded by load_sector() the first time they are needed.
+        """
+        store = SqliteStore(os.path.join(self.data_dir, self.store_filename), log = self.log)
+        self.log.info("Opened store %s" % str(store.filename))
+        Game._users = store.load(User().plural())
+        Game._store = store
+
+    def load_sector(self, coordinates):
+        """
+        Load a sector and its contents, if that has not been done yet.
+
+        Sectors are loaded a block at a time (see SectorGenerator): first
+        whatever was saved in the block is loaded from the store, then the
+        rest of the block is generated from the world seed.
+        """
+        block = Game._generator.block(coordinates)
+        if block in Game._generated:
+            # Move the block to the end, as the most recently used
+            Game._generated[block] = Game._generated.pop(block)
+            return
+        if Game._store:
+            self.load_block(block)
+        self.generate(block)
+
+    def load_sectors(self, coordinates):
+        """
+        Load the sectors at a list of coordinates and their contents, like
+        load_sector(), reading the blocks that are not loaded yet from the
+        store at once.
+        """
+        blocks = []
+        for location in coordinates:
+            block = Game._generator.block(location)
+            if block not in blocks:
+                blocks.append(block)
+        missing = [block for block in blocks if block not in Game._generated]
+        if Game._store and missing:
+            self.load_blocks(missing)
+        for block in blocks:
+            if block in Game._generated:
+                # Move the block to the end, as the most recently used
+                Game._generated[block] = Game._generated.pop(block)
+            else:
+                self.generate(block)
+
+    def load_block(self, block):
+        """
+        Load the sectors in a block from the store, if that has not been
+        done yet.
+        """
+        self.load_blocks([block])
+
+    def load_blocks(self, blocks):
+        """
+        Load the sectors in a list of blocks from the store, if that has
+        not been done yet.
+        """
+        coordinates = [
+            location
+            for block in blocks
+            for location in Game._generator.block_coordinates(block)
+            if location not in Game._loaded
+        ]
+        stored = Game._store.get_many(coordinates)
+        for location in coordinates:
+            Game._loaded.add(location)
+            values = stored.get(Game._store.encode_key(location), {})
+            for name, value in values.iteritems():
+                if name == User().plural():
+                    # A user whose name looks like coordinates
+                    continue
+                self.set_shared(name, location, value)
+
+    def generate(self, block):
+        """
+        Generate a block of sectors from the world seed.
+
+        Anything that is already loaded, because it changed and was saved,
+        is kept instead of what is generated. Sectors that were saved whole
+        are not generated at all.
+        """
+        self.world_log.debug("Generating block of sectors %s...", block)
+        sectors = Game._generator.plural(Sector)
+        for name, generated in Game._generator.generate_block(block).iteritems():
+            shared_dict = getattr(Game, '_' + name)
+            for key, value in generated.iteritems():
+                if key in shared_dict:
+                    continue
+                if key in Game._sectors and (sectors, key) not in Game._pristine:
+                    # The whole sector was saved (by pregenerate.py or
+                    # before sectors were generated)
+                    continue
+                self.set_shared(name, key, value)
+                Game._pristine.add((name, key))
+        Game._generated[block] = True
+
+        while len(Game._generated) > self.generated_block_limit:
+            oldest, _ = Game._generated.popitem(last = False)
+            self.forget(oldest)
+
+    def forget(self, block):
+        """
+        Drop the generated sectors in a block that have not changed from
+        memory. Sectors with ships in them are kept.
+        """
+        self.world_log.debug("Dropping block of sectors %s from memory...", block)
+        ships = Game._generator.plural(Ship)
+        for coordinates in Game._generator.block_coordinates(block):
+            if not Game._spatial.at(coordinates).get(ships):
+                self.discard_generated(coordinates)
+
+    def discard_generated(self, coordinates):
+        """
+        Remove everything at coordinates that was generated and has not
+        changed.
+        """
+        for name in [Game._generator.plural(Sector)] + Game._spatial.at(coordinates).keys():
+            if (name, coordinates) not in Game._pristine:
+                continue
+            Game._pristine.discard((name, coordinates))
+            value = getattr(Game, '_' + name).get(coordinates)
+            for obj in (value if isinstance(value, list) else [value]):
+                if isinstance(obj, ManMade):
+                    Game._index.pop(obj.id, None)
+            self.set_shared(name, coordinates, None)
+
+    def set_shared(self, name, key, value):
+        """
+        Set (or remove, if value is None) a key in a shared object, and
+        update the id and spatial indexes and the economy to match.
+        """
+        shared_dict = getattr(Game, '_' + name)
+        replaced = shared_dict.get(key)
+        if isinstance(replaced, list) and replaced is not value:
+            Game._economy.remove(replaced)
+        if value is None:
+            shared_dict.pop(key, None)
+            Game._spatial.remove(key, name)
+            return
+        shared_dict[key] = value
+        if isinstance(value, list):
+            # Lists of objects in a sector (ships, ports, stars, ...)
+            Game._spatial.set(key, name, value)
+            for obj in value:
+                self.index(obj)
+            Game._economy.add(value)
+        else:
+            self.index(value)
+
+    def place(self, obj, coordinates):
+        """
+        Add an object to the sector at coordinates.
+        """
+        shared_dict = getattr(Game, '_' + obj.plural())
+        if coordinates in shared_dict:
+            shared_dict[coordinates].append(obj)
+            self.index(obj)
+            Game._economy.add([obj])
+        else:
+            self.set_shared(obj.plural(), coordinates, [obj])
+
     def load_shared_object(self, name):
         friendly_name = name
         object_name = '_' + name
@@ -100,8 +496,10 @@ class Game(object):
             if os.path.isfile(filename):
                 self.log.debug("Loading shared object '%s' from %s..." % (str(friendly_name),
                                                                          str(filename)))
-                loaded_obj = yaml.load(open(filename))
-                setattr(Game, object_name, loaded_obj)
+                loaded_obj = yaml.load(open(filename), Loader = yaml.Loader)
+                setattr(Game, object_name, {})
+                for key, value in loaded_obj.iteritems():
+                    self.set_shared(name, key, value)
             else:
                 self.log.debug("File not found, creating a new shared object '%s'..." %
                     str(friendly_name))
@@ -112,59 +510,74 @@ class Game(object):
 
     def location(self, of):
         """Return location object for the user's current location"""
-        self.log.debug("Looking up location for %s..." % str(of))
+        self.world_log.debug("Looking up location for %s...", of)
         if hasattr(of, 'location_id'):
-            self.log.debug("Object (of) has a location_id of %s, looking it up..." % str(of.location_id))
-            # Need to go through each ship to find out if the id matches
-            for obj_list in Game._ships.values():
-                for obj in obj_list:
-                    if of.location_id == obj.id: return obj
+            self.world_log.debug("Object (of) has a location_id of %s, looking it up...", of.location_id)
+            obj = Game._index.get(of.location_id) or self.load_id(of.location_id)
+            if isinstance(obj, Ship): return obj
         if hasattr(of, 'coordinates'):
-            if of.coordinates in Game._sectors.keys():
+            self.load_sector(of.coordinates)
+            if of.coordinates in Game._sectors:
                 return Game._sectors[of.coordinates]
         if hasattr(of, 'location'):
             if isinstance(of.location,Coordinates):
-                if of.location in Game._sectors.keys():
+                self.load_sector(of.location)
+                if of.location in Game._sectors:
                     return Game._sectors[of.location]
             if isinstance(of.location,str):
                 # Assume location is uuid, search objects for id
                 return self.find_by_id(of.location)
         return None
 
+    def sector_coordinates(self):
+        """
+        Return the coordinates of the sector the current player's ship is
+        in, or docked in, or None if they have no ship.
+        """
+        user = self.logged_in_user
+        if not user or not getattr(user, 'location_id', None):
+            return None
+        ship = self.location(of = user)
+        if not ship:
+            return None
+        if isinstance(ship.location, Coordinates):
+            return ship.location
+        port = self.location(of = ship)
+        if port and isinstance(getattr(port, 'location', None), Coordinates):
+            return port.location
+        return None
+
     def find_by_id(self, id):
         """
         Find an object by its ID
         """
-        self.log.debug("Searching for object with id %s" % str(id))
-        found_obj = None
-        possible_objects = [globals()[obj.__name__]().plural() for obj in ManMade.__subclasses__()]
-        for shared_obj in possible_objects:
-            self.log.debug("Searching %s for id %s" % (str(shared_obj),str(id)))
-            if found_obj:
-                break
-            for key, value in getattr(Game,'_' + shared_obj,{}).iteritems():
-                objects = []
-                if isinstance(value,list):
-                    objects += value
-                else:
-                    objects.append(value)
-                for obj in objects:
-                    self.log.debug("Processing %s" % str(obj))
-                    self.log.debug("Testing %s (id: %s) for id %s" % (
-                        str(obj.name),
-                        str(obj.id),
-                        str(id),
-                    ))
-                    if obj.id == id:
-                        found_obj = obj
-                        break
-
+        found_obj = Game._index.get(id) or self.load_id(id)
         if found_obj:
-            self.log.debug("Found object of type %s: %s" % (str(found_obj.__class__.__name__),str(found_obj)))
+            self.world_log.debug("Found object of type %s: %s", found_obj.__class__.__name__, found_obj)
         else:
-            self.log.warning("No object found with id %s" % str(id))
+            self.world_log.warning("No object found with id %s", id)
         return found_obj
 
+    def load_id(self, id):
+        """
+        Load the sector holding the object with this id from the store, and
+        return the object.
+        """
+        if Game._store:
+            found = Game._store.find(id)
+            if found:
+                self.load_sector(found[1])
+        return Game._index.get(id)
+
+    def index(self, obj):
+        """
+        Add an object to the id index so it can be found by find_by_id().
+
+        Only man made objects (ships, ports, stations) can be found by id.
+        """
+        if isinstance(obj, ManMade):
+            Game._index[obj.id] = obj
+
     def state(self):
         """Return the state and commands dictionary for the currently
         logged in user.
@@ -174,7 +587,7 @@ class Game(object):
         converted to a dictionary before being returned.
         """
 
-        self.log.debug("Generating state...")
+        self.world_log.debug("Generating state...")
         # Define Flags
         flags = {}
         flags['logged_in'] = True if self.logged_in_user else False
@@ -201,11 +614,11 @@ class Game(object):
         ) else False
         # Flags are defined
 
-        self.log.debug("State flags are %s" % str(flags))
+        self.world_log.debug("State flags are %s", flags)
         state = {} # Initialize
         commands = {} # Initialize
 
-        self.log.debug("Processing state flag 'logged_in'...")
+        self.world_log.debug("Processing state flag 'logged_in'...")
         if flags['logged_in']:
             # Return __dict__ for json
             state['user'] = self.logged_in_user.to_dict()
@@ -213,29 +626,41 @@ class Game(object):
                 # New user needs to join the game
                 commands['join_game'] = {'ship_name': None}
 
-            self.log.debug("Processing state flag 'in_ship'...")
+            self.world_log.debug("Processing state flag 'in_ship'...")
             if flags['in_ship']:
                 state['user_location'] = user_location.to_dict()
 
-            self.log.debug("Processing state flag 'in_sector'...")
+            self.world_log.debug("Processing state flag 'in_sector'...")
             if flags['in_sector']:
-                state['sector'] = ship_location.to_dict()
+                # Copy the sector, since to_dict() is cached
+                state['sector'] = dict(ship_location.to_dict())
                 state['sector']['coordinates'] = user_location.location.to_dict()
-                contents = self.get_contents(user_location.location)
-                for obj in contents:
-                    heading = globals()[obj.__class__.__name__]().plural()
-                    if heading in state['sector']:
-                        state['sector'][heading].append(obj.to_dict())
-                    else:
-                        state['sector'][heading] = [obj.to_dict()]
-                    if obj.dockable:
-                        if 'dock' in commands:
-                            commands['dock']['id'].append(obj.id)
-                        else:
-                            commands['dock'] = {'id': [obj.id]}
+                self.load_sector(user_location.location)
+                for heading, objects in Game._spatial.at(user_location.location).iteritems():
+                    if objects:
+                        state['sector'][heading] = [obj.to_dict() for obj in objects]
+                    for obj in objects:
+                        if obj.dockable:
+                            if 'dock' in commands:
+                                commands['dock']['id'].append(obj.id)
+                            else:
+                                commands['dock'] = {'id': [obj.id]}
                 commands['move'] = {'direction': ['n','s','e','w']}
+                commands['autopilot'] = {'x': None, 'y': None}
+                if self.autopilot_result is not None:
+                    state['autopilot'] = self.autopilot_result
 
-            self.log.debug("Processing state flag 'docked'...")
+            if flags['in_sector'] or flags['docked']:
+                commands['market'] = {
+                    'item': list(Game._economy.commodities),
+                    'action': ['buy','sell'],
+                    'radius': None,
+                }
+                commands['route'] = {'radius': None}
+                if self.market_result is not None:
+                    state['market'] = self.market_result
+
+            self.world_log.debug("Processing state flag 'docked'...")
             if flags['docked']:
                 state['at'] = ship_location.to_dict()
                 commands['undock'] = {}
@@ -255,18 +680,35 @@ class Game(object):
             # Register takes user/pass
             commands['register'] = {'name': None, 'password': None}
 
-        self.log.debug("Returning state of %s..." % str(state))
-        self.log.debug("Returning commands of %s..." % str(commands))
+        self.world_log.debug("Returning state of %s...", state)
+        self.world_log.debug("Returning commands of %s...", commands)
         return state, commands
 
+    def reload_user(self, name):
+        """
+        Load a user from the store again and return it, or None if there
+        is no user with that name.
+
+        Servers that share a store (see shard.py) load a user again before
+        using it, since another server may have changed it.
+        """
+        if Game._store:
+            user = Game._store.get(name).get(User().plural())
+            if user:
+                Game._users[name] = user
+            else:
+                Game._users.pop(name, None)
+        return Game._users.get(name)
+
     def register(self, name, password):
         if name and password:
-            if name in Game._users.keys():
+            if name in Game._users:
                 self.log.error("Username '%s' already found in user database" % str(name))
                 return False
             else:
                 self.log.info("Adding new user '%s'..." % str(name))
                 Game._users[str(name)] = User(name = name, password = password)
+                self.mark_dirty(Game._users[str(name)])
                 # Automatically login the user that was just created
                 return self.login(name, password)
         self.log.error("Name or password is missing")
@@ -274,7 +716,7 @@ class Game(object):
 
     def login(self, name, password):
         if name and password:
-            if name in Game._users.keys():
+            if name in Game._users:
                 self.log.debug("Username '%s' found in user database" % str(name))
                 self.log.debug("Password loaded for '%s' as '%s'" % (
                     Game._users[str(name)],
@@ -291,6 +733,7 @@ class Game(object):
                     else:
                         # Generate token
                         Game._users[str(name)].token = str(uuid.uuid4())
+                        self.mark_dirty(Game._users[str(name)])
                         self.log.debug("Token generated. User state is %s" % Game._users[str(name)])
                         return True
                 else:
@@ -324,6 +767,7 @@ class Game(object):
 
         # Spawn the ship
         self.spawn(ship)
+        self.mark_dirty(self.logged_in_user)
 
         # Return result
         self.log.info("Ship '%s' created" % (str(ship.name)))
@@ -331,9 +775,9 @@ class Game(object):
 
     def spawn(self, ship):
         """
-        Spawn a ship in sector (0,0,0)
+        Spawn a ship in sector spawn_coordinates, (0,0,0)
         """
-        coordinates = Coordinates(0,0,0)
+        coordinates = self.spawn_coordinates
         self.log.debug("Requesting sector at %s..." % str(coordinates))
         sector = self.sector(coordinates)
         self.log.info("Spawning ship '%s' in sector '%s' (%s)..." % (
@@ -342,96 +786,105 @@ class Game(object):
             str(coordinates),
         ))
         ship.location = coordinates
-        shared_dict = getattr(Game,'_ships', None)
-        if coordinates in shared_dict:
-            self.log.debug("Coordinates %s exists in %s, appending ship to current list of %s..." % (
-                str(coordinates),
-                "Game._ships",
-                str(shared_dict[coordinates])
-            ))
-            shared_dict[coordinates].append(ship)
-        else:
-            self.log.debug("Coordinates %s does not exist in %s, creating a new ship list..." % (
-                str(coordinates),
-                "Game._ships",
-            ))
-            shared_dict[coordinates] = [ship]
+        self.place(ship, coordinates)
+        self.mark_dirty(ship, coordinates)
         return True
 
     def move(self, cardinal_direction = None, coordinates = None):
         """
-        Move the current player's ship in a cardinal direction (N-S-E-W)
+        Move the current player's ship in a cardinal direction (N-S-E-W),
+        or to coordinates
         """
+        ship = self.location(of = self.logged_in_user)
         if cardinal_direction:
             if cardinal_direction.lower() in ['n','s','e','w']:
-                ship = self.location(of = self.logged_in_user)
                 coordinates = ship.location.adjacent(cardinal_direction)
 
         if coordinates:
-            shared_dict = getattr(Game,'_ships')
+            self.autopilot_result = None
+            self.load_sector(coordinates)
             # Remove from current sector
-            shared_dict[ship.location].remove(ship)
+            self.depart(ship)
             # Move to new sector
-            if coordinates in shared_dict:
-                shared_dict[coordinates].append(ship)
-            else:
-                shared_dict[coordinates] = [ship]
+            self.place(ship, coordinates)
             ship.location = coordinates
+            self.mark_dirty(ship, coordinates)
 
             # Call self.sector() so the sector is generated, if necessary
             self.sector(ship.location)
 
-    def sector(self, coordinates):
+    def autopilot(self, x, y, summary = False):
         """
-        Return a sector (lookup by name)
+        Fly the current player's ship to the sector at (x, y) in one move,
+        along the path from find_path().
 
-        If the sector is not found, it will be generated
+        The sectors on the path are loaded (or generated) together first,
+        so whatever is in the way is known when the path is extended with
+        obstacles. When the world is split between shards, only the ones
+        this shard owns are loaded, the path is planned over the others as
+        open space. If summary is set, the path is summarized in the state
+        under 'autopilot' until the ship moves again.
         """
-        if coordinates in self._sectors.keys():
-            sector = self._sectors[coordinates]
-            self.log.debug("Sector at %s exists, returning %s..." % (
-                str(coordinates),
-                str(sector),
-            ))
-            return sector
+        ship = self.location(of = self.logged_in_user)
+        path = self.path(ship, x, y)
+        if path is None:
+            return False
+        self.load_sectors([location for location in path if self.world.owns(location)])
+        self.move(coordinates = path[-1])
+        if summary:
+            self.autopilot_result = {
+                'from': path[0].to_dict(),
+                'to': path[-1].to_dict(),
+                'moves': len(path) - 1,
+                'waypoints': [location.to_dict() for location in waypoints(path)],
+            }
+        return True
 
-        # Sector doesn't exit, create it
-        self.log.info("Sector at (%s,%s) does not exist, generating new sector..." % (
-            str(coordinates.x),
-            str(coordinates.y)
-        ))
-        new_sector = Sector(name = 'M-' + str(randint(0,1000)))
-        self._sectors[coordinates] = new_sector
-        sector = self._sectors[coordinates]
-        for object_name, probability in self.new_object_probability.iteritems():
-            self.log.debug("Probability of %s to generate a %s" % (
-                str(probability),
-                str(object_name),
-            ))
-            while random() <= probability:
-                # Create a new object
-                self.log.debug("Roll passed, generating new %s in %s" % (
-                    str(object_name),
-                    str(coordinates),
-                ))
-                new_object = globals()[object_name]()
-                new_object.location = coordinates
-                shared_dict = getattr(Game,'_' + new_object.plural())
-                if coordinates in shared_dict:
-                    shared_dict[coordinates].append(new_object)
-                else:
-                    shared_dict[coordinates] = [new_object]
-                self.log.debug("Generated new %s in %s: %s" % (
-                    str(object_name),
-                    str(coordinates),
-                    str(new_object),
-                ))
+    def path(self, ship, x, y):
+        """
+        Return the path for a ship to fly to (x, y) on its level, as a
+        list of coordinates, or None if it can't fly there.
+        """
+        if not ship or not isinstance(ship.location, Coordinates):
+            self.world_log.error("Autopilot needs a ship in a sector, ignoring...")
+            return None
+        try:
+            destination = Coordinates(x, y, ship.location.z)
+        except (TypeError, ValueError):
+            self.world_log.error("Autopilot called with non-integer coordinates (%s, %s), ignoring...", x, y)
+            return None
+        moves = Game._spatial.distance(ship.location, destination)
+        if moves > self.autopilot_limit:
+            self.world_log.error("Autopilot can't fly %s moves (the limit is %s), ignoring...", moves, self.autopilot_limit)
+            return None
+        path = find_path(ship.location, destination)
+        if path is None:
+            self.world_log.error("Autopilot found no path from %s to %s", ship.location, destination)
+        return path
+
+    def depart(self, ship):
+        """
+        Remove a ship from the sector it is in.
+        """
+        shared_dict = getattr(Game,'_ships')
+        shared_dict[ship.location].remove(ship)
+        if not shared_dict[ship.location]:
+            # Nothing needs to be saved for a sector nobody is in
+            self.set_shared('ships', ship.location, None)
+        self.mark_dirty(ship, ship.location)
+
+    def sector(self, coordinates):
+        """
+        Return a sector (lookup by name)
 
+        If the sector was never saved, it is generated from the world seed
+        """
+        self.load_sector(coordinates)
+        sector = Game._sectors.get(coordinates)
         if not sector:
-            self.log.error("Sector at %s could not be created" % str(coordinates))
+            self.world_log.error("Sector at %s could not be created", coordinates)
             return None
-        self.log.info("Sector at (%s,%s) created" % (str(coordinates.x),str(coordinates.y)))
-        self.log.debug("Returning %s" % (str(sector)))
+        self.world_log.debug("Returning %s", sector)
         return sector
 
     def get_contents(self, coordinates = None):
@@ -439,30 +892,18 @@ class Game(object):
         Return a list of the contents of a sector at the provided coordinates.
         """
         if not coordinates or not isinstance(coordinates,Coordinates):
-            self.log.warning("%s called without proper coordinates: %s (type %s)" % (
+            self.world_log.warning(
+                "%s called without proper coordinates: %s (type %s)",
                 "Game.get_contents()",
-                str(coordinates),
-                str(coordinates.__class__.__name__),
-            ))
+                coordinates,
+                coordinates.__class__.__name__,
+            )
             return []
 
-        contents = []
-        self.log.debug("Building content list for %s..." % str(coordinates))
-        # GameObject -> ManMade or Natural -> Object we want here
-        for parent in GameObject.__subclasses__():
-            self.log.debug("Processing %s objects..." % str(parent))
-            for child in globals()[parent.__name__].__subclasses__():
-                self.log.debug("Processing %s objects under %s..." % (str(child),str(parent)))
-                # subclasses returns full path, ex: objects.star.Star
-                # child.__name__ returns Star
-                shared_object = getattr(Game,'_' + globals()[child.__name__]().plural())
-                if shared_object and coordinates in shared_object:
-                    contents += shared_object[coordinates]
-                    self.log.debug("Added %s to contents: %s" % (
-                        str(globals()[child.__name__]().plural()),
-                        str(shared_object[coordinates]),
-                    ))
-        self.log.debug("Coordinates %s contents: %s" % (str(coordinates),pprint.pformat(contents)))
+        self.load_sector(coordinates)
+        contents = Game._spatial.contents(coordinates)
+        if self.world_log.isEnabledFor(logging.DEBUG):
+            self.world_log.debug("Coordinates %s contents: %s", coordinates, pprint.pformat(contents))
         return contents
 
     def enter(self, id):
@@ -473,6 +914,7 @@ class Game(object):
         # Move the ship to it
         if found_obj:
             ship = self.location(of = self.logged_in_user)
+            self.mark_dirty(ship)
             ship.location = found_obj.id
 
     def leave(self):
@@ -483,6 +925,119 @@ class Game(object):
         location = self.location(of = ship)
         if hasattr(location,'location'):
             ship.location = location.location
+            self.mark_dirty(ship)
+
+    def market(self, item, action = 'sell', radius = 5, count = 1):
+        """
+        Find the ports within radius moves of the current player's ship
+        with the best prices for an item: the highest prices to sell it
+        for, or the lowest to buy it for if action is 'buy'. The best count
+        of them are put in the state, under 'market'.
+        """
+        coordinates = self.market_coordinates(radius)
+        if coordinates is None:
+            return False
+        if item not in Game._economy.columns:
+            self.trade_log.error("market() called for an item ports don't trade (%s)", item)
+            return False
+        if action not in ['buy', 'sell']:
+            self.trade_log.error("market() called with an action of %s, must be buy or sell", action)
+            return False
+        try:
+            count = min(max(int(count), 1), self.market_count_limit)
+        except:
+            self.trade_log.error("market() called with a non-integer count")
+            return False
+        radius = min(int(radius), self.market_radius_limit)
+        side = 'selling' if action == 'buy' else 'buying'
+        found = Game._economy.market.best(item, side, coordinates, radius, limit = count, where = self.market_where())
+        self.market_result = {
+            'item': item,
+            'action': action,
+            'radius': radius,
+            'ports': [self.market_port(coordinates, found_port) for found_port in found],
+        }
+        return True
+
+    def route(self, radius = 5):
+        """
+        Find the most profitable item to buy at one port and sell at another,
+        both within radius moves of the current player's ship, and put it
+        in the state under 'market' (the route is None if no trade makes a
+        profit).
+        """
+        coordinates = self.market_coordinates(radius)
+        if coordinates is None:
+            return False
+        radius = min(int(radius), self.market_radius_limit)
+        route = Game._economy.market.route(Game._economy.commodities, coordinates, radius, where = self.market_where())
+        self.market_result = {'radius': radius, 'route': None}
+        if route:
+            profit, item, bought, sold = route
+            self.market_result['route'] = {
+                'item': item,
+                'profit': profit,
+                'buy': self.market_port(coordinates, bought),
+                'sell': self.market_port(coordinates, sold),
+            }
+        return True
+
+    def market_coordinates(self, radius):
+        """
+        Return the coordinates of the current player's sector for a market
+        query, after loading the blocks of sectors within radius of it (up
+        to market_radius_limit). Return None if the query can't be made.
+
+        When the world is split between shards, only the blocks this shard
+        owns are loaded. Ports in the others are left to their owner, and
+        left out of the query (see market_where()).
+        """
+        coordinates = self.sector_coordinates()
+        if coordinates is None:
+            self.trade_log.error("Market query without a ship in a sector, ignoring...")
+            return None
+        try:
+            radius = int(radius)
+        except:
+            self.trade_log.error("Market query with a non-integer radius, ignoring...")
+            return None
+        if radius < 0:
+            self.trade_log.error("Market query with a radius of %s, ignoring...", radius)
+            return None
+        radius = min(radius, self.market_radius_limit)
+        # Ships only move north, south, east and west, so only the blocks
+        # on the same level are loaded
+        size = Game._generator.block_size
+        for x in xrange((coordinates.x - radius) // size, (coordinates.x + radius) // size + 1):
+            for y in xrange((coordinates.y - radius) // size, (coordinates.y + radius) // size + 1):
+                block = Coordinates(x * size, y * size, coordinates.z)
+                if self.world.owns(block):
+                    self.load_sector(block)
+        return coordinates
+
+    def market_where(self):
+        """
+        Return the filter for the ports a market query finds, None unless
+        the world is split between shards. Then only the ports in sectors
+        this shard owns are found, as the others may be out of date.
+        """
+        if self.world.shard_map is None:
+            return None
+        return self.world.owns
+
+    def market_port(self, coordinates, found):
+        """
+        Return a dictionary for a (price, port, port coordinates) tuple
+        found by a market query from coordinates.
+        """
+        price, port, location = found
+        return {
+            'id': port.id,
+            'name': port.name,
+            'coordinates': location.to_dict(),
+            'distance': Game._spatial.distance(coordinates, location),
+            'price': price,
+        }
 
     def trade(
         self,
@@ -515,30 +1070,31 @@ class Game(object):
             buyer = self.location(of = self.location(of = seller))
             buyer_cargo_location = buyer_cargo_location or buyer
         if buyer is None:
-            self.log.error("trade() could not determine the buyer, aborting trade...")
+            self.trade_log.error("trade() could not determine the buyer, aborting trade...")
             return
         if seller is None:
-            self.log.error("trade() could not determine the seller, aborting trade...")
+            self.trade_log.error("trade() could not determine the seller, aborting trade...")
             return
 
         # Make sure the quantity is valid
         try:
             quantity = int(quantity)
         except:
-            self.log.error("trade() called with a non-integer quantity, aborting trade...")
+            self.trade_log.error("trade() called with a non-integer quantity, aborting trade...")
             return
-        if quantity == 0:
-            self.log.error("trade() called with a quantity of 0, aborting trade...")
+        if quantity <= 0:
+            self.trade_log.error("trade() called with a quantity of %s, aborting trade...", quantity)
             return
 
-        self.log.debug("Initiating trade from %s (cargo to %s) to %s (cargo to %s) for %s of %s..." % (
-            str(seller.name),
-            str(seller_cargo_location.name),
-            str(buyer.name),
-            str(buyer_cargo_location.name),
-            str(quantity),
-            str(item),
-        ))
+        self.trade_log.debug(
+            "Initiating trade from %s (cargo to %s) to %s (cargo to %s) for %s of %s...",
+            seller.name,
+            seller_cargo_location.name,
+            buyer.name,
+            buyer_cargo_location.name,
+            quantity,
+            item,
+        )
 
         # Determine cost of the item
         cost = -1
@@ -546,47 +1102,70 @@ class Game(object):
             try:
                 cost = int(for_what)
             except:
-                self.log.error("trade() called with a non-integer cost, aborting trade...")
+                self.trade_log.error("trade() called with a non-integer cost, aborting trade...")
                 return
         else:
-            cost = (seller.get_price(item)['selling'] if seller.is_business else buyer.get_price(item)['buying']) * quantity
+            business = seller if seller.is_business else buyer
+            cost = business.get_cost(item, quantity, 'selling' if seller.is_business else 'buying')
+            if cost is None:
+                self.trade_log.error("trade() called for an item %s does not trade (%s), aborting trade...", business.name, item)
+                return
 
         # Trade parameters are valid, proceed with trade
         if isinstance(item, str) or isinstance(item, unicode):
             # Assuming item was passed as a commodity id
-            if str(item) in [c.id for c in seller_cargo_location.cargo]:
-                # Seller has the item
-                (item_obj,) = [c for c in seller_cargo_location.cargo if c.id == str(item)]
-                if item_obj.count >= int(quantity):
-                    # Seller has enough of the item, move the item and transfer credits
-                    self._transfer_credits(buyer, seller, cost)
-                    self._move_item(seller_cargo_location, buyer_cargo_location, item_obj, quantity)
+            item_obj = seller_cargo_location.commodity(str(item))
+            # Check everything before changing anything, so a trade either
+            # happens completely or not at all
+            if not item_obj or item_obj.count < quantity:
+                self.trade_log.error(
+                    "trade() called but %s doesn't have %s of %s, aborting trade...",
+                    seller_cargo_location.name,
+                    quantity,
+                    item,
+                )
+                return
+            if buyer.credits < cost:
+                self.trade_log.error(
+                    "trade() called but %s doesn't have enough credits (%s < %s), aborting trade...",
+                    buyer.name,
+                    buyer.credits,
+                    cost,
+                )
+                return
+            self._transfer_credits(buyer, seller, cost)
+            self._move_item(seller_cargo_location, buyer_cargo_location, item_obj, quantity)
+            for obj in set([buyer, seller, buyer_cargo_location, seller_cargo_location]):
+                self.mark_dirty(obj)
+            return True
 
     def _move_item(self, from_location, to_location, item, quantity):
         """
         Move an item from one place to another without exchanging credits.
         """
-        self.log.debug("Moving item %s (quantity %s) from %s to %s" % (
-            str(item.name),
-            str(quantity),
-            str(from_location.name),
-            str(to_location.name),
-        ))
+        self.trade_log.debug(
+            "Moving item %s (quantity %s) from %s to %s",
+            item.name,
+            quantity,
+            from_location.name,
+            to_location.name,
+        )
         if isinstance(item, Commodity):
             if item.count >= int(quantity):
                 # Remove item from from_location
                 item.count -= int(quantity)
                 # Add item to to_location
-                if item.id in [i.id for i in to_location.cargo]:
+                to_item = to_location.commodity(item.id)
+                if to_item:
                     # Item already exists on to_location
-                    (to_item,) = [i for i in to_location.cargo if i.id == item.id]
                     to_item.count += int(quantity)
                 else:
                     # Item needs to be created on to_location
-                    self.log.debug("%s does not have a %s object, creating one" % (
-                        str(to_location.name),
-                        str(item.__class__.__name__),
-                    ))
+                    self.trade_log.debug(
+                        "%s does not have a %s object, creating one",
+                        to_location.name,
+                        item.__class__.__name__,
+                    )
                     to_item = globals()[item.__class__.__name__](count = int(quantity))
                     to_location.cargo.append(to_item)
 
@@ -595,16 +1174,18 @@ class Game(object):
         Transfer a number of credits (amount) from from_obj to to_obj
         """
         if from_obj.credits >= amount:
-            self.log.debug("Transferring %s credits from %s to %s" % (
-                str(amount),
-                str(from_obj.name),
-                str(to_obj.name),
-            ))
+            self.trade_log.debug(
+                "Transferring %s credits from %s to %s",
+                amount,
+                from_obj.name,
+                to_obj.name,
+            )
             from_obj.credits -= amount
             to_obj.credits += amount
         else:
-            self.log.error("_transfer_credits() called but from_obj (%s) doesn't have enough credits (%s < %s)" % (
-                str(from_obj.name),
-                str(from_obj.credits),
-                str(amount),
-            ))
+            self.trade_log.error(
+                "_transfer_credits() called but from_obj (%s) doesn't have enough credits (%s < %s)",
+                from_obj.name,
+                from_obj.credits,
+                amount,
+            )
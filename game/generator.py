@@ -0,0 +1,220 @@
+import numpy
+from objects.coordinates import Coordinates
+from objects.manmade import ManMade
+from objects.commodity import Commodity, Ore, Organics, Equipment
+from objects.sector import Sector
+from objects.star import Star
+from objects.planet import Planet
+from objects.station import Station
+from objects.port import Port
+
+class SectorGenerator(object):
+    """
+    Generate sectors and their contents in bulk.
+
+    The random draws for a whole batch of sectors are made at once with
+    numpy, and objects are copied from a prototype of their class instead
+    of running __init__(), so a sector takes microseconds to generate
+    instead of a few hundred. The result only depends on the random state
+    that is passed in.
+
+    Sectors are generated in square blocks of block_size x block_size
+    sectors, with a random state seeded from the world seed and the block.
+    So a sector is the same every time it is generated, and does not need
+    to be stored until something in it changes.
+    """
+    classes = {
+        'Star': Star,
+        'Planet': Planet,
+        'Station': Station,
+        'Port': Port,
+    }
+
+    def __init__(self, probability, seed = 0, block_size = 4):
+        """
+        probability is the chance of each object (by class name) being
+        generated in a sector, like Game.new_object_probability.
+        """
+        self.probability = probability
+        self.seed = seed
+        self.block_size = block_size
+        self.prototypes = {}
+        self.plurals = {}
+
+    def block(self, coordinates):
+        """
+        Return the (x, y, z) of the block that coordinates are in.
+        """
+        return (
+            coordinates.x // self.block_size,
+            coordinates.y // self.block_size,
+            coordinates.z,
+        )
+
+    def block_coordinates(self, block):
+        """
+        Return the coordinates of every sector in a block.
+        """
+        x, y, z = block
+        return [
+            Coordinates(x * self.block_size + i, y * self.block_size + j, z)
+            for i in xrange(self.block_size)
+            for j in xrange(self.block_size)
+        ]
+
+    def generate_block(self, block):
+        """
+        Generate every sector in a block, like generate().
+        """
+        random_state = numpy.random.RandomState([self.seed & 0xffffffff] + [value & 0xffffffff for value in block])
+        return self.generate(self.block_coordinates(block), random_state)
+
+    def generate(self, coordinates, random_state):
+        """
+        Generate a sector at each of a list of coordinates.
+
+        Return a dictionary of shared object name (like 'sectors' or
+        'ports') to a dictionary of coordinates to what is there, in the
+        same form as the shared objects on Game.
+        """
+        generated = {}
+        sectors = {}
+        numbers = random_state.randint(0, 1001, len(coordinates))
+        ids = self.ids(len(coordinates), random_state)
+        for index, location in enumerate(coordinates):
+            sectors[location] = self.build(
+                Sector,
+                name = 'M-' + str(numbers[index]),
+                id = ids[index],
+            )
+        generated[self.plural(Sector)] = sectors
+
+        # Sorted, so the draws are made in the same order every time
+        for object_name in sorted(self.probability):
+            cls = self.classes[object_name]
+            # Another object is added to a sector with this probability
+            # each time one is added, so the count is geometric
+            counts = random_state.geometric(1 - self.probability[object_name], len(coordinates)) - 1
+            total = int(counts.sum())
+            names = self.names(cls, total, random_state)
+            ids = self.ids(total, random_state)
+            cargo = self.cargo(cls, total, random_state)
+            objects = {}
+            created = 0
+            for index in numpy.flatnonzero(counts):
+                location = coordinates[index]
+                objects[location] = []
+                for i in xrange(created, created + counts[index]):
+                    objects[location].append(self.build(
+                        cls,
+                        name = names[i],
+                        id = ids[i],
+                        location = location,
+                        cargo = cargo[i] if cargo else [],
+                    ))
+                created += counts[index]
+            generated[self.plural(cls)] = objects
+        return generated
+
+    def records(self, generated):
+        """
+        Return the (name, key, value) records for the result of generate()
+        and the (id, name, key) of the objects that can be found by id,
+        like Game.records().
+        """
+        records = []
+        ids = []
+        for name, shared_dict in generated.iteritems():
+            for key, value in shared_dict.iteritems():
+                records.append((name, key, value))
+                for obj in (value if isinstance(value, list) else [value]):
+                    if isinstance(obj, ManMade):
+                        ids.append((obj.id, name, key))
+        return records, ids
+
+    def build(self, cls, **attributes):
+        """
+        Return a new cls with the attributes of its prototype, updated with
+        attributes.
+        """
+        obj = cls.__new__(cls)
+        obj.__dict__.update(self.prototype(cls))
+        obj.__dict__.update(attributes)
+        return obj
+
+    def plural(self, cls):
+        """
+        Return the plural of cls, like cls().plural().
+        """
+        if cls not in self.plurals:
+            self.plurals[cls] = cls().plural()
+        return self.plurals[cls]
+
+    def prototype(self, cls):
+        """
+        Return the attributes of a new cls.
+        """
+        if cls not in self.prototypes:
+            if issubclass(cls, Commodity):
+                self.prototypes[cls] = cls().__getstate__()
+            else:
+                self.prototypes[cls] = cls(name = cls.__name__, id = cls.__name__).__getstate__()
+        return self.prototypes[cls]
+
+    def ids(self, count, random_state):
+        """
+        Return count random uuids drawn from random_state.
+        """
+        data = numpy.frombuffer(random_state.bytes(16 * count), dtype = numpy.uint8).reshape(count, 16).copy()
+        # Set the version (4) and variant bits, like uuid.uuid4()
+        data[:, 6] = (data[:, 6] & 0x0f) | 0x40
+        data[:, 8] = (data[:, 8] & 0x3f) | 0x80
+        hexadecimal = data.tostring().encode('hex')
+        return [
+            '-'.join((h[0:8], h[8:12], h[12:16], h[16:20], h[20:32]))
+            for h in (hexadecimal[i:i + 32] for i in xrange(0, 32 * count, 32))
+        ]
+
+    def names(self, cls, count, random_state):
+        """
+        Return count names for objects of cls, like cls.generate_name().
+        """
+        if cls.names:
+            return [cls.names[i] for i in random_state.randint(0, len(cls.names), count)]
+        return ["%s %s" % (cls.name_prefix, number) for number in random_state.randint(100, 1000, count)]
+
+    def cargo(self, cls, count, random_state):
+        """
+        Return the cargo for count objects of cls, or None if they start
+        with no cargo.
+
+        Ports fill between 20% and all of their holds with ore, organics
+        and equipment, like Port.post_init_hook().
+        """
+        if cls is not Port:
+            return None
+        holds = self.prototype(cls)['holds']
+        holds_to_fill = random_state.randint(int(holds * 0.2), holds + 1, count)
+        counts = []
+        for item in xrange(3):
+            # randint(0, holds_to_fill) for every port at once
+            filled = holds_to_fill - numpy.floor(random_state.random_sample(count) * (holds_to_fill + 1)).astype(int)
+            holds_to_fill -= filled
+            counts.append(filled)
+        return [
+            [self.build_item(Ore, ore), self.build_item(Organics, org), self.build_item(Equipment, equ)]
+            for ore, org, equ in zip(*[filled.tolist() for filled in counts])
+        ]
+
+    def build_item(self, cls, count):
+        """
+        Return a new Commodity of cls with count items, like build().
+        """
+        item = cls.__new__(cls)
+        object.__setattr__(item, '_cell', None)
+        for name, value in self.prototype(cls).iteritems():
+            object.__setattr__(item, name, value)
+        object.__setattr__(item, 'count', count)
+        object.__setattr__(item, '_version', 0)
+        object.__setattr__(item, '_price', None)
+        return item
@@ -0,0 +1,73 @@
+import os
+import yaml
+
+class Journal(object):
+    """
+    An append-only log of changes to the shared objects.
+
+    Each record is a YAML document holding the name of a shared object, the
+    key that changed and the new value stored at that key. Values are
+    complete, so replaying the records in order on top of the last snapshot
+    rebuilds the shared objects, and replaying a record twice is harmless.
+    """
+    def __init__(self, filename, log = None):
+        self.log = log
+        self.filename = filename
+        self.compacting_filename = filename + '.compacting'
+        self.records = 0
+        self._file = open(self.filename, 'a')
+
+    def append(self, records):
+        """
+        Append a list of (name, key, value) records to the journal.
+        """
+        for name, key, value in records:
+            self._file.write(yaml.dump(
+                {'object': name, 'key': key, 'value': value},
+                default_flow_style = False,
+                explicit_start = True,
+            ))
+        self._file.flush()
+        self.records += len(records)
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def compacting(self):
+        """Return True if a rotated journal is waiting to be compacted."""
+        return os.path.isfile(self.compacting_filename)
+
+    def rotate(self):
+        """
+        Move the current journal aside and start a new one.
+
+        The rotated journal must be deleted once a snapshot that includes
+        all of its records has been written (see Game.compact()).
+        """
+        self._file.close()
+        os.rename(self.filename, self.compacting_filename)
+        self._file = open(self.filename, 'a')
+        self.records = 0
+
+    def replay(self):
+        """
+        Yield (name, key, value) records, oldest first.
+
+        A rotated journal that was never compacted is replayed before the
+        current one. Replay stops at the first record that can't be read,
+        since that is where the server stopped writing.
+        """
+        for filename in [self.compacting_filename, self.filename]:
+            if not os.path.isfile(filename):
+                continue
+            try:
+                for record in yaml.load_all(open(filename), Loader = yaml.Loader):
+                    if record:
+                        yield record['object'], record['key'], record['value']
+            except yaml.YAMLError as e:
+                if self.log:
+                    self.log.warning("Journal %s ends with an incomplete record, skipping the rest: %s" % (
+                        str(filename),
+                        str(e),
+                    ))
@@ -0,0 +1,169 @@
+"""
+The prices of the items of every port in memory, sorted, so the best
+price near some coordinates is found without looking at every port.
+
+Sectors are bucketed into cubic cells of cell_size sectors, like in the
+spatial index. Each cell has a sorted list for each commodity of the
+ports selling it (cheapest first) and another of the ports buying it
+(highest price first). A query only looks at the cells its radius
+overlaps, and in each of them at the first entries, so it takes about
+the same time however many ports there are. Updating a port takes a
+binary search in the lists of its cell.
+
+The economy keeps the index up to date (see Economy.add() and
+Economy.set_count()), so every trade is in it straight away. Restocks
+are added a slice at a time by the ticker (see Economy.reprice()).
+"""
+
+import bisect
+from objects.coordinates import Coordinates
+
+class MarketIndex(object):
+    # Ports sell items to players (cheapest is best) and buy items from
+    # them (highest price is best)
+    sides = ['selling', 'buying']
+
+    def __init__(self, cell_size = 16):
+        self.cell_size = cell_size
+        # Sorted lists of (key, port id) by (item id, side) and cell. The
+        # key is the price, or minus the price for the buying side.
+        self._lists = {}
+        # The port and its coordinates, by port id
+        self._ports = {}
+        # The cell, selling key and buying key of each item of each port,
+        # by (port id, item id), to find its entries again. The selling key
+        # is None for items the port has none of.
+        self._entries = {}
+
+    def cell(self, coordinates):
+        return (
+            coordinates.x // self.cell_size,
+            coordinates.y // self.cell_size,
+            coordinates.z // self.cell_size,
+        )
+
+    def cells(self, coordinates, radius):
+        """
+        Return the cells overlapping the box radius sectors around
+        coordinates, the closest first. Most of the ports in the closest
+        cells are within the radius, so searching them first finds a good
+        price to stop searching the others at sooner.
+        """
+        home = self.cell(coordinates)
+        low = self.cell(Coordinates(coordinates.x - radius, coordinates.y - radius, coordinates.z - radius))
+        high = self.cell(Coordinates(coordinates.x + radius, coordinates.y + radius, coordinates.z + radius))
+        cells = [
+            (cx, cy, cz)
+            for cx in xrange(low[0], high[0] + 1)
+            for cy in xrange(low[1], high[1] + 1)
+            for cz in xrange(low[2], high[2] + 1)
+        ]
+        cells.sort(key = lambda cell: abs(cell[0] - home[0]) + abs(cell[1] - home[1]) + abs(cell[2] - home[2]))
+        return cells
+
+    def __len__(self):
+        return len(self._ports)
+
+    def update(self, port, items = None):
+        """
+        Add a port to the index, or index its prices again after they
+        changed. Only the items with an id in items are indexed, if it is
+        provided.
+
+        Ports sell the items they have some of, and buy every item they
+        stock. Ports that are not in a sector are skipped.
+        """
+        coordinates = port.location
+        if not isinstance(coordinates, Coordinates):
+            return
+        cell = self.cell(coordinates)
+        self._ports[port.id] = (port, coordinates)
+        for item in port.cargo:
+            if items is not None and item.id not in items:
+                continue
+            price = port.get_price(item.id)
+            entry = (cell, price['selling'] if item.count > 0 else None, -price['buying'])
+            old = self._entries.get((port.id, item.id))
+            if old == entry:
+                continue
+            if old is not None:
+                self._unlist(port.id, item.id, old)
+            for side, key in zip(self.sides, entry[1:]):
+                if key is not None:
+                    entries = self._lists.setdefault((item.id, side), {}).setdefault(cell, [])
+                    bisect.insort(entries, (key, port.id))
+            self._entries[(port.id, item.id)] = entry
+
+    def remove(self, port):
+        """Remove a port from the index."""
+        if self._ports.pop(port.id, None) is None:
+            return
+        for item in port.cargo:
+            old = self._entries.pop((port.id, item.id), None)
+            if old is not None:
+                self._unlist(port.id, item.id, old)
+
+    def _unlist(self, port_id, item_id, entry):
+        cell = entry[0]
+        for side, key in zip(self.sides, entry[1:]):
+            if key is None:
+                continue
+            cells = self._lists[(item_id, side)]
+            entries = cells[cell]
+            del entries[bisect.bisect_left(entries, (key, port_id))]
+            if not entries:
+                del cells[cell]
+
+    def best(self, item_id, side, coordinates, radius, limit = 1, where = None):
+        """
+        Return a list of up to limit (price, port, coordinates) tuples for
+        the ports with the best prices for an item within radius moves of
+        coordinates, best first.
+
+        side is 'selling' for the ports selling the item (cheapest first),
+        or 'buying' for the ports buying it (highest first). Distances are
+        Manhattan distances, like in SpatialIndex.within(). If where is
+        provided, only the ports whose coordinates it returns True for are
+        found.
+        """
+        cells = self._lists.get((item_id, side))
+        if not cells or limit < 1:
+            return []
+        found = []
+        for cell in self.cells(coordinates, radius):
+            for entry in cells.get(cell, ()):
+                if len(found) == limit and entry >= found[-1]:
+                    # Everything else in this cell is worse
+                    break
+                location = self._ports[entry[1]][1]
+                if (
+                    abs(location.x - coordinates.x) +
+                    abs(location.y - coordinates.y) +
+                    abs(location.z - coordinates.z)
+                ) <= radius and (where is None or where(location)):
+                    bisect.insort(found, entry)
+                    del found[limit:]
+        sign = 1 if side == 'selling' else -1
+        return [(key * sign,) + self._ports[port_id] for key, port_id in found]
+
+    def route(self, item_ids, coordinates, radius, where = None):
+        """
+        Return the most profitable trade within radius moves of coordinates,
+        buying one of the items at one port and selling it at another, as
+        (profit per item, item id, (price, port, coordinates) bought from,
+        (price, port, coordinates) sold to), or None if no trade makes a
+        profit. where filters the ports like in best().
+        """
+        route = None
+        for item_id in item_ids:
+            # The best two of each side, in case the best port is the same
+            sellers = self.best(item_id, 'selling', coordinates, radius, limit = 2, where = where)
+            buyers = self.best(item_id, 'buying', coordinates, radius, limit = 2, where = where)
+            for seller in sellers:
+                for buyer in buyers:
+                    if seller[1] is buyer[1]:
+                        continue
+                    profit = buyer[0] - seller[0]
+                    if profit > 0 and (route is None or profit > route[0]):
+                        route = (profit, item_id, seller, buyer)
+        return route
@@ -0,0 +1,155 @@
+"""
+Counters, gauges and histograms for watching a running server.
+
+Each metric has a name and optional labels, like
+histogram('dispatch_seconds', command = 'move'). Gauges are functions
+that are called when the metrics are read, so they cost nothing in
+between. Metrics can be read as a dictionary (for JSON) or as text in
+the Prometheus exposition format.
+"""
+
+import bisect
+import time
+from contextlib import contextmanager
+
+class Histogram(object):
+    """
+    Counts of values in buckets that grow geometrically from smallest to
+    largest, with per_doubling buckets each time the value doubles.
+    Percentiles are the upper bound of the bucket they fall in, so they
+    are at most 2 ** (1 / per_doubling) too high.
+    """
+    def __init__(self, smallest = 1e-6, largest = 100, per_doubling = 4):
+        self.bounds = []
+        bound = smallest
+        while bound < largest:
+            self.bounds.append(bound)
+            bound *= 2 ** (1.0 / per_doubling)
+        self.bounds.append(bound)
+        # The last bucket is for values larger than every bound
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                if index < len(self.bounds):
+                    return min(self.bounds[index], self.max)
+                return self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'max': self.max,
+            'p50': self.percentile(0.50),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+        }
+
+class Metrics(object):
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        # Bucket options of the histograms that are not for seconds
+        self.buckets = {}
+
+    @staticmethod
+    def key(name, labels):
+        return (name, tuple(sorted(labels.iteritems())))
+
+    def increment(self, name, amount = 1, **labels):
+        key = self.key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name, function, **labels):
+        """Read the gauge by calling function whenever metrics are read."""
+        self.gauges[self.key(name, labels)] = function
+
+    def define(self, name, **buckets):
+        """
+        Set the bucket options (see Histogram) of the histograms called
+        name, for histograms that are not for seconds.
+        """
+        self.buckets[name] = buckets
+
+    def histogram(self, name, **labels):
+        """
+        Return the histogram for name and labels, created if it does not
+        exist yet.
+        """
+        key = self.key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(**self.buckets.get(name, {}))
+        return histogram
+
+    def observe(self, name, value, **labels):
+        self.histogram(name, **labels).observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the seconds spent in a with block."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, **labels)
+
+    def read_gauges(self):
+        return dict((key, function()) for key, function in self.gauges.iteritems())
+
+    def to_dict(self):
+        def entry(key, value):
+            name, labels = key
+            return dict(labels, name = name, value = value)
+        return {
+            'uptime_seconds': time.time() - self.started,
+            'counters': [entry(key, value) for key, value in sorted(self.counters.iteritems())],
+            'gauges': [entry(key, value) for key, value in sorted(self.read_gauges().iteritems())],
+            'histograms': [
+                entry(key, histogram.to_dict())
+                for key, histogram in sorted(self.histograms.iteritems())
+            ],
+        }
+
+    def to_text(self):
+        lines = ["uptime_seconds %s" % repr(time.time() - self.started)]
+        for (name, labels), value in sorted(self.counters.iteritems()):
+            lines.append("%s%s %s" % (name, format_labels(labels), repr(value)))
+        for (name, labels), value in sorted(self.read_gauges().iteritems()):
+            lines.append("%s%s %s" % (name, format_labels(labels), repr(value)))
+        for (name, labels), histogram in sorted(self.histograms.iteritems()):
+            for quantile in [0.5, 0.95, 0.99]:
+                value = histogram.percentile(quantile)
+                lines.append("%s%s %s" % (
+                    name,
+                    format_labels(labels + (('quantile', str(quantile)),)),
+                    'NaN' if value is None else repr(value),
+                ))
+            lines.append("%s_sum%s %s" % (name, format_labels(labels), repr(histogram.sum)))
+            lines.append("%s_count%s %s" % (name, format_labels(labels), repr(histogram.count)))
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (key, value) for key, value in labels)
@@ -0,0 +1,45 @@
+#!/usr/bin/python
+
+import argparse
+import logging
+import os
+from game import Game
+from store import SqliteStore
+
+def migrate(data_dir, log):
+    """
+    Copy the YAML snapshot and journal in data_dir into a sqlite store.
+    """
+    game = Game(data_dir = data_dir, log = log)
+    filename = os.path.join(game.data_dir, Game.store_filename)
+    log.info("Migrating YAML data in %s to %s..." % (str(game.data_dir), str(filename)))
+    store = SqliteStore(filename, log = log)
+    keys = []
+    for obj in game.shared_objects:
+        keys += [(obj, key) for key in getattr(Game, '_' + obj).keys()]
+    records, ids = game.records(keys)
+    store.put(records, ids)
+    store.close()
+    log.info("Migrated %s records (%s objects found by id)" % (str(len(records)), str(len(ids))))
+
+if __name__ == "__main__":
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Migrate YAML game data to the sqlite store.')
+    parser.add_argument('-d','--debug', action='store_true', help='Enable debug logging')
+    parser.add_argument('--data-dir', default='data', help='Data directory to migrate, default is data')
+    parser.add_argument('--version', action='version', version='0')
+    args = parser.parse_args()
+
+    # Setup logging options
+    log_level = logging.DEBUG if args.debug else logging.INFO
+    log = logging.getLogger(os.path.basename(__file__))
+    log.setLevel(log_level)
+    formatter = logging.Formatter('%(asctime)s:%(name)s:%(levelname)s:%(funcName)s(%(lineno)i):%(message)s')
+
+    ## Console Logging
+    ch = logging.StreamHandler()
+    ch.setLevel(log_level)
+    ch.setFormatter(formatter)
+    log.addHandler(ch)
+
+    migrate(args.data_dir, log)
@@ -1,8 +1,12 @@
 import yaml
 import uuid
-import pprint
 from copy import deepcopy
-from random import randint
+from itertools import count
+from random import choice, randint
+from objects.pricing import LinearPricingCurve
+
+# Every change to an Entity takes the next number from here as its version
+_versions = count(1)
 
 class Entity(yaml.YAMLObject):
     """The lowest level base object.
@@ -11,6 +15,11 @@ class Entity(yaml.YAMLObject):
     """
     __metaclass__ = yaml.YAMLObjectMetaclass
 
+    # Attributes starting with _ are internal. They don't change the
+    # version, and are not saved or sent to clients.
+    _version = 0
+    _dict_cache = None
+
     def __init__(self):
         super(Entity,self).__init__()
         # Call byteify to make sure all unicode variables are saved as strings
@@ -43,18 +52,51 @@ class Entity(yaml.YAMLObject):
         return result
 
     def __repr__(self):
-        return str(pprint.pformat(self.__dict__))
+        return "<%s %s>" % (self.__class__.__name__, getattr(self, 'name', '') or '')
 
     # This method is used by json.dumps() when sending it to a client
     def __str__(self):
         return str(self.__dict__)
 
+    def __setattr__(self, name, value):
+        if name[0] != '_':
+            object.__setattr__(self, '_version', next(_versions))
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        if name[0] != '_':
+            object.__setattr__(self, '_version', next(_versions))
+        object.__delattr__(self, name)
+
+    def __getstate__(self):
+        """Return the attributes to save (in yaml or pickle)."""
+        return dict((key, value) for key, value in self.__dict__.iteritems() if key[0] != '_')
+
+    def version(self):
+        """
+        Return a value that changes whenever this object changes.
+        """
+        return self._version
+
     def plural(self, capitalized = False):
         """Return the plural form of this object."""
         return self.__class__.__name__.lower() + "s"
 
     def to_dict(self):
-        return deepcopy(self.__dict__)
+        """
+        Return this object as a dictionary.
+
+        The dictionary is cached until the object's version changes, so it
+        is shared between callers and must not be modified.
+        """
+        version = self.version()
+        if self._dict_cache is None or self._dict_cache[0] != version:
+            self._dict_cache = (version, self.build_dict())
+        return self._dict_cache[1]
+
+    def build_dict(self):
+        """Return a new dictionary of this object for to_dict()."""
+        return deepcopy(self.__getstate__())
 
 class NamedEntity(Entity):
     """The base class for anything in the game that has a name and ID.
@@ -72,6 +114,18 @@ class NamedEntity(Entity):
 class GameObject(NamedEntity):
     yaml_tag = "!GameObject"
 
+    # How businesses price the items in their cargo
+    pricing_curve = LinearPricingCurve()
+
+    # Generated names are chosen from names if it is set, otherwise they
+    # are name_prefix followed by a number from 100 to 999
+    names = None
+    name_prefix = "Object"
+
+    # Cargo items by id, see commodity()
+    _cargo_table = None
+    _cargo_table_key = None
+
     def __init__(
         self,
         name = None,
@@ -109,15 +163,22 @@ class GameObject(NamedEntity):
         """Function to be run after __init__()."""
         pass
 
-    def to_dict(self):
-        """Override to_dict to handle subobjects."""
-        result = super(GameObject,self).to_dict()
-        if isinstance(self.location,Entity):
+    def version(self):
+        """
+        Return a value that changes whenever this object or its cargo
+        changes.
+        """
+        return (self._version, tuple(item.version() for item in self.cargo))
+
+    def build_dict(self):
+        """Override build_dict to handle subobjects."""
+        result = super(GameObject,self).build_dict()
+        if hasattr(self.location, 'to_dict'):
             result['location'] = self.location.to_dict()
         if self.cargo:
             result['cargo'] = []
             for item in self.cargo:
-                item_dict = item.to_dict()
+                item_dict = dict(item.to_dict())
 
                 # Only determine price for businesses
                 if self.is_business:
@@ -129,34 +190,52 @@ class GameObject(NamedEntity):
         """
         Return a randomly generated name for this object.
         """
-        return "Object %s%s%s" % (
+        if self.names:
+            return choice(self.names)
+        return "%s %s%s%s" % (
+            self.name_prefix,
             str(randint(1,9)),
             str(randint(0,9)),
             str(randint(0,9)),
         )
 
+    def commodity(self, item_id):
+        """
+        Return the item in cargo with this id, or None if there isn't one.
+        """
+        key = (self._version, len(self.cargo))
+        if self._cargo_table_key != key:
+            self._cargo_table = dict((item.id, item) for item in self.cargo)
+            self._cargo_table_key = key
+        return self._cargo_table.get(item_id)
+
     def get_price(self, item_id):
         """
         Return a price for a given item (in the cargo of this object).
 
-        The price returned is a dictionary with 'buying' and 'selling' costs with respect to this object.
-
-        Price is determined by the equation y=mx + b, where m is the slope and b is the y-intercept.
+        The price returned is a dictionary with 'buying' and 'selling' costs with respect to this object,
+        as determined by pricing_curve. It is only recalculated when the count of the item changes. The
+        dictionary is shared and must not be modified.
 
-        x is the percentage of the total cargo capacity taken up by the item (between 0 and 1)
-        y is the variance on the average value of the item (+/- 50%)
-
-        Given two points (x1,y1) and (x2,y2):
+        Return None if the item is not in the cargo of this object.
+        """
+        item = self.commodity(item_id)
+        if item is None:
+            return None
+        key = (item.count, self.holds, self.pricing_curve)
+        if item._price is None or item._price[0] != key:
+            item._price = (key, self.pricing_curve.price(item.value, item.count, float(self.holds)))
+        return item._price[1]
+
+    def get_cost(self, item_id, quantity, side):
+        """
+        Return the total cost of quantity of an item (in the cargo of this
+        object) that this object sells if side is 'selling', or buys if it
+        is 'buying', priced one at a time by pricing_curve.
 
-          m = (y2 - y1) / (x2 - x1)
+        Return None if the item is not in the cargo of this object.
         """
-        point1 = (0,-0.5)
-        point2 = (1,0.5)
-        (item,) = [i for i in self.cargo if i.id == item_id]
-        m = float(point2[1] - point1[1]) / float(point2[0] - point1[0])
-        b = point1[1] - (m * point1[0])
-        x = float(item.count) / float(self.holds)
-        return {
-            'selling': item.value * (1 - ((m * x) + b)),
-            'buying': item.value * (1 + ((m * x) + b)),
-        }
+        item = self.commodity(item_id)
+        if item is None:
+            return None
+        return self.pricing_curve.cost(item.value, item.count, float(self.holds), quantity, side)
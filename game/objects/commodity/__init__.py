@@ -1,7 +1,19 @@
 import uuid
-from objects import NamedEntity
+import yaml
+from objects import _versions
 
-class Commodity(NamedEntity):
+class Commodity(yaml.YAMLObject):
+    """
+    A stack of one kind of item in the cargo of a ship, port or other object.
+
+    There is one of these for every cargo slot in the universe, so they are
+    kept small by storing their attributes in slots.
+
+    The items of the ports in memory keep their count in the economy
+    instead (see economy.py), which sets _cell to (economy, row, column).
+    """
+    __metaclass__ = yaml.YAMLObjectMetaclass
+    __slots__ = ('name', 'id', 'value', '_count', '_cell', '_version', '_price')
     yaml_tag = "!Commodity"
 
     def __init__(
@@ -11,33 +23,110 @@ class Commodity(NamedEntity):
         value = 0,
         count = 0,
     ):
+        # (count, holds, curve) and the price of this item, set by the
+        # GameObject holding it (see GameObject.get_price())
+        self._price = None
+        self._cell = None
         self.name = name
-        self.id = id or str(uuid.uuid4())
+        self.id = id
         self.value = value
         self.count = count
 
-        # Parent init should be called at end of __init__
-        super(Commodity,self).__init__(name = name, id = id)
-
         self.post_init_hook()
 
+        # Subclasses set their own id in post_init_hook()
+        if self.id is None:
+            self.id = str(uuid.uuid4())
+
     def post_init_hook(self):
         """Function to be run after __init__()."""
         pass
 
+    @property
+    def count(self):
+        if self._cell is None:
+            return self._count
+        economy, row, column = self._cell
+        return int(economy.counts[row, column])
+
+    @count.setter
+    def count(self, count):
+        if self._cell is None:
+            self._count = count
+        else:
+            economy, row, column = self._cell
+            economy.set_count(row, column, count)
+
+    def __setattr__(self, name, value):
+        if name[0] != '_':
+            object.__setattr__(self, '_version', next(_versions))
+        object.__setattr__(self, name, value)
+
+    def __getstate__(self):
+        """Return the attributes to save (in yaml or pickle)."""
+        return {
+            'name': self.name,
+            'id': self.id,
+            'value': self.value,
+            'count': self.count,
+        }
+
+    def __setstate__(self, state):
+        self._price = None
+        self._cell = None
+        for key, value in state.iteritems():
+            setattr(self, key, value)
+
+    @classmethod
+    def to_yaml(cls, dumper, data):
+        return dumper.represent_mapping(cls.yaml_tag, data.__getstate__())
+
+    @classmethod
+    def from_yaml(cls, loader, node):
+        data = cls.__new__(cls)
+        data.__setstate__(loader.construct_mapping(node))
+        return data
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.name)
+
+    def __str__(self):
+        return str(self.__getstate__())
+
+    def version(self):
+        """
+        Return a value that changes whenever this item changes.
+        """
+        if self._cell is None:
+            return self._version
+        economy, row, column = self._cell
+        return (self._version, int(economy.versions[row]))
+
+    def to_dict(self):
+        return self.__getstate__()
+
 class Ore(Commodity):
+    __slots__ = ()
+    yaml_tag = "!Ore"
+
     def post_init_hook(self):
         self.name = "Fuel Ore"
         self.id = "ore"
         self.value = 10
 
 class Organics(Commodity):
+    __slots__ = ()
+    yaml_tag = "!Organics"
+
     def post_init_hook(self):
         self.name = "Organics"
         self.id = "organics"
         self.value = 20
 
 class Equipment(Commodity):
+    __slots__ = ()
+    yaml_tag = "!Equipment"
+
     def post_init_hook(self):
         self.name = "Equipment"
         self.id = "equipment"
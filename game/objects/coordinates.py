@@ -1,13 +1,15 @@
-import uuid
-from objects import Entity
+import yaml
 
-class Coordinates(Entity):
+class Coordinates(yaml.YAMLObject):
     """
     A Hashable set of coordinates that can be used as a dictionary key.
 
-    This inherits from Entity since it has no name or id (it essentially acts
-    as an id for other objects).
+    Coordinates are immutable values with no name or id (they essentially
+    act as an id for other objects). They are stored in slots with a cached
+    hash, since there is one for every sector and every move creates one.
     """
+    __metaclass__ = yaml.YAMLObjectMetaclass
+    __slots__ = ('x', 'y', 'z', '_hash')
     yaml_tag = "!Coordinates"
 
     def __init__(
@@ -16,12 +18,26 @@ class Coordinates(Entity):
         y = 0,
         z = 0,
     ):
-        self.x = int(x)
-        self.y = int(y)
-        self.z = int(z)
+        object.__setattr__(self, 'x', int(x))
+        object.__setattr__(self, 'y', int(y))
+        object.__setattr__(self, 'z', int(z))
+        object.__setattr__(self, '_hash', hash((self.x, self.y, self.z)))
 
-        # Parent init should be called at end of __init__
-        super(Coordinates,self).__init__()
+    def __setattr__(self, name, value):
+        raise AttributeError("Coordinates can't be modified")
+
+    def __reduce__(self):
+        return (Coordinates, (self.x, self.y, self.z))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    @classmethod
+    def to_yaml(cls, dumper, data):
+        return dumper.represent_mapping(cls.yaml_tag, data.to_dict())
 
     @classmethod
     def from_yaml(cls, loader, node):
@@ -33,13 +49,22 @@ class Coordinates(Entity):
         )
 
     def __eq__(self, other):
-        return other and self.x == other.x and self.y == other.y and self.z == other.z
+        return isinstance(other, Coordinates) and self.x == other.x and self.y == other.y and self.z == other.z
 
     def __ne__(self,other):
         return not self.__eq__(other)
 
     def __hash__(self):
-        return hash((self.x, self.y, self.z))
+        return self._hash
+
+    def __repr__(self):
+        return "Coordinates(%s, %s, %s)" % (self.x, self.y, self.z)
+
+    def __str__(self):
+        return str(self.to_dict())
+
+    def to_dict(self):
+        return {'x': self.x, 'y': self.y, 'z': self.z}
 
     def adjacent(self, cardinal_direction):
         if cardinal_direction.lower() == 'n':
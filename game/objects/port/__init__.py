@@ -1,23 +1,27 @@
-from random import choice, randint
+from random import randint
 from objects.manmade import ManMade
 import objects.commodity as commodity
 
 class Port(ManMade):
     yaml_tag = "!Port"
+    name_prefix = "Port"
 
-    def generate_name(self):
-        """
-        Return a randomly generated name for this object.
-        """
-        return "Port %s%s%s" % (
-            str(randint(1,9)),
-            str(randint(0,9)),
-            str(randint(0,9)),
-        )
+    # Fraction of the difference between the count of an item and its
+    # equilibrium that is produced (or consumed) per second, see
+    # Economy.restock(). The equilibrium is the cargo the port had when it
+    # was first loaded, as a dictionary of item id to count. It is set by
+    # the economy, and saved with the port but not sent to clients.
+    restock_rate = 0.01
+    _equilibrium = None
+
+    # Credits a new port has to buy items from players with
+    starting_credits = 10000
 
     def post_init_hook(self):
         self.dockable = True
         self.is_business = True
+        if not self.credits:
+            self.credits = self.starting_credits
 
         # If cargo is empty, then populate with some commodities
         if not self.cargo:
@@ -33,3 +37,21 @@ class Port(ManMade):
             equ = holds_to_fill - randint(0,holds_to_fill)
             holds_to_fill -= equ
             self.cargo.append(commodity.Equipment(count=equ))
+
+    def __getstate__(self):
+        """Return the attributes to save, with the equilibrium."""
+        state = super(Port, self).__getstate__()
+        if self._equilibrium is not None:
+            state['equilibrium'] = self._equilibrium
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        self._equilibrium = state.pop('equilibrium', None)
+        self.__dict__.update(state)
+
+    def build_dict(self):
+        """Override build_dict to leave out the equilibrium."""
+        result = super(Port, self).build_dict()
+        result.pop('equilibrium', None)
+        return result
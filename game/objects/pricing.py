@@ -0,0 +1,66 @@
+class PricingCurve(object):
+    """
+    Decides what a business pays and charges for a commodity.
+
+    Subclasses implement variance(), which returns how far from its
+    average value an item is priced, given how full the business is of it.
+
+    Each item is priced at how full the business is of it while it has
+    the item: one it sells at the count before it goes, one it buys at the
+    count after it comes in, for spread less. So prices fall as a business
+    fills up, it never pays more for an item than it sells it for, and
+    buying items from it and selling them back (or the other way around)
+    loses spread of what they cost, however many are traded.
+    """
+    # Fraction of the selling price a business keeps when it buys
+    spread = 0.05
+
+    def variance(self, x):
+        """
+        Return the variance on the average value of an item (y), where x
+        is the percentage of the total cargo capacity taken up by the item
+        (between 0 and 1).
+        """
+        raise NotImplementedError
+
+    def price(self, value, count, holds):
+        """
+        Return a dictionary with the 'selling' cost of the next item with
+        an average value of value a business with count of them in holds
+        (a float) sells, and the 'buying' cost of the next one it buys.
+        The arguments can be numpy arrays.
+        """
+        return {
+            'selling': value * (1 - self.variance(count / holds)),
+            'buying': value * (1 - self.variance((count + 1) / holds)) * (1 - self.spread),
+        }
+
+    def cost(self, value, count, holds, quantity, side):
+        """
+        Return the total cost of quantity items traded one after another
+        by a business with count of them, selling them if side is
+        'selling' or buying them if it is 'buying'.
+        """
+        if side == 'selling':
+            counts = xrange(count - quantity + 1, count + 1)
+        else:
+            counts = xrange(count, count + quantity)
+        return sum(self.price(value, item_count, holds)[side] for item_count in counts)
+
+class LinearPricingCurve(PricingCurve):
+    """
+    Price is determined by the equation y=mx + b, where m is the slope and
+    b is the y-intercept.
+
+    Given two points (x1,y1) and (x2,y2):
+
+      m = (y2 - y1) / (x2 - x1)
+
+    The default points give a variance of +/- 50%.
+    """
+    def __init__(self, point1 = (0,-0.5), point2 = (1,0.5)):
+        self.m = float(point2[1] - point1[1]) / float(point2[0] - point1[0])
+        self.b = point1[1] - (self.m * point1[0])
+
+    def variance(self, x):
+        return (self.m * x) + self.b
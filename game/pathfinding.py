@@ -0,0 +1,84 @@
+"""
+Routes between sectors, for the autopilot (see Game.autopilot()).
+
+find_path() is A* over the sectors. The moves out of a sector and what
+each costs are functions passed to it, so obstacles or warp lanes only
+need new functions. By default ships move one sector north, south, east
+or west at a time, each costing one move, and nothing is in the way.
+"""
+
+import heapq
+from itertools import count
+
+def adjacent(coordinates):
+    """Return the sectors one move north, south, east and west."""
+    return [coordinates.adjacent(direction) for direction in ['n','s','e','w']]
+
+def one_move(a, b):
+    return 1
+
+def distance(a, b):
+    """
+    Return the fewest moves from a to b in the open, the Manhattan
+    distance.
+    """
+    return abs(a.x - b.x) + abs(a.y - b.y) + abs(a.z - b.z)
+
+def find_path(start, goal, neighbours = adjacent, cost = one_move, heuristic = distance, limit = 10000):
+    """
+    Return the cheapest path from start to goal, as a list of coordinates
+    from start to goal, or None if there is none or it was not found after
+    searching limit sectors.
+
+    neighbours(coordinates) returns the sectors one move away and
+    cost(a, b) the cost of moving between two of them. The path found is
+    the cheapest as long as heuristic(coordinates, goal) is never more than
+    the cost of the cheapest path from coordinates to the goal.
+    """
+    # Entries are (estimated total cost, estimated cost left, order added,
+    # cost so far, coordinates). Of equal estimates, the sector closest to
+    # the goal is searched first, so open space is crossed in a straight
+    # line without searching around it.
+    order = count()
+    estimate = heuristic(start, goal)
+    frontier = [(estimate, estimate, next(order), 0, start)]
+    came_from = {start: None}
+    costs = {start: 0}
+    searched = 0
+    while frontier:
+        total, left, _, so_far, current = heapq.heappop(frontier)
+        if current == goal:
+            path = []
+            while current is not None:
+                path.append(current)
+                current = came_from[current]
+            path.reverse()
+            return path
+        if so_far > costs[current]:
+            # A cheaper way here was found after this one was added
+            continue
+        searched += 1
+        if searched > limit:
+            return None
+        for neighbour in neighbours(current):
+            new_cost = so_far + cost(current, neighbour)
+            if neighbour not in costs or new_cost < costs[neighbour]:
+                costs[neighbour] = new_cost
+                came_from[neighbour] = current
+                estimate = heuristic(neighbour, goal)
+                heapq.heappush(frontier, (new_cost + estimate, estimate, next(order), new_cost, neighbour))
+    return None
+
+def waypoints(path):
+    """
+    Return the coordinates in a path where it turns, with the start and
+    the end, to summarize it.
+    """
+    if len(path) < 3:
+        return list(path)
+    points = [path[0]]
+    for before, at, after in zip(path, path[1:], path[2:]):
+        if (at.x - before.x, at.y - before.y, at.z - before.z) != (after.x - at.x, after.y - at.y, after.z - at.z):
+            points.append(at)
+    points.append(path[-1])
+    return points
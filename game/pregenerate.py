@@ -0,0 +1,137 @@
+#!/usr/bin/python
+
+import argparse
+import logging
+import multiprocessing
+import os
+import time
+from game import Game
+from generator import SectorGenerator
+from objects.coordinates import Coordinates
+from objects.sector import Sector
+from store import SqliteStore
+from world import World
+
+# Blocks of sectors generated by each task in the process pool
+blocks_per_task = 16
+
+def blocks(generator, low, high):
+    """
+    Return every block of sectors that overlaps the box between the low
+    and high coordinates (inclusive).
+    """
+    low_block = generator.block(low)
+    high_block = generator.block(high)
+    return [
+        (x, y, z)
+        for z in xrange(low.z, high.z + 1)
+        for x in xrange(low_block[0], high_block[0] + 1)
+        for y in xrange(low_block[1], high_block[1] + 1)
+    ]
+
+def generate_blocks(task):
+    """
+    Generate the sectors of some blocks that are inside the box and write
+    them to the store. Return the number of sectors written.
+
+    Every sector in a block is drawn, even those outside the box or
+    already in the store, so each sector is the same as the one the server
+    would generate.
+    """
+    filename, seed, task_blocks, low, high, existing = task
+    generator = SectorGenerator(Game.new_object_probability, seed = seed)
+    records = []
+    ids = []
+    sectors = 0
+    for block in task_blocks:
+        generated = generator.generate_block(block)
+        for shared_dict in generated.itervalues():
+            for key in shared_dict.keys():
+                if (
+                    key in existing or
+                    not low.x <= key.x <= high.x or
+                    not low.y <= key.y <= high.y
+                ):
+                    del shared_dict[key]
+        block_records, block_ids = generator.records(generated)
+        records += block_records
+        ids += block_ids
+        sectors += len(generated[Sector().plural()])
+
+    store = SqliteStore(filename, timeout = 600)
+    store.put(records, ids)
+    store.close()
+    return sectors
+
+def pregenerate(data_dir, low, high, seed, processes, log):
+    """
+    Generate every sector in the box between the low and high coordinates
+    that is not in the sqlite store yet, and write them to the store.
+
+    The server generates sectors the same way when they are first visited
+    and only saves them once they change, so this is only needed to keep
+    a copy of the world that does not depend on the generator.
+    """
+    world = World(data_dir = data_dir, log = log, storage = 'sqlite', seed = seed)
+    generator = SectorGenerator(Game.new_object_probability, seed = world.seed)
+    filename = os.path.join(world.data_dir, Game.store_filename)
+    store = SqliteStore(filename, log = log)
+    existing = set(store.keys(Sector().plural()))
+    store.close()
+    log.info("Generating sectors from %s to %s in %s with seed %s (%s already exist)..." % (
+        repr(low),
+        repr(high),
+        str(filename),
+        str(world.seed),
+        str(len(existing)),
+    ))
+
+    all_blocks = blocks(generator, low, high)
+    tasks = []
+    for start in xrange(0, len(all_blocks), blocks_per_task):
+        task_blocks = all_blocks[start:start + blocks_per_task]
+        in_blocks = set(
+            key for key in existing
+            if generator.block(key) in task_blocks
+        ) if existing else set()
+        tasks.append((filename, world.seed, task_blocks, low, high, in_blocks))
+
+    start = time.time()
+    generated = 0
+    pool = multiprocessing.Pool(processes)
+    for count in pool.imap_unordered(generate_blocks, tasks):
+        generated += count
+        log.debug("Generated %s sectors" % str(generated))
+    pool.close()
+    pool.join()
+    log.info("Generated %s sectors in %.1f seconds" % (str(generated), time.time() - start))
+
+def coordinates(value):
+    """Parse coordinates given as x,y or x,y,z on the command line."""
+    return Coordinates(*value.split(','))
+
+if __name__ == "__main__":
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Generate every sector in a box of coordinates into the sqlite store.')
+    parser.add_argument('low', type=coordinates, help='Lowest corner of the box, as x,y or x,y,z')
+    parser.add_argument('high', type=coordinates, help='Highest corner of the box (inclusive), as x,y or x,y,z')
+    parser.add_argument('-d','--debug', action='store_true', help='Enable debug logging')
+    parser.add_argument('--data-dir', default='data', help='Data directory with the sqlite store, default is data')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for a new world, the same seed always generates the same sectors, default is random')
+    parser.add_argument('--processes', type=int, default=None, help='Number of processes to generate with, default is one per CPU')
+    parser.add_argument('--version', action='version', version='0')
+    args = parser.parse_args()
+
+    # Setup logging options
+    log_level = logging.DEBUG if args.debug else logging.INFO
+    log = logging.getLogger(os.path.basename(__file__))
+    log.setLevel(log_level)
+    formatter = logging.Formatter('%(asctime)s:%(name)s:%(levelname)s:%(funcName)s(%(lineno)i):%(message)s')
+
+    ## Console Logging
+    ch = logging.StreamHandler()
+    ch.setLevel(log_level)
+    ch.setFormatter(formatter)
+    log.addHandler(ch)
+
+    pregenerate(args.data_dir, args.low, args.high, args.seed, args.processes, log)
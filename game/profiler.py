@@ -0,0 +1,132 @@
+"""
+Sampling profiler for the commands of a running server.
+
+While it runs, a SIGPROF timer interrupts the server every interval
+seconds of CPU time and the call stack that was running is counted under
+the command being handled (see command()). Samples taken between
+commands are dropped. It stops after a number of commands or seconds and
+writes one file per command type, in the folded format used by
+flamegraph.pl and speedscope: one line per call stack, callers first,
+separated by ';', followed by the number of samples.
+"""
+
+import datetime
+import os
+import signal
+import time
+from contextlib import contextmanager
+from greenlet import getcurrent
+
+class CommandProfiler(object):
+    def __init__(self, directory = 'profiles', log = None):
+        self.directory = directory
+        # If the directory is relative, then we need to find the absolute path for daemonizing
+        if not os.path.isabs(self.directory):
+            self.directory = os.path.join(os.path.dirname(os.path.realpath(__file__)), directory)
+        self.log = log
+        self.running = False
+        # The command each greenlet is handling, samples are counted
+        # under the command of the greenlet that was running
+        self.current = {}
+        self.commands = None
+        self.deadline = None
+        # Samples by command and call stack
+        self.samples = {}
+        self.handled = 0
+
+    def start(self, commands = None, seconds = None, interval = 0.005):
+        """
+        Start sampling every interval seconds, for the next number of
+        commands or seconds (whichever comes first).
+        """
+        if self.running:
+            raise ValueError("The profiler is already running")
+        if not commands and not seconds:
+            raise ValueError("Profile for a number of commands or seconds")
+        self.running = True
+        self.commands = commands
+        self.deadline = time.time() + seconds if seconds else None
+        self.samples = {}
+        self.handled = 0
+        signal.signal(signal.SIGPROF, self.sample)
+        # Let system calls that are interrupted by a sample carry on
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, interval, interval)
+        if self.log:
+            self.log.info("Profiling the next %s commands or %s seconds..." % (str(commands), str(seconds)))
+
+    def stop(self):
+        """
+        Stop sampling, write the samples and return the names of the files
+        written.
+        """
+        if not self.running:
+            raise ValueError("The profiler is not running")
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_IGN)
+        self.running = False
+        filenames = self.write()
+        if self.log:
+            self.log.info("Profiled %s commands, wrote %s" % (str(self.handled), ", ".join(filenames)))
+        return filenames
+
+    def stop_at_deadline(self):
+        """
+        Stop if the time is up, for when no commands are coming in.
+        """
+        if self.running and self.deadline and time.time() >= self.deadline:
+            self.stop()
+
+    def sample(self, signum, frame):
+        command = self.current.get(getcurrent())
+        if command is None:
+            return
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack = tuple(stack)
+        samples = self.samples.setdefault(command, {})
+        samples[stack] = samples.get(stack, 0) + 1
+
+    @contextmanager
+    def command(self, name):
+        """
+        Count the samples taken in a with block under the command name.
+        """
+        if not self.running:
+            yield
+            return
+        greenlet = getcurrent()
+        self.current[greenlet] = name
+        try:
+            yield
+        finally:
+            self.current.pop(greenlet, None)
+            self.handled += 1
+            # It may have been stopped while the command ran, from the
+            # admin port, SIGUSR1 or another command
+            if self.running and (
+                (self.commands and self.handled >= self.commands) or
+                (self.deadline and time.time() >= self.deadline)
+            ):
+                self.stop()
+
+    def write(self):
+        directory = os.path.join(self.directory, datetime.datetime.now().strftime('%Y%m%d-%H%M%S'))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        filenames = []
+        for command, samples in self.samples.iteritems():
+            filename = os.path.join(directory, command + '.folded')
+            with open(filename, 'w') as outfile:
+                for stack, count in sorted(samples.iteritems(), key = lambda (stack, count): -count):
+                    outfile.write("%s %s\n" % (
+                        ";".join(frame_name(code) for code in reversed(stack)),
+                        str(count),
+                    ))
+            filenames.append(filename)
+        return filenames
+
+def frame_name(code):
+    return "%s (%s:%s)" % (code.co_name, os.path.basename(code.co_filename), str(code.co_firstlineno))
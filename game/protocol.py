@@ -0,0 +1,216 @@
+"""
+Helpers for the protocol shared by the client and server.
+
+Messages are one line of JSON each, unless the client asks for msgpack
+frames with {'protocol': {'encoding': 'msgpack'}} (see encoding()). The
+response to that command is still a line of JSON, with the protocol the
+server chose under 'protocol'. After it both sides send frames, or keep
+to JSON if the server could not switch.
+
+In delta mode the server sends {'delta': delta} instead of the full
+{'state': ..., 'commands': ...} response, where delta turns the previous
+response into the current one. A delta for a dictionary looks like:
+
+  {'set': {key: new value}, 'del': [removed keys], 'patch': {key: delta}}
+
+A delta for a list of the same length is {'items': {'index': delta}}. If
+items were added or removed it is {'splice': [start, end, new items]},
+which replaces old[start:end] with the new items. Anything else that
+changed is replaced with {'value': new value}. Keys that would be empty
+are left out.
+"""
+
+import json
+import struct
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+def diff(old, new):
+    """
+    Return a delta that turns old into new, or None if they are equal.
+    """
+    if type(old) == type(new) and old == new:
+        return None
+    if isinstance(old, dict) and isinstance(new, dict):
+        delta = {}
+        removed = [key for key in old if key not in new]
+        if removed:
+            delta['del'] = removed
+        for key, value in new.iteritems():
+            if key not in old:
+                delta.setdefault('set', {})[key] = value
+            else:
+                key_delta = diff(old[key], value)
+                if key_delta is not None:
+                    delta.setdefault('patch', {})[key] = key_delta
+        return delta
+    if isinstance(old, list) and isinstance(new, list):
+        if len(old) == len(new):
+            items = {}
+            for index, (old_item, new_item) in enumerate(zip(old, new)):
+                item_delta = diff(old_item, new_item)
+                if item_delta is not None:
+                    items[str(index)] = item_delta
+            return {'items': items}
+        # Items were added or removed, only send the part of the list
+        # between the unchanged items at the start and the end
+        start = 0
+        while start < min(len(old), len(new)) and old[start] == new[start]:
+            start += 1
+        end = 0
+        while (
+            end < min(len(old), len(new)) - start and
+            old[len(old) - end - 1] == new[len(new) - end - 1]
+        ):
+            end += 1
+        return {'splice': [start, len(old) - end, new[start:len(new) - end]]}
+    return {'value': new}
+
+def patch(old, delta):
+    """
+    Apply a delta from diff() to old and return the result.
+
+    Dictionaries and lists in old are updated in place.
+    """
+    if not delta:
+        return old
+    if 'value' in delta:
+        return delta['value']
+    if 'items' in delta:
+        for index, item_delta in delta['items'].iteritems():
+            old[int(index)] = patch(old[int(index)], item_delta)
+        return old
+    if 'splice' in delta:
+        start, end, items = delta['splice']
+        old[start:end] = items
+        return old
+    for key in delta.get('del', []):
+        del old[key]
+    for key, value in delta.get('set', {}).iteritems():
+        old[key] = value
+    for key, key_delta in delta.get('patch', {}).iteritems():
+        old[key] = patch(old[key], key_delta)
+    return old
+
+def apply_event(state, event):
+    """
+    Apply an event pushed by the server (see events.py) to a state, and
+    return whether it changed anything.
+
+    Only the lists of objects in the sector are changed, never the
+    objects in them, so this can be applied to the state the server keeps
+    for deltas.
+    """
+    if event['type'] == 'resync':
+        return False
+    changed = False
+    # The port the player is docked at
+    if 'object' in event and state.get('at', {}).get('id') == event['id']:
+        state['at'] = event['object']
+        changed = True
+    sector = state.get('sector')
+    if not sector or sector.get('coordinates') != event['sector']:
+        return changed
+    heading = event['heading']
+    objects = [obj for obj in sector.get(heading, []) if obj['id'] != event['id']]
+    if 'object' in event:
+        objects.append(event['object'])
+    if objects:
+        sector[heading] = objects
+    else:
+        sector.pop(heading, None)
+    return True
+
+class JsonLines(object):
+    """
+    Messages as one line of JSON each, the default encoding.
+    """
+    name = 'json'
+
+    def read(self, fileobj):
+        """Return the next message from fileobj, or '' at the end."""
+        return fileobj.readline()
+
+    def encode(self, obj):
+        return json.dumps(obj) + "\n"
+
+    def decode(self, message):
+        return json.loads(message)
+
+    def is_handoff(self, message):
+        """Return whether a message is a handoff, without decoding it."""
+        return message.startswith('{"handoff"')
+
+    def is_event(self, message):
+        """Return whether a message is an event, without decoding it."""
+        return message.startswith('{"event"')
+
+class MsgpackFrames(object):
+    """
+    Messages as msgpack, each after a header with its length and flags.
+    Messages of compress bytes or more are compressed with zlib.
+    """
+    name = 'msgpack'
+    header = struct.Struct('>IB')
+    compressed = 1
+
+    def __init__(self, compress = None):
+        self.compress = compress
+        # The start of {'handoff': ...} and {'event': ...}, packed like
+        # encode() packs them (before msgpack 1.0 use_bin_type defaults to
+        # False)
+        self.handoff = msgpack.packb({'handoff': None}, use_bin_type = True)[:-1]
+        self.event = msgpack.packb({'event': None}, use_bin_type = True)[:-1]
+
+    def read(self, fileobj):
+        header = fileobj.read(self.header.size)
+        if len(header) < self.header.size:
+            return ''
+        length, flags = self.header.unpack(header)
+        return header + fileobj.read(length)
+
+    def encode(self, obj):
+        payload = msgpack.packb(obj, use_bin_type = True)
+        flags = 0
+        if self.compress is not None and len(payload) >= self.compress:
+            payload = zlib.compress(payload)
+            flags |= self.compressed
+        return self.header.pack(len(payload), flags) + payload
+
+    def payload(self, message):
+        length, flags = self.header.unpack_from(message)
+        payload = message[self.header.size:]
+        if flags & self.compressed:
+            payload = zlib.decompress(payload)
+        return payload
+
+    def decode(self, message):
+        return msgpack.unpackb(self.payload(message), raw = False)
+
+    def is_handoff(self, message):
+        return self.payload(message).startswith(self.handoff)
+
+    def is_event(self, message):
+        return self.payload(message).startswith(self.event)
+
+def encoding(parameters, current = None):
+    """
+    Return the encoding asked for by the parameters of a protocol command,
+    {'encoding': 'json' or 'msgpack', 'compress': bytes}, or current (or
+    JSON lines) if they don't ask for one.
+    """
+    name = parameters.get('encoding')
+    if name is None:
+        return current or JsonLines()
+    if name == 'json':
+        return JsonLines()
+    if name == 'msgpack':
+        if msgpack is None:
+            raise ValueError("msgpack is not installed")
+        compress = parameters.get('compress')
+        return MsgpackFrames(compress = int(compress) if compress is not None else None)
+    raise ValueError("Unknown encoding '%s'" % str(name))
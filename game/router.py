@@ -0,0 +1,215 @@
+#!/usr/bin/python
+
+"""
+Front end for a world split between several servers (see shard.py).
+
+Clients connect to the router the same way they connect to server.py.
+Each session is connected to one shard at a time, starting with the home
+shard, and the router passes commands and responses through unchanged.
+When a shard hands the session off, the router connects to the new
+shard, resumes the session there and sends the client the new shard's
+response instead. The commands of a batch that had not run on the old
+shard are sent to the new one, and the results from both are put
+together, so every command runs once.
+
+Messages are passed through in the encoding the client asked for (see
+protocol.py), only commands are decoded. Events the shard pushes to the
+client (see events.py) are passed on as they come in.
+"""
+
+import argparse
+import logging
+import os
+import gevent
+from gevent.lock import Semaphore
+from gevent.queue import Queue
+from gevent.server import StreamServer
+from gevent.socket import create_connection
+from protocol import encoding, JsonLines
+from shard import ShardMap
+
+class Session(object):
+    """
+    A client's connection to the shard it is on.
+
+    A greenlet reads everything the shard sends, writes the events to the
+    client and queues the responses for send().
+    """
+    def __init__(self, shard_host, shard_port, client):
+        self.shard_host = shard_host
+        self.shard_port = shard_port
+        self.shard = None
+        self.connection = None
+        self.fileobj = None
+        self.reader = None
+        self.responses = None
+        # The client's fileobj, events and responses are written to it
+        # one at a time
+        self.client = client
+        self.client_lock = Semaphore()
+        # The protocol the shard chose for the session, sent again to each
+        # new shard
+        self.protocol = None
+        # Encoding of the messages, the same with the client and the shard
+        self.wire = JsonLines()
+        # Set while waiting for the response to a protocol command
+        self.negotiating = False
+
+    def connect(self, shard):
+        self.close()
+        log.debug("Connecting session to shard %s" % str(shard))
+        self.shard = shard
+        self.connection = create_connection((self.shard_host, self.shard_port + shard))
+        self.fileobj = self.connection.makefile()
+        if self.protocol is not None:
+            # Each connection starts with JSON lines, until the protocol
+            # command has been answered
+            json_lines = JsonLines()
+            self.fileobj.write(json_lines.encode({'protocol': self.protocol}))
+            self.fileobj.flush()
+            json_lines.read(self.fileobj)
+        self.responses = Queue()
+        self.reader = gevent.spawn(self.read, self.fileobj, self.responses)
+
+    def close(self):
+        if self.reader:
+            # Not in the middle of writing an event to the client
+            with self.client_lock:
+                self.reader.kill()
+            self.reader = None
+        if self.connection:
+            self.fileobj.close()
+            self.connection.close()
+            self.connection = None
+
+    def read(self, fileobj, responses):
+        while True:
+            message = self.wire.read(fileobj)
+            if not message:
+                responses.put(message)
+                break
+            if self.wire.is_event(message):
+                self.write(message)
+                continue
+            if self.negotiating:
+                # Both sides switch to the encoding the shard chose after
+                # the response
+                self.negotiating = False
+                protocol = self.wire.decode(message).get('protocol')
+                if protocol:
+                    self.protocol = protocol
+                    self.wire = encoding(protocol, self.wire)
+            responses.put(message)
+
+    def write(self, message):
+        """Write a message to the client."""
+        with self.client_lock:
+            self.client.write(message)
+            self.client.flush()
+
+    def send(self, message, negotiate = False):
+        """
+        Send a command to the shard and return the response. If negotiate
+        is set, the command is a protocol command and the messages after
+        the response are in the encoding the shard chose.
+        """
+        self.negotiating = negotiate
+        self.fileobj.write(message)
+        self.fileobj.flush()
+        return self.responses.get()
+
+def handle(socket, address):
+    log.info("Connection received from %s" % str(address))
+    fileobj = socket.makefile()
+    session = Session(args.shard_host, args.shard_port, fileobj)
+    session.connect(ShardMap.home)
+
+    while True:
+        # The response comes in the encoding the command went in, even if
+        # the command changes it
+        wire = session.wire
+        message = wire.read(fileobj)
+        if not message:
+            log.info("Client disconnected")
+            break
+        command_dict = wire.decode(message)
+
+        batch = command_dict.keys() == ['batch'] and isinstance(command_dict['batch'], list)
+        # The commands of a batch that have not run yet, and the results of
+        # the ones that ran on shards that handed the session off
+        commands = command_dict['batch'] if batch else None
+        results = []
+
+        response = session.send(message, negotiate = 'protocol' in command_dict)
+        # Responses are only decoded when they are a handoff
+        while wire.is_handoff(response):
+            handoff = wire.decode(response)['handoff']
+            log.info("Handing %s off from shard %s to shard %s" % (
+                str(handoff['name']),
+                str(session.shard),
+                str(handoff['shard']),
+            ))
+            ran = handoff.get('results') or []
+            if ran and handoff['retry']:
+                # The command that handed off runs on the new shard
+                ran = ran[:-1]
+            if batch:
+                results += ran
+                commands = commands[len(ran):]
+            # The client is sent the response to the commands sent again
+            # instead of the response to resume, so in delta mode it has to
+            # be the full state
+            replay = bool(commands) if batch else handoff['retry']
+            session.connect(handoff['shard'])
+            response = session.send(wire.encode({'resume': {
+                'name': handoff['name'],
+                'token': handoff['token'],
+                'replay': replay,
+            }}))
+            if wire.is_handoff(response) or not replay:
+                continue
+            if batch:
+                response = session.send(wire.encode({'batch': commands}))
+            else:
+                response = session.send(message)
+
+        if results:
+            data = wire.decode(response)
+            data['results'] = results + data.get('results', [])
+            response = wire.encode(data)
+        session.write(response)
+    session.close()
+
+if __name__ == "__main__":
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Route clients to the shards of a world.')
+    parser.add_argument('-d','--debug', action='store_true', help='Enable debug logging')
+    parser.add_argument('-p','--port', type=int, default=10344, help='Port to listen on, default is 10344')
+    parser.add_argument('--shard-host', default='localhost', help='Host the shards run on, default is localhost')
+    parser.add_argument('--shard-port', type=int, default=10345, help='Port of shard 0, shard n is on this port + n, default is 10345')
+    parser.add_argument('--version', action='version', version='0')
+    global args
+    args = parser.parse_args()
+
+    # Setup logging options
+    global log
+    log_level = logging.DEBUG if args.debug else logging.INFO
+    log = logging.getLogger(os.path.basename(__file__))
+    log.setLevel(log_level)
+    formatter = logging.Formatter('%(asctime)s:%(name)s:%(levelname)s:%(funcName)s(%(lineno)i):%(message)s')
+
+    ## Console Logging
+    ch = logging.StreamHandler()
+    ch.setLevel(log_level)
+    ch.setFormatter(formatter)
+    log.addHandler(ch)
+
+    host = '0.0.0.0'
+    server = StreamServer((host, args.port), handle)
+    log.info("Router listening on %s:%s for shards on %s from port %s" % (
+        str(host),
+        str(args.port),
+        str(args.shard_host),
+        str(args.shard_port),
+    ))
+    server.serve_forever()
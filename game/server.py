@@ -4,19 +4,77 @@ import argparse
 import logging
 import os
 import json
+import signal
+import time
+import gevent
+from admin import Admin
 from daemon import Daemon
+from events import EventChannels, Subscriber
 from game import Game
+from metrics import Metrics
+from profiler import CommandProfiler
+from objects.coordinates import Coordinates
+from shard import ShardMap
+from ticker import Ticker
+from world import World
+from protocol import apply_event, diff, encoding, JsonLines
+from gevent.lock import RLock, Semaphore
 from gevent.server import StreamServer
 
 global log
 global args
+global world
+
+# Commands and responses on the wire
+protocol_log = logging.getLogger('server.protocol')
+
+# Set when this server is one shard of a world (see shard.py)
+shard = None
+shard_map = None
+
+# Timings of commands and responses, read on the admin port
+metrics = Metrics()
+metrics.define('response_bytes', smallest = 16, largest = 1e8)
+
+# Adapters of the connected clients
+sessions = set()
+
+# Clients following the events of their sector (see events.py)
+channels = EventChannels(metrics)
+
+# Most commands in one batch request, so one client can't hold the world
+# lock for long
+batch_limit = 100
+
+# Samples the commands when it is started on the admin port or with
+# SIGUSR1, see profile()
+profiler = CommandProfiler()
 
 name = "space-sim-server"
 pid = "/tmp/" + str(name) + ".pid"
 
 class ServerGameAdapter(object):
-    def __init__(self, log = None, bigbang = False):
-        self.game = Game(log = log, bigbang = bigbang)
+    # Commands that don't change the world, so nothing is saved after
+    # them. The state is not one of them: building it loads (or
+    # generates) sectors, which can drop others from memory.
+    read_only_commands = ['protocol', 'resync']
+
+    def __init__(self, world, log = None):
+        self.game = Game(world = world, log = log)
+        # Send deltas instead of full responses (see protocol.py)
+        self.delta = False
+        # The last response sent on this connection, None to send the full
+        # response next time
+        self.last_response = None
+        # Encoding of the messages on this connection (see protocol.py)
+        self.wire = JsonLines()
+        # Push the events of the player's sector to the client, through
+        # subscriber (see events.py)
+        self.events = False
+        self.subscriber = None
+        # The protocol chosen by the last protocol command, sent with the
+        # response to it so the client knows which encoding to switch to
+        self.protocol_response = None
 
     def save(self):
         return self.game.save()
@@ -24,6 +82,71 @@ class ServerGameAdapter(object):
     def state(self, parameters = None):
         return self.game.state()
 
+    def protocol(self, parameters):
+        self.delta = bool(parameters.get('delta', False))
+        self.last_response = None
+        if 'events' in parameters:
+            self.events = bool(parameters['events'])
+        try:
+            self.wire = encoding(parameters, self.wire)
+        except ValueError, e:
+            self.game.log.error("Keeping the %s encoding: %s" % (str(self.wire.name), str(e)))
+        self.protocol_response = {
+            'delta': self.delta,
+            'encoding': self.wire.name,
+            'compress': getattr(self.wire, 'compress', None),
+            'events': self.events,
+        }
+
+    def resync(self, parameters = None):
+        self.last_response = None
+
+    def response(self, command = None):
+        """
+        Return the response to send after a command, with its timings
+        counted under the command's name (or 'batch').
+
+        In delta mode this is the delta from the last response, unless the
+        client asked for a resync. The response to a protocol command is
+        the full state, with the protocol the server chose under
+        'protocol'.
+        """
+        with metrics.timer('state_seconds', command = command):
+            state, commands = self.state()
+        data = {'state': state, 'commands': commands}
+        if self.delta:
+            last_response = self.last_response
+            self.last_response = data
+            if last_response is not None:
+                with metrics.timer('delta_seconds', command = command):
+                    return {'delta': diff(last_response, data) or {}}
+        if self.protocol_response is not None:
+            # Not kept in last_response, only this response has it
+            data = dict(data, protocol = self.protocol_response)
+            self.protocol_response = None
+        return data
+
+    def publish(self, coordinates, event):
+        """
+        Send an event to the other clients following the sector at
+        coordinates.
+        """
+        channels.publish(coordinates, event, source = self.subscriber)
+
+    def sector_coordinates(self):
+        """
+        Return the coordinates of the sector the player is in, or docked
+        in, or None if they have no ship.
+        """
+        return self.game.sector_coordinates()
+
+    def ship_event(self, event_type, ship, coordinates = None):
+        """Publish an event for the player's ship."""
+        event = {'type': event_type, 'heading': 'ships', 'id': ship.id}
+        if event_type != 'left':
+            event['object'] = ship.to_dict()
+        self.publish(coordinates or self.sector_coordinates(), event)
+
     def register(self, parameters):
         return self.game.register(parameters['name'], parameters['password'])
 
@@ -31,34 +154,268 @@ class ServerGameAdapter(object):
         return self.game.login(parameters['name'], parameters['password'])
 
     def join_game(self, parameters):
-        return self.game.join_game(parameters['ship_name'])
+        result = self.game.join_game(parameters['ship_name'])
+        if result:
+            self.ship_event('entered', self.game.location(of = self.game.logged_in_user))
+        return result
 
     def move(self, parameters):
-        return self.game.move(parameters['direction'])
+        ship = self.game.location(of = self.game.logged_in_user)
+        origin = ship.location if ship else None
+        result = self.game.move(parameters['direction'])
+        if isinstance(origin, Coordinates) and ship.location != origin:
+            self.ship_event('left', ship, origin)
+            self.ship_event('entered', ship, ship.location)
+        return result
+
+    def autopilot(self, parameters):
+        ship = self.game.location(of = self.game.logged_in_user)
+        origin = ship.location if ship else None
+        result = self.game.autopilot(
+            parameters.get('x'),
+            parameters.get('y'),
+            summary = bool(parameters.get('summary', False)),
+        )
+        if isinstance(origin, Coordinates) and ship.location != origin:
+            self.ship_event('left', ship, origin)
+            self.ship_event('entered', ship, ship.location)
+        return result
 
     def dock(self, parameters):
-        return self.game.enter(parameters['id'])
+        result = self.game.enter(parameters['id'])
+        self.docking_event()
+        return result
 
     def undock(self, parameters):
-        return self.game.leave()
+        result = self.game.leave()
+        self.docking_event()
+        return result
+
+    def docking_event(self):
+        ship = self.game.location(of = self.game.logged_in_user)
+        if ship and self.sector_coordinates():
+            self.ship_event('changed', ship)
 
     def buy(self, parameters):
-        return self.game.trade(
+        result = self.game.trade(
             item = parameters['item'],
             quantity = parameters['quantity'],
             for_what = None,
             seller = None,
             buyer = 'current_user',
         )
+        if result:
+            self.port_event()
+        return result
 
     def sell(self, parameters):
-        return self.game.trade(
+        result = self.game.trade(
             item = parameters['item'],
             quantity = parameters['quantity'],
             for_what = None,
             seller = 'current_user',
             buyer = None,
         )
+        if result:
+            self.port_event()
+        return result
+
+    def market(self, parameters):
+        return self.game.market(
+            item = parameters['item'],
+            action = parameters.get('action', 'sell'),
+            radius = parameters.get('radius', 5),
+            count = parameters.get('count', 1),
+        )
+
+    def route(self, parameters):
+        return self.game.route(radius = parameters.get('radius', 5))
+
+    def port_event(self):
+        """Publish the stock and prices of the port the player traded with."""
+        port = self.game.location(of = self.game.location(of = self.game.logged_in_user))
+        publish_port(port.location, port, source = self.subscriber)
+
+class ShardGameAdapter(ServerGameAdapter):
+    """
+    The commands of a session on one shard of a world split between
+    several servers (see shard.py and router.py).
+
+    When a command needs a sector this shard doesn't own, the session is
+    handed off: the response is {'handoff': {'shard': ..., 'name': ...,
+    'token': ..., 'retry': ...}} instead of the state, and the router
+    resumes the session on that shard. If retry is set, the router sends
+    the command again once the session is resumed. In a batch, the
+    commands after it are not run here, the handoff has the results of
+    the ones that were (with the one that handed off last) and the router
+    sends the rest to the new shard. The router resumes with replay set
+    when it sends commands again, as the client only sees the response
+    to those.
+
+    A ship moving into another shard's sector is removed from its sector
+    here and saved with its user (as transit) until the other shard
+    places it, so it is always saved in exactly one place.
+    """
+    def __init__(self, world, shard, shard_map, log = None):
+        super(ShardGameAdapter, self).__init__(world, log = log)
+        self.shard = shard
+        self.shard_map = shard_map
+        self.handoff = None
+        # Set by resume when the router sends commands again after it, the
+        # response to them is the first the client sees from this shard
+        self.replay = False
+
+    def hand_off(self, shard, retry = False):
+        """
+        Hand the session off to another shard after this command.
+        """
+        user = self.game.logged_in_user
+        log.info("Handing %s off to shard %s" % (str(user.name), str(shard)))
+        self.handoff = {
+            'shard': shard,
+            'name': user.name,
+            'token': user.token,
+            'retry': retry,
+        }
+        self.game.logged_in_user = None
+
+    def response(self, command = None):
+        if self.handoff:
+            handoff = self.handoff
+            self.handoff = None
+            self.last_response = None
+            return {'handoff': handoff}
+        response = super(ShardGameAdapter, self).response(command)
+        if self.replay:
+            # The router drops this response, so the next one is the full
+            # state too
+            self.replay = False
+            self.last_response = None
+        return response
+
+    def ship_coordinates(self, user):
+        """
+        Return the coordinates of the user's ship without loading it, or
+        None if the user has no ship.
+        """
+        if getattr(user, 'transit', None):
+            return user.transit.location
+        found = Game._store.find(user.location_id) if user.location_id else None
+        if found and isinstance(found[1], Coordinates):
+            return found[1]
+        return None
+
+    def register(self, parameters):
+        self.game.reload_user(parameters['name'])
+        return super(ShardGameAdapter, self).register(parameters)
+
+    def login(self, parameters):
+        self.game.reload_user(parameters['name'])
+        if not super(ShardGameAdapter, self).login(parameters):
+            return False
+        coordinates = self.ship_coordinates(self.game.logged_in_user)
+        if coordinates and self.shard_map.owner(coordinates) != self.shard:
+            self.hand_off(self.shard_map.owner(coordinates))
+        elif getattr(self.game.logged_in_user, 'transit', None):
+            self.resume_ship(self.game.logged_in_user)
+        return True
+
+    def resume(self, parameters):
+        """
+        Log in a user handed off from another shard. If replay is set,
+        the router sends commands again after this, and the client only
+        sees the response to them.
+        """
+        self.replay = bool(parameters.get('replay'))
+        user = self.game.reload_user(parameters['name'])
+        if not user or not user.token or user.token != parameters['token']:
+            log.error("Could not resume session for '%s'" % str(parameters['name']))
+            return False
+        self.game.logged_in_user = user
+        if getattr(user, 'transit', None):
+            self.resume_ship(user)
+        # The client's last response came from the other shard
+        self.last_response = None
+        return True
+
+    def resume_ship(self, user):
+        """
+        Place the ship the user brought from another shard.
+        """
+        ship = user.transit
+        del user.transit
+        self.game.load_sector(ship.location)
+        self.game.place(ship, ship.location)
+        self.game.mark_dirty(ship, ship.location)
+        self.game.mark_dirty(user)
+        self.ship_event('entered', ship, ship.location)
+
+    def join_game(self, parameters):
+        owner = self.shard_map.owner(self.game.spawn_coordinates)
+        if owner != self.shard:
+            self.hand_off(owner, retry = True)
+            return
+        return super(ShardGameAdapter, self).join_game(parameters)
+
+    def move(self, parameters):
+        ship = self.game.location(of = self.game.logged_in_user)
+        direction = str(parameters['direction']).lower()
+        if (
+            not ship or
+            not isinstance(ship.location, Coordinates) or
+            direction not in ['n','s','e','w']
+        ):
+            return super(ShardGameAdapter, self).move(parameters)
+        destination = ship.location.adjacent(direction)
+        owner = self.shard_map.owner(destination)
+        if owner == self.shard:
+            return super(ShardGameAdapter, self).move(parameters)
+        self.transit(ship, destination, owner)
+
+    def autopilot(self, parameters):
+        """
+        Fly the ship with the autopilot, handing it off if the destination
+        is on another shard. The sectors on the way are the other shard's
+        to load, so the ship goes straight there.
+        """
+        ship = self.game.location(of = self.game.logged_in_user)
+        path = self.game.path(ship, parameters.get('x'), parameters.get('y'))
+        if path is None:
+            return False
+        owner = self.shard_map.owner(path[-1])
+        if owner == self.shard:
+            return super(ShardGameAdapter, self).autopilot(parameters)
+        self.transit(ship, path[-1], owner)
+        return True
+
+    def transit(self, ship, destination, owner):
+        """
+        Send a ship to destination on another shard, which places it when
+        it resumes the session.
+        """
+        self.game.depart(ship)
+        self.ship_event('left', ship, ship.location)
+        Game._index.pop(ship.id, None)
+        ship.location = destination
+        user = self.game.logged_in_user
+        user.transit = ship
+        self.game.mark_dirty(user)
+        self.hand_off(owner)
+
+def publish_port(coordinates, port, source = None):
+    """
+    Send the stock and prices of a port to the clients following its
+    sector.
+    """
+    channels.publish(coordinates, {'type': 'changed', 'heading': 'ports', 'id': port.id, 'object': port.to_dict()}, source = source)
+
+def new_adapter():
+    """
+    Return the adapter for a new connection.
+    """
+    if shard_map:
+        return ShardGameAdapter(world, shard, shard_map, log = log)
+    return ServerGameAdapter(world, log = log)
 
 def json_repr(obj):
     """Represent instance of a class as JSON.
@@ -89,46 +446,249 @@ def json_repr(obj):
 def handle(socket, address):
     log.info("Connection received from %s" % str(address))
     log.info("Creating ServerGameAdapter...")
-    game = ServerGameAdapter(log = log, bigbang = args.bigbang)
-    log.debug("Creating fileobj")
+    game = new_adapter()
+    sessions.add(game)
+    try:
+        serve(game, socket)
+    finally:
+        sessions.discard(game)
+        if game.subscriber:
+            game.subscriber.close()
+
+def serve(game, socket):
+    """
+    Run the commands from a client until it disconnects.
+    """
+    protocol_log.debug("Creating fileobj")
     fileobj = socket.makefile()
+    # Events are written between responses, never in the middle of one
+    write_lock = Semaphore()
+
+    def write_event(event):
+        with write_lock:
+            if event['type'] == 'resync':
+                # Events were dropped, the next response is the full state
+                game.last_response = None
+            elif game.last_response is not None:
+                # Keep the state deltas are made from the same as the client's
+                apply_event(game.last_response['state'], event)
+            fileobj.write(game.wire.encode({'event': event}))
+            fileobj.flush()
 
     while True:
+        # The response goes out in the encoding the command came in, even
+        # if the command changes it
+        wire = game.wire
         # Listen for commands
-        log.debug("Waiting for commands...")
-        line = fileobj.readline()
-        if not line:
+        protocol_log.debug("Waiting for commands...")
+        message = wire.read(fileobj)
+        if not message:
             log.info("Client disconnected, saving game...")
+            with world.lock:
+                game.save()
+            break
+        with write_lock:
+            response, label = respond(game, wire, message)
+            metrics.observe('response_bytes', len(response), command = label)
+            fileobj.write(response)
+            fileobj.flush()
+
+        # Follow the sector the player is in now
+        if game.events and not game.subscriber:
+            game.subscriber = Subscriber(channels, write_event, log = log)
+        elif game.subscriber and not game.events:
+            game.subscriber.close()
+            game.subscriber = None
+        if game.subscriber:
+            game.subscriber.follow(game.sector_coordinates())
+
+def respond(game, wire, message):
+    """
+    Run the command or batch of commands in a message, and return the
+    encoded response and the label its metrics are counted under.
+    """
+    # Process line as a command, or a batch of commands
+    command_dict = wire.decode(message)
+    protocol_log.debug("Command from client: '%s'", command_dict)
+    batch = command_dict.keys() == ['batch']
+    if batch:
+        command_dicts = command_dict['batch'] if isinstance(command_dict['batch'], list) else []
+    else:
+        command_dicts = [command_dict]
+    found = [find_command(game, c) for c in command_dicts[:batch_limit]]
+    if batch:
+        label = 'batch'
+    else:
+        # Commands that are not found are counted together
+        label = str(found[0][0]) if found[0][1] else 'unknown'
+
+    with profiler.command(label):
+        # The response is built holding the lock too, so it shows what the
+        # commands did and nothing else changes the world under it
+        waiting = time.time()
+        with world.lock:
+            metrics.observe('lock_wait_seconds', time.time() - waiting)
+            results = run_commands(game, command_dicts, found)
+            # Respond to command
+            response = game.response(label)
+        if batch and 'handoff' in response:
+            # The router sends the commands that did not run to the next
+            # shard
+            response['handoff']['results'] = results
+        elif batch:
+            if len(command_dicts) > batch_limit:
+                results += [
+                    {'error': "Batches are limited to %s commands" % str(batch_limit)}
+                ] * (len(command_dicts) - batch_limit)
+            response['results'] = results
+        with metrics.timer('encode_seconds', command = label):
+            return wire.encode(response), label
+
+def find_command(game, command_dict):
+    """
+    Return the command in a command dictionary and the adapter method for
+    it, which is None if there is no such command.
+    """
+    if not isinstance(command_dict, dict) or len(command_dict.keys()) is not 1:
+        log.error("Command dictionary from client includes multiple keys")
+        return None, None
+    command = command_dict.keys()[0]
+    method = getattr(game, str(command), None)
+    if not method:
+        log.error("Command '%s' not found in ServerGameAdapter" % str(command))
+    return command, method
+
+def run_commands(game, command_dicts, found):
+    """
+    Run commands in order and return a result for each, with the methods
+    from find_command(). The caller holds the world lock.
+
+    Unless they are all read only, everything the commands changed is
+    saved once at the end.
+    """
+    results = dispatch(game, command_dicts, found)
+    if not all(command in game.read_only_commands for command, method in found if method):
+        # Journal whatever the commands changed
+        with metrics.timer('save_seconds'):
             game.save()
+    return results
+
+def dispatch(game, command_dicts, found):
+    """
+    Call the adapter method for each command and return the results, as
+    {'command': command, 'result': return value} or {'error': message}.
+    """
+    results = []
+    for command_dict, (command, method) in zip(command_dicts, found):
+        if not method:
+            metrics.increment('commands', command = 'unknown')
+            results.append({'error': "Command not found"})
+            continue
+        protocol_log.info("Command is '%s'", command)
+        label = str(command)
+        with metrics.timer('dispatch_seconds', command = label):
+            result = method(command_dict[command])
+        metrics.increment('commands', command = label)
+        if not isinstance(result, (bool, int, long, float, basestring)):
+            result = None
+        results.append({'command': command, 'result': result})
+        if getattr(game, 'handoff', None):
+            # The rest of the commands have to run on another shard
             break
-        # Process line as a command
-        command_dict = json.loads(line)
-        log.debug("Command from client: '%s'" % str(command_dict))
-        if len(command_dict.keys()) is 1:
-            command = command_dict.keys()[0]
-            method = getattr(game, str(command), None)
-            if method:
-                log.info("Command is '%s'" % str(command))
-                method(command_dict[command])
-            else:
-                log.error("Command '%s' not found in ServerGameAdapter" % str(command))
-        else:
-            log.error("Command dictionary from client includes multiple keys")
+    return results
 
-        # Respond to command
-        state, commands = game.state()
-        data = {'state': state, 'commands': commands}
-        fileobj.write(json.dumps(data))
-        fileobj.write("\n")
-        fileobj.flush()
+def profile(commands = None, seconds = None, interval = 0.005):
+    """
+    Start sampling the next number of commands or seconds, see
+    profiler.py.
+    """
+    profiler.start(commands = commands, seconds = seconds, interval = interval)
+    if seconds:
+        gevent.spawn_later(seconds, profiler.stop_at_deadline)
+
+def admin_profile(parameters):
+    """
+    Start the profiler from the admin port, with the commands, seconds
+    and interval query parameters.
+    """
+    profile(
+        commands = int(parameters['commands']) if 'commands' in parameters else None,
+        seconds = float(parameters['seconds']) if 'seconds' in parameters else None,
+        interval = float(parameters.get('interval', 0.005)),
+    )
+    return 'text/plain', "Profiling, the samples will be written to %s\n" % str(profiler.directory)
+
+def admin_profile_stop(parameters):
+    filenames = profiler.stop()
+    return 'text/plain', "Wrote %s\n" % ", ".join(filenames)
+
+def toggle_profile():
+    """
+    Start the profiler for --profile-seconds, or stop it if it is running,
+    when the server gets SIGUSR1.
+    """
+    if profiler.running:
+        profiler.stop()
+    else:
+        profile(seconds = args.profile_seconds)
+
+def add_gauges():
+    """
+    Add the gauges for connected sessions and the size of the world to
+    the metrics.
+    """
+    metrics.gauge('sessions', lambda: len(sessions))
+    metrics.gauge('loaded_sectors', lambda: len(Game._sectors))
+    metrics.gauge('generated_blocks', lambda: len(Game._generated))
+    metrics.gauge('indexed_objects', lambda: len(Game._index))
+    metrics.gauge('dirty_keys', lambda: len(Game._dirty))
+    metrics.gauge('event_subscribers', channels.subscribers)
+    for name in Game(world = world, log = log).shared_objects:
+        metrics.gauge('objects', count_objects(name), type = name)
+
+def count_objects(name):
+    """Return a function counting the loaded objects in a shared object."""
+    def count():
+        return sum(
+            len(value) if isinstance(value, list) else 1
+            for value in getattr(Game, '_' + name).itervalues()
+        )
+    return count
 
 class Server(Daemon):
     def run(self):
+        global world
+        global shard
+        global shard_map
         log.info("Initializing...")
+        if args.shards > 1:
+            shard = args.shard
+            shard_map = ShardMap(args.shards, region_size = args.region_size)
+        world = World(data_dir = args.data_dir, log = log, bigbang = args.bigbang, storage = args.storage, seed = args.seed, lock = RLock(), shard = shard, shard_map = shard_map)
+        # Load the shared objects now instead of on the first connection
+        Game(world = world, log = log)
+        global profiler
+        profiler = CommandProfiler(args.profile_dir, log = log)
+        if args.tick_rate:
+            ticker = Ticker(world, rate = args.tick_rate, slice_seconds = args.tick_slice, metrics = metrics, publish = publish_port, log = log)
+            ticker.start()
+            metrics.gauge('active_sectors', lambda: len(ticker.active_sectors()))
+        gevent.signal_handler(signal.SIGUSR1, toggle_profile)
+        if args.admin_port:
+            add_gauges()
+            admin_port = args.admin_port
+            if shard_map:
+                admin_port += shard
+            admin = Admin(metrics, log = log)
+            admin.route('/profile', admin_profile)
+            admin.route('/profile/stop', admin_profile_stop)
+            admin.start(admin_port)
 
         while True:
             host = '0.0.0.0'
-            port = 10344
+            port = args.port
+            if shard_map:
+                port = args.shard_port + shard
             server = StreamServer((host, port), handle)
             log.info("Server initialized on %s:%s, listening..." % (str(host),str(port)))
             server.serve_forever()
@@ -138,23 +698,51 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Process command line options.')
     parser.add_argument('command', default='status', help='Server command, one of: start, stop, run, status')
     parser.add_argument('-d','--debug', action='store_true', help='Enable debug logging')
+    parser.add_argument('-p','--port', type=int, default=10344, help='Port to listen on, default is 10344')
+    parser.add_argument('-t','--trace', action='append', default=[], help='Enable debug logging for one subsystem, like game.trade, game.world or server.protocol (can be repeated)')
     parser.add_argument('--bigbang', action='store_true', help='Delete everything before starting')
+    parser.add_argument('--data-dir', default='data', help='Data directory, default is data')
+    parser.add_argument('--storage', default='yaml', choices=['yaml','sqlite'], help='Storage format for game data, default is yaml (see migrate.py)')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for a new world, sectors are generated from it (default is random)')
+    parser.add_argument('--shards', type=int, default=1, help='Number of shards the world is split between (see router.py), default is 1')
+    parser.add_argument('--shard', type=int, default=0, help='Shard run by this server, from 0, it listens on --shard-port + shard')
+    parser.add_argument('--shard-port', type=int, default=None, help='Port of shard 0 (like router.py --shard-port), shard n listens on this port + n, default is --port + 1')
+    parser.add_argument('--region-size', type=int, default=32, help='Sectors are split between shards in square regions of this size, default is 32')
+    parser.add_argument('--admin-port', type=int, default=None, help='Local port for the admin interface with metrics (see admin.py), shards add their shard number, default is off')
+    parser.add_argument('--profile-dir', default='profiles', help='Directory for the samples of the command profiler, default is profiles')
+    parser.add_argument('--profile-seconds', type=float, default=30, help='Seconds to profile commands for after SIGUSR1 (which stops the profiler if it is running), default is 30')
+    parser.add_argument('--tick-rate', type=float, default=1, help='Ticks per second, each restocks the ports in sectors with ships (see ticker.py), 0 to stop the world when nobody acts, default is 1')
+    parser.add_argument('--tick-slice', type=float, default=0.005, help='Seconds a tick holds the world lock for before serving connections again, default is 0.005')
+    parser.add_argument('--log-file', default=os.path.basename(__file__) + '.log', help='File to log to, default is server.py.log in the current directory')
     parser.add_argument('--version', action='version', version='0')
     global args
     args = parser.parse_args()
+    if args.shard_port is None:
+        args.shard_port = args.port + 1
+    if args.shards > 1:
+        if args.storage != 'sqlite':
+            parser.error('Shards share the sqlite store, --shards needs --storage sqlite')
+        if not 0 <= args.shard < args.shards:
+            parser.error('--shard must be between 0 and %s' % str(args.shards - 1))
+        name = "%s-shard-%s" % (str(name), str(args.shard))
+        pid = "/tmp/" + str(name) + ".pid"
 
     # Setup logging options
     global log
     log_level = logging.DEBUG if args.debug else logging.INFO
     log = logging.getLogger(os.path.basename(__file__))
-    log.setLevel(log_level)
+    # Handlers are added to the root logger so the subsystem loggers
+    # (game.world, game.trade, server.protocol) write to them too
+    root_log = logging.getLogger()
+    root_log.setLevel(log_level)
+    for subsystem in args.trace:
+        logging.getLogger(subsystem).setLevel(logging.DEBUG)
     formatter = logging.Formatter('%(asctime)s:%(name)s:%(levelname)s:%(funcName)s(%(lineno)i):%(message)s')
 
     ## File Logging
-    fh = logging.FileHandler(os.path.basename(__file__) + '.log')
-    fh.setLevel(log_level)
+    fh = logging.FileHandler(args.log_file)
     fh.setFormatter(formatter)
-    log.addHandler(fh)
+    root_log.addHandler(fh)
 
     server = Server(pid)
 
@@ -170,9 +758,8 @@ if __name__ == "__main__":
     if args.command == 'run':
         # Console Logging
         ch = logging.StreamHandler()
-        ch.setLevel(log_level)
         ch.setFormatter(formatter)
-        log.addHandler(ch)
+        root_log.addHandler(ch)
         server.run()
     if args.command == 'status':
         print str(name) + " is",
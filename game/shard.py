@@ -0,0 +1,37 @@
+class ShardMap(object):
+    """
+    Which shard owns each sector, for a world split between several server
+    processes (see server.py --shards and router.py).
+
+    Sectors are grouped into square regions of region_size x region_size
+    sectors, and each region is owned by one shard. Only the owner loads,
+    changes and saves the sectors in a region. Users can be on any shard,
+    but a user is only logged in on one shard at a time, and is loaded
+    again from the store when a shard takes them over.
+
+    Sessions start on the home shard, which handles registering and
+    logging in so user names are only checked in one place.
+    """
+    home = 0
+
+    def __init__(self, shards, region_size = 32):
+        self.shards = shards
+        self.region_size = region_size
+
+    def region(self, coordinates):
+        """
+        Return the (x, y, z) of the region that coordinates are in.
+        """
+        return (
+            coordinates.x // self.region_size,
+            coordinates.y // self.region_size,
+            coordinates.z,
+        )
+
+    def owner(self, coordinates):
+        """
+        Return the number of the shard that owns coordinates.
+        """
+        x, y, z = self.region(coordinates)
+        # Spread neighbouring regions over different shards
+        return ((x * 73856093) ^ (y * 19349663) ^ (z * 83492791)) % self.shards
@@ -0,0 +1,109 @@
+from objects.coordinates import Coordinates
+
+class SpatialIndex(object):
+    """
+    Everything in every sector, keyed by coordinates and grouped by type.
+
+    The index holds the same lists as the shared objects (Game._ships,
+    Game._ports, ...), so adding an object to a list that is already
+    indexed does not need an update here. Only replacing or removing the
+    list at some coordinates does.
+
+    Coordinates with contents are also bucketed into cubic cells of
+    cell_size sectors, so range queries only look at the cells they
+    overlap instead of every sector.
+    """
+    def __init__(self, cell_size = 16):
+        self.cell_size = cell_size
+        self._sectors = {}
+        self._cells = {}
+
+    def cell(self, coordinates):
+        return (
+            coordinates.x // self.cell_size,
+            coordinates.y // self.cell_size,
+            coordinates.z // self.cell_size,
+        )
+
+    def set(self, coordinates, name, objects):
+        """
+        Index the list of objects of one type (name is the plural, like
+        'ports') at coordinates.
+        """
+        if coordinates not in self._sectors:
+            self._sectors[coordinates] = {}
+            self._cells.setdefault(self.cell(coordinates), set()).add(coordinates)
+        self._sectors[coordinates][name] = objects
+
+    def remove(self, coordinates, name):
+        """
+        Remove the objects of one type at coordinates from the index.
+        """
+        if coordinates in self._sectors:
+            self._sectors[coordinates].pop(name, None)
+            if not self._sectors[coordinates]:
+                del self._sectors[coordinates]
+                cell = self._cells[self.cell(coordinates)]
+                cell.discard(coordinates)
+                if not cell:
+                    del self._cells[self.cell(coordinates)]
+
+    def at(self, coordinates):
+        """
+        Return a dictionary of type (plural) to list of objects at
+        coordinates. The dictionary must not be modified.
+        """
+        return self._sectors.get(coordinates, {})
+
+    def contents(self, coordinates):
+        """
+        Return a list of everything at coordinates.
+        """
+        contents = []
+        for objects in self.at(coordinates).itervalues():
+            contents += objects
+        return contents
+
+    def in_box(self, low, high, name = None):
+        """
+        Yield (coordinates, object) for everything inside the box between
+        the low and high coordinates (inclusive).
+
+        If name is provided, only objects of that type (plural) are
+        returned.
+        """
+        low_cell = self.cell(low)
+        high_cell = self.cell(high)
+        for cx in xrange(low_cell[0], high_cell[0] + 1):
+            for cy in xrange(low_cell[1], high_cell[1] + 1):
+                for cz in xrange(low_cell[2], high_cell[2] + 1):
+                    for coordinates in self._cells.get((cx, cy, cz), ()):
+                        if (
+                            low.x <= coordinates.x <= high.x and
+                            low.y <= coordinates.y <= high.y and
+                            low.z <= coordinates.z <= high.z
+                        ):
+                            for obj in self._objects(coordinates, name):
+                                yield coordinates, obj
+
+    def within(self, coordinates, radius, name = None):
+        """
+        Yield (coordinates, object) for everything within radius moves of
+        coordinates.
+
+        Ships move one sector north, south, east or west at a time, so the
+        distance is the Manhattan distance.
+        """
+        low = Coordinates(coordinates.x - radius, coordinates.y - radius, coordinates.z - radius)
+        high = Coordinates(coordinates.x + radius, coordinates.y + radius, coordinates.z + radius)
+        for found, obj in self.in_box(low, high, name):
+            if self.distance(coordinates, found) <= radius:
+                yield found, obj
+
+    def distance(self, a, b):
+        return abs(a.x - b.x) + abs(a.y - b.y) + abs(a.z - b.z)
+
+    def _objects(self, coordinates, name):
+        if name:
+            return self._sectors[coordinates].get(name, [])
+        return self.contents(coordinates)
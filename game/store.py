@@ -0,0 +1,136 @@
+import cPickle as pickle
+import sqlite3
+from objects.coordinates import Coordinates
+
+class SqliteStore(object):
+    """
+    Shared objects stored in a sqlite file, one row per key.
+
+    Values are stored as pickles, so they load much faster than YAML and
+    can be read one sector at a time. Rows for sectors and their contents
+    are keyed by coordinates ("x,y,z"), users are keyed by name.
+
+    The ids table maps the id of every object that can be found by id to
+    the row it is stored in, so those objects can be found before their
+    sector has been loaded.
+    """
+    def __init__(self, filename, log = None, timeout = 5.0):
+        """
+        timeout is how many seconds to wait for another process that is
+        writing to the same file.
+        """
+        self.log = log
+        self.filename = filename
+        self.connection = sqlite3.connect(filename, timeout = timeout)
+        self.connection.text_factory = str
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS objects "
+            "(name TEXT, key TEXT, value BLOB, PRIMARY KEY (name, key))"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS objects_key ON objects (key)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS ids "
+            "(id TEXT PRIMARY KEY, name TEXT, key TEXT)"
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def encode_key(self, key):
+        if isinstance(key, Coordinates):
+            return "%d,%d,%d" % (key.x, key.y, key.z)
+        return str(key)
+
+    def decode_key(self, name, key):
+        if name == 'users':
+            return key
+        return Coordinates(*key.split(','))
+
+    def get(self, key):
+        """
+        Return a dictionary of shared object name to value for one key.
+        """
+        cursor = self.connection.execute(
+            "SELECT name, value FROM objects WHERE key = ?",
+            (self.encode_key(key),),
+        )
+        return dict((name, pickle.loads(str(value))) for name, value in cursor)
+
+    def get_many(self, keys):
+        """
+        Return a dictionary of key to get(key), for every key with
+        something stored.
+        """
+        found = {}
+        keys = [self.encode_key(key) for key in keys]
+        # sqlite limits the number of parameters in a query
+        for start in xrange(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            cursor = self.connection.execute(
+                "SELECT key, name, value FROM objects WHERE key IN (%s)" % ",".join("?" * len(chunk)),
+                chunk,
+            )
+            for key, name, value in cursor:
+                found.setdefault(key, {})[name] = pickle.loads(str(value))
+        return found
+
+    def load(self, name):
+        """
+        Return every key and value stored for a shared object.
+        """
+        cursor = self.connection.execute(
+            "SELECT key, value FROM objects WHERE name = ?",
+            (name,),
+        )
+        return dict((self.decode_key(name, key), pickle.loads(str(value))) for key, value in cursor)
+
+    def keys(self, name):
+        """
+        Return a list of the keys stored for a shared object.
+        """
+        cursor = self.connection.execute(
+            "SELECT key FROM objects WHERE name = ?",
+            (name,),
+        )
+        return [self.decode_key(name, key) for key, in cursor]
+
+    def find(self, id):
+        """
+        Return the (name, key) of the row holding the object with this id,
+        or None if it isn't stored.
+        """
+        row = self.connection.execute(
+            "SELECT name, key FROM ids WHERE id = ?",
+            (id,),
+        ).fetchone()
+        if row:
+            return row[0], self.decode_key(row[0], row[1])
+        return None
+
+    def put(self, records, ids = None):
+        """
+        Store a list of (name, key, value) records in one transaction.
+
+        ids is a list of (id, name, key) for the objects in the records
+        that can be found by id.
+        """
+        with self.connection:
+            for name, key, value in records:
+                if value is None:
+                    self.connection.execute(
+                        "DELETE FROM objects WHERE name = ? AND key = ?",
+                        (name, self.encode_key(key)),
+                    )
+                else:
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO objects (name, key, value) VALUES (?, ?, ?)",
+                        (name, self.encode_key(key), sqlite3.Binary(pickle.dumps(value, 2))),
+                    )
+            for id, name, key in ids or []:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO ids (id, name, key) VALUES (?, ?, ?)",
+                    (id, name, self.encode_key(key)),
+                )
@@ -0,0 +1,163 @@
+"""
+Ticks at a fixed rate that move the world on when nobody acts.
+
+Each tick restocks every port in memory at once (see
+Economy.restock()). The ports that changed in the active sectors, the
+ones with ships in them, are then saved and sent to the players there.
+Ports in other sectors are only saved when something else changes them,
+they are restocked again from their saved counts if they are loaded
+again.
+
+The new prices of every port that changed are then put in the market
+index (see market.py), and the changed ports in active sectors saved.
+Both are split into slices of about slice_seconds, each holding the
+world lock, with the connections served in between, so a tick never
+holds them up for longer than one slice (or the restock). Each saving
+slice stops early enough for its save to fit. A tick that is still
+running when the next one is due is an overrun: the ticks that were
+missed are skipped and counted in the metrics.
+
+When the world is split between shards (see shard.py), a ticker only
+saves and publishes the sectors its shard owns (see World.owns()). The
+owner of the others keeps them up to date.
+"""
+
+import time
+import gevent
+import numpy
+from game import Game
+
+class Ticker(object):
+    # Ports repriced between checks of the time
+    reprice_batch = 64
+
+    def __init__(self, world, rate = 1.0, slice_seconds = 0.005, metrics = None, publish = None, log = None):
+        self.world = world
+        self.game = Game(world = world, log = log)
+        self.period = 1.0 / rate
+        self.slice_seconds = slice_seconds
+        self.metrics = metrics
+        # Called with the coordinates and each port that changed
+        self.publish = publish
+        self.log = log
+        self.ticks = 0
+        self.greenlet = None
+        # Seconds save() takes per changed key, measured as ticks run.
+        # Until then, saving one key is assumed to take a whole slice.
+        self.save_cost = slice_seconds
+
+    def start(self):
+        """Run the ticks in the background."""
+        self.greenlet = gevent.spawn(self.run)
+        if self.log:
+            self.log.info("Ticking every %s seconds" % str(self.period))
+        return self.greenlet
+
+    def stop(self):
+        if self.greenlet:
+            self.greenlet.kill()
+            self.greenlet = None
+
+    def active_sectors(self):
+        """
+        Return the coordinates of the sectors with ships in them that this
+        shard owns.
+        """
+        return [
+            coordinates
+            for coordinates, ships in Game._ships.iteritems()
+            if ships and self.world.owns(coordinates)
+        ]
+
+    def run(self):
+        due = time.time()
+        while True:
+            gevent.sleep(max(0, due - time.time()))
+            start = time.time()
+            self.tick(start)
+            finished = time.time()
+            if self.metrics:
+                self.metrics.observe('tick_lag_seconds', start - due)
+                self.metrics.observe('tick_seconds', finished - start)
+                self.metrics.increment('ticks')
+            due += self.period
+            if finished > due:
+                skipped = int((finished - due) / self.period) + 1
+                due += skipped * self.period
+                if self.metrics:
+                    self.metrics.increment('tick_overruns')
+                    self.metrics.increment('ticks_skipped', skipped)
+                if self.log:
+                    self.log.warning("Tick %s took %.3f seconds, skipping %s ticks" % (str(self.ticks), finished - start, str(skipped)))
+
+    def tick(self, now):
+        """
+        Restock every port, then reprice the ones that changed and save
+        the ones in the active sectors, one slice at a time.
+        """
+        self.ticks += 1
+        with self.world.lock:
+            started = time.time()
+            rows = numpy.flatnonzero(Game._economy.restock(now))
+            # The lock is released between slices, when ports can be dropped
+            # from memory and their rows given to others. So the ports that
+            # changed are kept instead of their rows.
+            ports = [Game._economy.ports[row] for row in rows]
+            changed = set(ports)
+        if self.metrics:
+            self.metrics.observe('restock_seconds', time.time() - started)
+            self.metrics.increment('restocked_ports', len(rows))
+        index = 0
+        while index < len(rows):
+            with self.world.lock:
+                started = time.time()
+                deadline = started + self.slice_seconds
+                while index < len(rows) and time.time() < deadline:
+                    batch = slice(index, index + self.reprice_batch)
+                    Game._economy.reprice([
+                        row for row, port in zip(rows[batch], ports[batch])
+                        if Game._economy.ports[row] is port
+                    ])
+                    index += self.reprice_batch
+                finished = time.time()
+            if self.metrics:
+                self.metrics.observe('tick_slice_seconds', finished - started)
+            gevent.sleep(0.0001)
+        sectors = self.active_sectors()
+        index = 0
+        while index < len(sectors):
+            with self.world.lock:
+                started = time.time()
+                deadline = started + self.slice_seconds
+                # At least one sector per slice
+                index = self.save_sector(sectors, index, changed)
+                while index < len(sectors) and time.time() + len(Game._dirty) * self.save_cost < deadline:
+                    index = self.save_sector(sectors, index, changed)
+                keys = len(Game._dirty)
+                saving = time.time()
+                self.game.save()
+                finished = time.time()
+                if keys:
+                    self.save_cost = (finished - saving) / keys
+            if self.metrics:
+                self.metrics.observe('tick_slice_seconds', finished - started)
+            # Serve the connections before the next slice. This has to
+            # wait a little, sleep(0) only runs the greenlets that are
+            # ready without polling the sockets or timers.
+            gevent.sleep(0.0001)
+
+    def save_sector(self, sectors, index, changed):
+        """
+        Mark the ports in sectors[index] that changed (a set of ports) to
+        be saved, and return the index of the next sector. Sectors owned
+        by another shard are skipped.
+        """
+        coordinates = sectors[index]
+        if not self.world.owns(coordinates):
+            return index + 1
+        for port in Game._ports.get(coordinates) or []:
+            if port in changed:
+                self.game.mark_dirty(port, coordinates)
+                if self.publish:
+                    self.publish(coordinates, port)
+        return index + 1
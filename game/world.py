@@ -0,0 +1,93 @@
+import os
+import random
+import shutil
+import threading
+
+class World(object):
+    """
+    The game world shared by every session on a server.
+
+    A World is created once when the server starts. It sets up the data
+    directory, and the first Game created with it loads the shared objects.
+    Every other Game (one per connection) only holds its logged in user, so
+    opening a connection does not depend on the size of the world.
+
+    The shared objects are stored on the Game class, so there should only
+    be one World per process.
+
+    Sectors are generated from the world seed, which is chosen when the
+    data directory is created and kept in it.
+
+    Only one command changes the world at a time: the server holds lock
+    while it runs a command (and saves what it changed), so a command
+    never sees another one half done. Reading the state does not take the
+    lock. lock is a threading.RLock unless another lock is provided, like
+    a gevent lock for a server running commands in greenlets.
+
+    When the world is split between shards, shard is the number of this
+    one and shard_map the ShardMap saying which shard owns each sector.
+    Only the sectors this shard owns are loaded (see owns()).
+    """
+    seed_filename = 'seed'
+
+    def __init__(self, data_dir = 'data', log = None, bigbang = False, storage = 'yaml', seed = None, lock = None, shard = None, shard_map = None):
+        self.log = log
+        self.shard = shard
+        self.shard_map = shard_map
+        self.storage = storage
+        self.lock = lock or threading.RLock()
+        self.data_dir = data_dir
+
+        # If the data_dir is relative, then we need to find the absolute path for daemonizing
+        if not os.path.isabs(self.data_dir):
+            self.data_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)),data_dir)
+
+        if bigbang:
+            # Delete data directory if bigbang is True
+            self.log.warning("Performing big bang...")
+            if os.path.isdir(self.data_dir):
+                self.log.info("Deleting data directory '%s'..." % str(self.data_dir))
+                shutil.rmtree(self.data_dir)
+            self.log.info("Big Bang complete")
+
+        self.log.debug("Verifying data directory exists (%s)..." % str(self.data_dir))
+        if not os.path.isdir(self.data_dir):
+            self.log.debug("Data directory does not exist, creating it...")
+            os.makedirs(self.data_dir)
+
+        self.seed = self.load_seed(seed)
+
+        # Set by the first Game to load the shared objects
+        self.loaded = False
+
+    def owns(self, coordinates):
+        """
+        Return True if the sector at coordinates is this shard's to load,
+        which every sector is when the world is not split.
+        """
+        return self.shard_map is None or self.shard_map.owner(coordinates) == self.shard
+
+    def load_seed(self, seed = None):
+        """
+        Return the seed of the world in the data directory.
+
+        A new world is given seed, or a random seed if it is not provided.
+        """
+        filename = os.path.join(self.data_dir, self.seed_filename)
+        if os.path.isfile(filename):
+            with open(filename) as infile:
+                saved_seed = int(infile.read())
+            if seed is not None and seed != saved_seed:
+                self.log.warning("Ignoring seed %s, the world in %s was created with seed %s" % (
+                    str(seed),
+                    str(self.data_dir),
+                    str(saved_seed),
+                ))
+            return saved_seed
+
+        if seed is None:
+            seed = random.randint(0, 0xffffffff)
+        self.log.info("Creating world with seed %s" % str(seed))
+        with open(filename, 'w') as outfile:
+            outfile.write(str(seed))
+        return seed